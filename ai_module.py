@@ -1,61 +1,247 @@
+import hashlib
+import importlib
+import logging
+import os
+import threading
+
 from flask import Blueprint, request, jsonify
-import pandas as pd
-from prophet import Prophet
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score
-import xgboost as xgb
-import numpy as np
+
+import serializacion
+from db import PoolAgotado, conexion
+from prediction_jobs import ColaLlena, gestor_trabajos, llamar
+from tendencias import MOTORES, TENDENCIA_MOTOR
 
 ai_bp = Blueprint('ai', __name__)
 
+# ——— Carga diferida de los modelos ———
+# pandas, Prophet, scikit-learn y XGBoost viven en prediccion.py y se importan
+# en la primera petición de predicción: un worker que sólo sirve la API arranca
+# en una fracción de segundo y sin esos cientos de MB. Con PREDICT_PRECARGA=1
+# se importan en segundo plano al registrar el blueprint, para que la primera
+# predicción no pague la importación sin retrasar el arranque.
+PREDICT_PRECARGA = os.getenv('PREDICT_PRECARGA', '0') == '1'
+
+# Máximo de ids en un POST /predict/batch (un equipo o disciplina no tiene límite)
+PREDICT_BATCH_MAX_IDS = int(os.getenv('PREDICT_BATCH_MAX_IDS', '500'))
+
+AMBITOS = ('atleta', 'disciplina')
+COLUMNAS_TENDENCIA = ['ds', 'yhat']
+
+
+def modelos():
+    """Módulo `prediccion`, importado en el primer uso (el lock de importación lo hace seguro entre hilos)."""
+    return importlib.import_module('prediccion')
+
+
+def _precargar():
+    try:
+        modelos()
+        logging.info("Modelos de predicción precargados")
+    except Exception:
+        logging.exception("Error precargando los modelos de predicción")
+
+
+@ai_bp.record_once
+def _al_registrar(_estado):
+    if PREDICT_PRECARGA:
+        threading.Thread(target=_precargar, name='precarga-modelos', daemon=True).start()
+
+
+def leer_motor(data):
+    """Motor de tendencia de la petición (`motor` en el JSON o en la query); None si no es válido."""
+    motor = (data or {}).get('motor') or request.args.get('motor') or TENDENCIA_MOTOR
+    return motor if motor in MOTORES else None
+
+
+def motor_invalido():
+    return jsonify({"error": f"motor debe ser uno de: {', '.join(MOTORES)}"}), 400
+
+
+def leer_formato(data):
+    """`format` de la petición (JSON o query): 'records' o 'columns'; None si no es válido."""
+    formato = (data or {}).get('format') or request.args.get('format') or 'records'
+    return formato if formato in serializacion.FORMATOS else None
+
+
+def formato_invalido():
+    return jsonify({"error": f"format debe ser uno de: {', '.join(serializacion.FORMATOS)}"}), 400
+
+
+def responder(resultado, formato):
+    """jsonify del resultado o, con format=columns, con cada `tendencia` en
+    columnas {"columnas": ["ds", "yhat"], "filas": [...]} y las fechas en ISO 8601."""
+    if formato != 'columns':
+        return jsonify(resultado)
+    for r in resultado.get("atletas", [resultado]):
+        if "tendencia" in r:
+            r["tendencia"] = serializacion.en_columnas(r["tendencia"], COLUMNAS_TENDENCIA)
+    return serializacion.respuesta_iso(resultado)
+
+
+def entero(valor):
+    """`valor` del JSON como entero (también "12"); ValueError con bool, decimales u otros tipos."""
+    if isinstance(valor, bool) or not isinstance(valor, (int, str)):
+        raise ValueError(f"{valor!r} no es un entero")
+    return int(valor)
+
+
+def error_prediccion(e):
+    """Respuesta del `except Exception` de las rutas de predicción: 503 si el pool de la DB está agotado."""
+    if isinstance(e, PoolAgotado):
+        return jsonify({"error": "Servidor ocupado, reintente en unos segundos"}), 503, {"Retry-After": "1"}
+    return jsonify({"error": str(e)}), 500
+
+
+def leer_ambito(data):
+    """`ambito` de /predict/<id>: 'atleta' (modelos propios) o 'disciplina' (compartidos); None si no es válido."""
+    ambito = (data or {}).get('ambito') or request.args.get('ambito') or 'atleta'
+    return ambito if ambito in AMBITOS else None
+
+
+def resolver_atletas(ids=None, equipo=None, disciplina=None):
+    """Ids de `atletas` que cumplen los filtros indicados."""
+    with conexion() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT id_atleta FROM atletas
+                WHERE (%(ids)s::int[] IS NULL OR id_atleta = ANY(%(ids)s::int[]))
+                  AND (%(equipo)s::text IS NULL OR equipo = %(equipo)s)
+                  AND (%(disciplina)s::text IS NULL OR disciplina = %(disciplina)s)
+                ORDER BY id_atleta
+            """, {"ids": ids, "equipo": equipo, "disciplina": disciplina})
+            return [r[0] for r in cur.fetchall()]
+
+
 @ai_bp.route('/predict', methods=['POST'])
 def predict():
     try:
         data = request.get_json()
-        df = pd.DataFrame(data['training_data'])
-
-        # 1️⃣ Tendencia (Prophet)
-        trend_df = df[['fecha', 'carga']].rename(columns={'fecha': 'ds', 'carga': 'y'})
-        model = Prophet()
-        model.fit(trend_df)
-        future = model.make_future_dataframe(periods=7)
-        forecast = model.predict(future)
-
-        # 2️⃣ Fatiga (Random Forest)
-        X = df[['carga', 'hrv', 'suenio_horas']]
-        y = df['fatiga']
-        rf = RandomForestClassifier(n_estimators=50, random_state=42)
-        rf.fit(X, y)
-        last_input = np.array([[df['carga'].iloc[-1], df['hrv'].iloc[-1], df['suenio_horas'].iloc[-1]]])
-        fatiga_pred = int(rf.predict(last_input)[0])
-
-        # 3️⃣ Lesión (XGBoost)
-        if 'lesion' in df.columns and df['lesion'].nunique() > 1:
-            Xl = df[['carga', 'hrv', 'suenio_horas', 'fatiga']]
-            yl = df['lesion']
-            X_train, X_test, y_train, y_test = train_test_split(Xl, yl, test_size=0.2, random_state=42)
-            xgb_model = xgb.XGBClassifier(
-                n_estimators=200,
-                learning_rate=0.05,
-                max_depth=4,
-                random_state=42,
-                use_label_encoder=False,
-                eval_metric="logloss"
-            )
-            xgb_model.fit(X_train, y_train)
-            lesion_pred = int(xgb_model.predict(last_input)[0])
-            lesion_acc = accuracy_score(y_test, xgb_model.predict(X_test))
-        else:
-            lesion_pred = 0
-            lesion_acc = None
-
-        return jsonify({
-            "tendencia": forecast[['ds', 'yhat']].tail(7).to_dict(orient="records"),
-            "riesgo_fatiga": fatiga_pred,
-            "riesgo_lesion": lesion_pred,
-            "exactitud_xgb": lesion_acc
-        })
+        motor = leer_motor(data)
+        if motor is None:
+            return motor_invalido()
+        formato = leer_formato(data)
+        if formato is None:
+            return formato_invalido()
+        return responder(modelos().predecir(data['training_data'], data.get('id_atleta'), motor), formato)
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+@ai_bp.route('/predict/<int:id_atleta>', methods=['GET', 'POST'])
+def predict_atleta(id_atleta):
+    data = request.get_json(silent=True)
+    motor = leer_motor(data)
+    if motor is None:
+        return motor_invalido()
+    ambito = leer_ambito(data)
+    if ambito is None:
+        return jsonify({"error": f"ambito debe ser uno de: {', '.join(AMBITOS)}"}), 400
+    formato = leer_formato(data)
+    if formato is None:
+        return formato_invalido()
+    try:
+        prediccion = modelos()
+        if ambito == 'disciplina':
+            resultado = prediccion.predecir_disciplina(id_atleta, motor)
+            if resultado is None:
+                return jsonify({"error": "Datos insuficientes para predecir"}), 422
+            return responder(resultado, formato)
+        training_data = prediccion.historial_atleta(id_atleta)
+        if len(training_data) < 2:
+            return jsonify({"error": "Datos insuficientes para predecir"}), 422
+        return responder(prediccion.predecir(training_data, id_atleta, motor, 'historial'), formato)
+
+    except Exception as e:
+        return error_prediccion(e)
+
+
+@ai_bp.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    data = request.get_json() or {}
+    ids = data.get('ids')
+    equipo = data.get('equipo')
+    disciplina = data.get('disciplina')
+    if not ids and not equipo and not disciplina:
+        return jsonify({"error": "ids, equipo o disciplina es obligatorio"}), 400
+    if ids:
+        if not isinstance(ids, list):
+            return jsonify({"error": "ids debe ser una lista de enteros"}), 400
+        if len(ids) > PREDICT_BATCH_MAX_IDS:
+            return jsonify({"error": f"ids admite como máximo {PREDICT_BATCH_MAX_IDS} atletas"}), 400
+        try:
+            ids = [entero(i) for i in ids]
+        except ValueError:
+            return jsonify({"error": "ids debe ser una lista de enteros"}), 400
+    motor = leer_motor(data)
+    if motor is None:
+        return motor_invalido()
+    formato = leer_formato(data)
+    if formato is None:
+        return formato_invalido()
+
+    try:
+        prediccion = modelos()
+        ids = resolver_atletas(ids or None, equipo, disciplina)
+        df = prediccion.con_historial_suficiente(prediccion.cargar_historial(ids))
+        validos = sorted(int(i) for i in df['id_atleta'].unique())
+        sin_datos = sorted(set(ids) - set(validos))
+        if not validos:
+            return jsonify({"atletas": [], "sin_datos": sin_datos, "exactitud_xgb": None}), 200
+
+        # Los clasificadores se amplían entre peticiones con la misma clave: una
+        # disciplina sola comparte los de /predict/<id>?ambito=disciplina
+        if disciplina and not ids and not equipo:
+            clave = f"disciplina:{disciplina}"
+        else:
+            clave = "lote:" + hashlib.sha1(",".join(map(str, validos)).encode()).hexdigest()[:16]
+        resultado = prediccion.predecir_lote(df, motor, clave)
+        resultado["sin_datos"] = sin_datos
+        return responder(resultado, formato)
+
+    except Exception as e:
+        return error_prediccion(e)
+
+
+# ——— Trabajos asíncronos ———
+@ai_bp.route('/predict/jobs', methods=['POST'])
+def enviar_prediccion():
+    data = request.get_json() or {}
+    motor = leer_motor(data)
+    if motor is None:
+        return motor_invalido()
+    id_atleta = data.get('id_atleta')
+    if id_atleta is not None:
+        try:
+            id_atleta = entero(id_atleta)
+        except ValueError:
+            return jsonify({"error": "id_atleta debe ser un entero"}), 400
+    if 'training_data' in data:
+        training_data = data['training_data']
+        origen = 'cliente'
+    elif id_atleta is not None:
+        # El histórico se arma aquí (una consulta) y sólo el ajuste va al pool
+        try:
+            training_data = modelos().historial_atleta(id_atleta)
+        except Exception as e:
+            return error_prediccion(e)
+        if len(training_data) < 2:
+            return jsonify({"error": "Datos insuficientes para predecir"}), 422
+        origen = 'historial'
+    else:
+        return jsonify({"error": "training_data o id_atleta es obligatorio"}), 400
+
+    try:
+        # Por nombre: con training_data el proceso web no llega a importar los modelos
+        job_id = gestor_trabajos.enviar(llamar, 'prediccion:predecir', training_data, id_atleta, motor, origen)
+    except ColaLlena:
+        return jsonify({"error": "Demasiadas predicciones en curso, reintente más tarde"}), 503, {"Retry-After": "5"}
+    return jsonify({"job_id": job_id, "estado": "en_cola"}), 202
+
+
+@ai_bp.route('/predict/jobs/<job_id>', methods=['GET'])
+def estado_prediccion(job_id):
+    estado = gestor_trabajos.estado(job_id)
+    if estado is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    return jsonify(estado), 200
@@ -1,167 +1,160 @@
-from flask import Flask, request, jsonify
+import click
+from flask import Flask, g, request, jsonify
 from flask_cors import CORS
-import psycopg2
-from psycopg2 import pool
-import os
+from psycopg2 import errors as pg_errors
 from datetime import datetime
 import logging
-import json
+import sys
+import time
+
+from db import DATABASE_URL, PoolAgotado, conexion, estadisticas_pool, get_db, release_db
+import busqueda
+import carga_entrenamiento
+import escritura_diferida
+import exportacion
+import hrv_baseline
+import hrv_store
+import historial
+import lotes
+import metricas
+import migrations
+import panel_equipo
+import particiones
+import response_cache
+import resumenes
+import serializacion
+from response_cache import cacheado
+from ai_module import ai_bp
 
 # ——— Configuración básica ———
 logging.basicConfig(level=logging.INFO)
 app = Flask(__name__)
+serializacion.instalar(app)
 CORS(app)
+app.register_blueprint(ai_bp)
 
-DATABASE_URL = os.getenv('DATABASE_URL')
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL no configurada")
 
-# ——— Pool de conexiones ———
-try:
-    db_pool = psycopg2.pool.SimpleConnectionPool(
-        1, 20,  # min 1, max 20 conexiones
-        dsn=DATABASE_URL
-    )
-    logging.info("Pool de conexiones a la DB creado correctamente")
-except Exception:
-    logging.exception("Error creando pool de conexiones")
-    raise
-
-def get_db():
+def ocupado():
+    return jsonify({"error": "Servidor ocupado, reintente en unos segundos"}), 503, {"Retry-After": "1"}
+
+def error_interno(contexto, mensaje):
+    """Respuesta del `except Exception` de una ruta: 503 si el pool está agotado, si no 500."""
+    if isinstance(sys.exc_info()[1], PoolAgotado):
+        return ocupado()
+    logging.exception(contexto)
+    return jsonify({"error": mensaje}), 500
+
+def escribir_diferido(tipo, fila, cuerpo):
+    """Con ESCRITURA_DIFERIDA=1: encola el registro y responde 202 (ack en
+    memoria) o, con ack durable, 200 cuando su lote hizo commit. Los errores
+    del registro (p. ej. ForeignKeyViolation) se relanzan como en la escritura
+    directa; el escritor ya invalida la caché del atleta."""
     try:
-        return db_pool.getconn()
-    except Exception:
-        logging.exception("Error obteniendo conexión de pool")
-        raise
-
-def release_db(conn):
-    if conn:
-        db_pool.putconn(conn)
-
-# ——— Creación / migración de tablas ———
+        futuro = escritura_diferida.escritor.encolar(tipo, fila)
+    except escritura_diferida.ColaLlena:
+        return ocupado()
+    if escritura_diferida.ESCRITURA_ACK == 'memoria':
+        return jsonify(cuerpo), 202
+    try:
+        futuro.result(timeout=escritura_diferida.ESCRITURA_TIMEOUT)
+    except TimeoutError:
+        return ocupado()
+    return jsonify(cuerpo), 200
+
+# ——— Métricas por petición ———
+# Se etiqueta con la regla de la ruta (/hrv/<int:id_atleta>), no con la URL, para
+# que cada atleta no cree una serie. En las respuestas en streaming se mide
+# hasta que la vista devuelve la respuesta, no hasta el último byte.
+@app.before_request
+def iniciar_medicion():
+    g.inicio_peticion = time.perf_counter()
+
+@app.after_request
+def registrar_medicion(respuesta):
+    inicio = g.pop('inicio_peticion', None)
+    if inicio is not None:
+        ruta = request.url_rule.rule if request.url_rule else 'sin_ruta'
+        metricas.PETICIONES.observar(time.perf_counter() - inicio, ruta, request.method, str(respuesta.status_code))
+    return respuesta
+
+# ——— Comandos ———
+# El esquema se crea/migra con `flask --app app init-db` (o `python migrations.py`)
+# antes de arrancar gunicorn, no al importar la app en cada worker.
+@app.cli.command('init-db')
 def init_db():
-    conn = get_db()
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS atletas (
-                    id_atleta SERIAL PRIMARY KEY,
-                    nombre TEXT NOT NULL,
-                    fecha_nacimiento DATE,
-                    disciplina TEXT,
-                    sexo TEXT,
-                    direccion TEXT,
-                    correo TEXT,
-                    telefono TEXT,
-                    genero TEXT,
-                    nacionalidad TEXT,
-                    condicion_fisica TEXT,
-                    nivel_competitivo TEXT,
-                    categoria_edad TEXT,
-                    equipo TEXT,
-                    fecha_ingreso DATE DEFAULT CURRENT_DATE,
-                    lugar_nacimiento TEXT
-                );
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS psicologia (
-                    id SERIAL PRIMARY KEY,
-                    atleta_id INTEGER NOT NULL,
-                    estado_emocional TEXT,
-                    motivacion TEXT,
-                    estres INTEGER,
-                    observaciones TEXT
-                );
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS nutricion (
-                    id SERIAL PRIMARY KEY,
-                    id_atleta INTEGER NOT NULL,
-                    fecha DATE NOT NULL,
-                    peso REAL,
-                    altura REAL,
-                    imc REAL,
-                    observaciones TEXT,
-                    UNIQUE (id_atleta, fecha)
-                );
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS medico (
-                    id SERIAL PRIMARY KEY,
-                    atleta_id INTEGER NOT NULL,
-                    fecha DATE NOT NULL,
-                    temperatura REAL,
-                    presion_arterial TEXT,
-                    diagnostico TEXT,
-                    tratamiento TEXT,
-                    observaciones TEXT
-                );
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS entrenamiento (
-                    id SERIAL PRIMARY KEY,
-                    id_atleta INTEGER NOT NULL,
-                    tipo_entrenamiento TEXT,
-                    duracion INTEGER,
-                    intensidad TEXT,
-                    observaciones TEXT
-                );
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS evento (
-                    id SERIAL PRIMARY KEY,
-                    id_atleta INTEGER,
-                    nombre TEXT,
-                    fecha DATE,
-                    lugar TEXT,
-                    descripcion TEXT
-                );
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS autoseguimiento (
-                    id SERIAL PRIMARY KEY,
-                    atleta_id INTEGER NOT NULL,
-                    fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    calidad_sueno INTEGER,
-                    horas_sueno REAL,
-                    fatiga INTEGER,
-                    dolor_muscular INTEGER,
-                    estres INTEGER,
-                    estado_animo INTEGER,
-                    comentarios TEXT
-                );
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS Consentimientos_Tutores (
-                    id SERIAL PRIMARY KEY,
-                    nombre_menor TEXT NOT NULL,
-                    edad_menor INTEGER NOT NULL,
-                    nombre_tutor TEXT NOT NULL,
-                    relacion_tutor TEXT,
-                    contacto_tutor TEXT NOT NULL,
-                    aceptado BOOLEAN DEFAULT TRUE,
-                    fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS hrv (
-                    id SERIAL PRIMARY KEY,
-                    id_atleta INTEGER NOT NULL,
-                    fecha DATE NOT NULL,
-                    hrv REAL
-                );
-            """)
+    """Aplica las migraciones de esquema pendientes."""
+    with conexion() as conn:
+        migrations.aplicar(conn)
+    logging.info("Base de datos inicializada correctamente")
+
+@app.cli.command('recalcular-hrv')
+def recalcular_hrv():
+    """Recalcula rMSSD, SDNN, pNN50, etc. de toda la tabla hrv desde los intervalos RR."""
+    with conexion() as conn:
+        actualizadas = hrv_store.recalcular_metricas(conn)
+    logging.info("Métricas HRV recalculadas en %s filas", actualizadas)
+
+@app.cli.command('mantener-particiones')
+def mantener_particiones():
+    """Crea las particiones mensuales de los próximos meses y vacía la partición por defecto."""
+    with conexion() as conn:
+        with conn.cursor() as cur:
+            creadas = particiones.mantener(cur)
         conn.commit()
-    finally:
-        release_db(conn)
-
-# Ejecutar tablas al iniciar
-with app.app_context():
-    try:
-        init_db()
-        logging.info("Base de datos inicializada correctamente")
-    except Exception:
-        logging.exception("Error inicializando base de datos")
+    for tabla, nuevas in creadas.items():
+        logging.info("Particiones de %s creadas: %s", tabla, ', '.join(f"{m:%Y-%m}" for m in nuevas))
+
+@app.cli.command('exportar')
+@click.argument('directorio', type=click.Path(file_okay=False))
+@click.option('--formato', type=click.Choice(exportacion.FORMATOS_EXPORTACION), default='parquet')
+@click.option('--tabla', 'tablas', multiple=True, type=click.Choice(list(exportacion.TABLAS_EXPORTACION)),
+              help="Tabla a exportar (repetible); por defecto todas.")
+@click.option('--atleta', 'atletas', multiple=True, type=int, help="id_atleta (repetible); por defecto todos.")
+@click.option('--equipo', default=None)
+@click.option('--desde', type=click.DateTime(['%Y-%m-%d']), default=None)
+@click.option('--hasta', type=click.DateTime(['%Y-%m-%d']), default=None)
+def exportar(directorio, formato, tablas, atletas, equipo, desde, hasta):
+    """Exporta el registro de los atletas a DIRECTORIO, un fichero por tabla (ver exportacion.py)."""
+    if not exportacion.formato_disponible(formato):
+        raise click.ClickException(f"El formato {formato} necesita pyarrow")
+    filtros = {"atletas": list(atletas) or None, "equipo": equipo,
+               "desde": desde.date() if desde else None, "hasta": hasta.date() if hasta else None}
+    with conexion() as conn:
+        exportacion.exportar_directorio(conn, directorio, formato, tablas or list(exportacion.TABLAS_EXPORTACION),
+                                        filtros)
+
+if particiones.PARTICIONES_AUTO:
+    particiones.programar()
+
+# ——— SQL compartido con asgi.py ———
+SQL_LISTAR_ATLETAS = """
+    SELECT id_atleta, nombre, COALESCE(disciplina, 'No especificado') FROM atletas ORDER BY nombre
+"""
+COLUMNAS_ATLETA = ['id', 'nombre', 'disciplina']
+SQL_ATLETA = "SELECT * FROM atletas WHERE id_atleta = %s"
+SQL_INSERTAR_AUTOSEGUIMIENTO = """
+    INSERT INTO autoseguimiento
+    (id_atleta, calidad_sueno, horas_sueno, fatiga, dolor_muscular, estres, estado_animo, comentarios)
+    VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
+    RETURNING fecha_registro
+"""
+SQL_INSERTAR_RPE = """
+    INSERT INTO rpe
+    (id_atleta, fecha, rpe, notas)
+    VALUES (%s, CURRENT_DATE, %s, %s)
+    RETURNING fecha
+"""
+
+def insertar_autoseguimiento(cur, fila):
+    cur.execute(SQL_INSERTAR_AUTOSEGUIMIENTO, fila)
+    resumenes.registrar(cur, 'autoseguimiento', fila[0], [cur.fetchone()[0]])
+
+escritura_diferida.registrar('autoseguimiento', insertar_autoseguimiento)
+
+def fila_atleta(a):
+    return dict(zip(COLUMNAS_ATLETA, a))
 
 # ——— RUTAS ———
 
@@ -169,21 +162,68 @@ with app.app_context():
 def home():
     return jsonify({"estado": "API corriendo"}), 200
 
+# ——— Estado del pool de conexiones ———
+@app.route('/db/pool', methods=['GET'])
+def estado_pool():
+    return jsonify(estadisticas_pool()), 200
+
+# ——— Métricas (formato de exposición Prometheus) ———
+CONTADORES_POOL = ('checkouts', 'esperas', 'timeouts', 'creadas', 'descartadas')
+
+@app.route('/metrics', methods=['GET'])
+def exportar_metricas():
+    extra = []
+    for clave, valor in sorted(estadisticas_pool().items()):
+        if clave in CONTADORES_POOL:
+            extra.append((f"db_pool_{clave}_total", "counter", f"Pool de conexiones: {clave}", valor))
+        elif clave in ('en_uso', 'libres', 'total', 'maximo', 'esperando'):
+            extra.append((f"db_pool_{clave}", "gauge", f"Pool de conexiones: {clave}", valor))
+    for clave, valor in sorted(escritura_diferida.escritor.estadisticas().items()):
+        if clave == 'pendientes':
+            extra.append(("escritura_diferida_pendientes", "gauge", "Registros en cola de escritura", valor))
+        else:
+            extra.append((f"escritura_diferida_{clave}_total", "counter", f"Escritura diferida: {clave}", valor))
+    return app.response_class(metricas.exportar(extra), 200, content_type=metricas.CONTENT_TYPE)
+
 # ——— Listar atletas ———
+# `?format=columns`: {"columnas": [...], "filas": [...]} (ver serializacion.py)
 @app.route('/atletas', methods=['GET'])
+@cacheado(clave=lambda: f"todos:{request.args.get('format', '')}", etiquetas=lambda: ['atletas'])
 def listar_atletas():
-    conn = get_db()
     try:
-        with conn.cursor() as c:
-            c.execute("SELECT id_atleta, nombre, disciplina FROM atletas ORDER BY nombre")
-            atletas = c.fetchall()
-            resultado = [{"id": a[0], "nombre": a[1], "disciplina": a[2] or "No especificado"} for a in atletas]
-        return jsonify(resultado), 200
+        formato = serializacion.leer_formato(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        with conexion() as conn:
+            with conn.cursor() as c:
+                c.execute(SQL_LISTAR_ATLETAS)
+                filas = c.fetchall()
+            if formato == 'columns':
+                return serializacion.respuesta_columnas(COLUMNAS_ATLETA, filas), 200
+            return jsonify([fila_atleta(a) for a in filas]), 200
     except Exception:
-        logging.exception("Error en /atletas")
-        return jsonify({"error": "Error al listar atletas"}), 500
-    finally:
-        release_db(conn)
+        return error_interno("Error en /atletas", "Error al listar atletas")
+
+# ——— Buscar atletas ———
+# Autocompletado: ?q=texto&limite=&cursor=, sin acentos ni mayúsculas sobre
+# nombre, equipo y disciplina (ver busqueda.py). `nivel` dice por qué coincide.
+@app.route('/atletas/buscar', methods=['GET'])
+def buscar_atletas():
+    try:
+        params = busqueda.leer_parametros(request.args)
+        formato = serializacion.leer_formato(request.args)
+    except ValueError:
+        return jsonify({"error": "Parámetros inválidos"}), 400
+    try:
+        with conexion() as conn:
+            with conn.cursor() as cur:
+                filas, siguiente = busqueda.buscar(cur, params)
+        if formato == 'columns':
+            return serializacion.respuesta_columnas(busqueda.COLUMNAS_BUSQUEDA, filas, siguiente=siguiente), 200
+        return jsonify({"datos": [busqueda.fila_busqueda(f) for f in filas], "siguiente": siguiente}), 200
+    except Exception:
+        return error_interno("Error en /atletas/buscar", "Error al buscar atletas")
 
 # ——— Crear atleta ———
 @app.route('/crear_atleta', methods=['POST'])
@@ -194,64 +234,77 @@ def crear_atleta():
         if campo not in data:
             return jsonify({"error": f"Campo '{campo}' es obligatorio"}), 400
 
-    conn = get_db()
     try:
-        with conn.cursor() as c:
-            c.execute("""
-                INSERT INTO atletas (nombre, fecha_nacimiento, disciplina, sexo)
-                VALUES (%s, %s, %s, %s)
-                RETURNING id_atleta;
-            """, (data['nombre'], data['fecha_nacimiento'], data['disciplina'], data['sexo']))
-            nuevo_id = c.fetchone()[0]
-        conn.commit()
-        return jsonify({"mensaje": "Atleta creado exitosamente", "id_atleta": nuevo_id}), 200
+        with conexion() as conn:
+            with conn.cursor() as c:
+                c.execute("""
+                    INSERT INTO atletas (nombre, fecha_nacimiento, disciplina, sexo)
+                    VALUES (%s, %s, %s, %s)
+                    RETURNING id_atleta;
+                """, (data['nombre'], data['fecha_nacimiento'], data['disciplina'], data['sexo']))
+                nuevo_id = c.fetchone()[0]
+            conn.commit()
+            response_cache.invalidar("atletas")
+            return jsonify({"mensaje": "Atleta creado exitosamente", "id_atleta": nuevo_id}), 200
+    except pg_errors.UniqueViolation:
+        return jsonify({"error": "Ya existe un atleta con ese nombre"}), 409
     except Exception:
-        logging.exception("Error en /crear_atleta")
-        return jsonify({"error": "Error al crear atleta"}), 500
-    finally:
-        release_db(conn)
+        return error_interno("Error en /crear_atleta", "Error al crear atleta")
 
 # ——— Obtener atleta por ID ———
 @app.route('/atletas/<int:id_atleta>', methods=['GET'])
+@cacheado(clave=lambda id_atleta: id_atleta, etiquetas=lambda id_atleta: ['atletas', f'atleta:{id_atleta}'])
 def obtener_atleta(id_atleta):
-    conn = get_db()
     try:
-        with conn.cursor() as c:
-            c.execute("SELECT * FROM atletas WHERE id_atleta = %s", (id_atleta,))
-            atleta = c.fetchone()
-            if not atleta:
-                return jsonify({"error": "Atleta no encontrado"}), 404
-            columnas = [desc[0] for desc in c.description]
-            atleta_dict = dict(zip(columnas, atleta))
-        return jsonify(atleta_dict), 200
+        with conexion() as conn:
+            with conn.cursor() as c:
+                c.execute(SQL_ATLETA, (id_atleta,))
+                atleta = c.fetchone()
+                if not atleta:
+                    return jsonify({"error": "Atleta no encontrado"}), 404
+                columnas = [desc[0] for desc in c.description]
+                atleta_dict = dict(zip(columnas, atleta))
+            return jsonify(atleta_dict), 200
     except Exception:
-        logging.exception("Error en /atletas/<id>")
-        return jsonify({"error": "Error al obtener atleta"}), 500
-    finally:
-        release_db(conn)
+        return error_interno("Error en /atletas/<id>", "Error al obtener atleta")
+
+# ——— Panel de equipo ———
+# Último estado de HRV, RPE, bienestar, carga y asuntos médicos de todo el
+# equipo en una petición; caché corta porque lo cambian escrituras de cualquier atleta.
+@app.route('/equipo/<equipo>/snapshot', methods=['GET'])
+@cacheado(clave=lambda equipo: equipo, etiquetas=lambda equipo: ['atletas'], ttl=panel_equipo.SNAPSHOT_TTL)
+def snapshot_equipo(equipo):
+    try:
+        with conexion() as conn:
+            with conn.cursor() as cur:
+                atletas = panel_equipo.snapshot(cur, equipo)
+            if not atletas:
+                return jsonify({"error": "Equipo no encontrado"}), 404
+            return jsonify({"equipo": equipo, "atletas": atletas}), 200
+    except Exception:
+        return error_interno("Error en /equipo/<equipo>/snapshot", "Error interno")
 
 # ——— Get atleta por nombre ———
+# Nombre exacto; para buscar por parte del nombre, /atletas/buscar.
 @app.route("/get_atleta", methods=["POST"])
+@cacheado(clave=lambda: (request.get_json(silent=True) or {}).get('nombre'), etiquetas=lambda: ['atletas'])
 def get_atleta():
     data = request.get_json() or {}
     nombre = data.get("nombre")
     if not nombre:
         return jsonify({"error": "Nombre es obligatorio"}), 400
 
-    conn = get_db()
     try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id_atleta FROM atletas WHERE nombre = %s", (nombre,))
-            result = cur.fetchone()
-        if result:
-            return jsonify({"id_atleta": result[0]}), 200
-        else:
-            return jsonify({"error": "Atleta no encontrado"}), 404
+        with conexion() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT id_atleta FROM atletas WHERE nombre = %s", (nombre,))
+                result = cur.fetchone()
+            if result:
+                return jsonify({"id_atleta": result[0]}), 200
+            else:
+                return jsonify({"error": "Atleta no encontrado"}), 404
     except Exception:
-        logging.exception("Error en /get_atleta")
-        return jsonify({"error": "Error en servidor"}), 500
-    finally:
-        release_db(conn)
+        return error_interno("Error en /get_atleta", "Error en servidor")
 
 # ——— Psicología ———
 @app.route('/psicologia', methods=['POST'])
@@ -262,20 +315,20 @@ def psicologia():
             return jsonify({"error": f"{k} es obligatorio"}), 400
     observaciones = data.get('observaciones', '')
 
-    conn = get_db()
     try:
-        with conn.cursor() as c:
-            c.execute("""
-                INSERT INTO psicologia (atleta_id, estado_emocional, motivacion, estres, observaciones)
-                VALUES (%s, %s, %s, %s, %s);
-            """, (int(data['atleta_id']), data['estado_emocional'], data['motivacion'], int(data['estres']), observaciones))
-        conn.commit()
-        return jsonify({"mensaje":"Psicología registrada"}), 200
+        with conexion() as conn:
+            with conn.cursor() as c:
+                c.execute("""
+                    INSERT INTO psicologia (atleta_id, estado_emocional, motivacion, estres, observaciones)
+                    VALUES (%s, %s, %s, %s, %s);
+                """, (int(data['atleta_id']), data['estado_emocional'], data['motivacion'], int(data['estres']), observaciones))
+            conn.commit()
+            response_cache.invalidar(f"atleta:{int(data['atleta_id'])}")
+            return jsonify({"mensaje":"Psicología registrada"}), 200
+    except pg_errors.ForeignKeyViolation:
+        return jsonify({"error": "Atleta no encontrado"}), 404
     except Exception:
-        logging.exception("Error en /psicologia")
-        return jsonify({"error":"Error interno"}), 500
-    finally:
-        release_db(conn)
+        return error_interno("Error en /psicologia", "Error interno")
 
 # ——— Nutrición ———
 @app.route('/nutricion', methods=['POST'])
@@ -285,26 +338,26 @@ def nutricion():
         if k not in data:
             return jsonify({"error": f"{k} es obligatorio"}), 400
 
-    conn = get_db()
-    try:
-        with conn.cursor() as c:
-            c.execute("""
-                INSERT INTO nutricion (id_atleta, fecha, peso, altura, imc, observaciones)
-                VALUES (%s,%s,%s,%s,%s,%s)
-                ON CONFLICT (id_atleta, fecha) DO UPDATE SET
-                  peso = EXCLUDED.peso,
-                  altura = EXCLUDED.altura,
-                  imc = EXCLUDED.imc,
-                  observaciones = EXCLUDED.observaciones;
-            """, (int(data['id_atleta']), datetime.strptime(data['fecha'],'%Y-%m-%d').date(),
-                  float(data['peso']), float(data['altura']), float(data['imc']), data['observaciones']))
-        conn.commit()
-        return jsonify({"mensaje":"Nutrición registrada"}), 200
+    try:
+        with conexion() as conn:
+            with conn.cursor() as c:
+                c.execute("""
+                    INSERT INTO nutricion (id_atleta, fecha, peso, altura, imc, observaciones)
+                    VALUES (%s,%s,%s,%s,%s,%s)
+                    ON CONFLICT (id_atleta, fecha) DO UPDATE SET
+                      peso = EXCLUDED.peso,
+                      altura = EXCLUDED.altura,
+                      imc = EXCLUDED.imc,
+                      observaciones = EXCLUDED.observaciones;
+                """, (int(data['id_atleta']), datetime.strptime(data['fecha'],'%Y-%m-%d').date(),
+                      float(data['peso']), float(data['altura']), float(data['imc']), data['observaciones']))
+            conn.commit()
+            response_cache.invalidar(f"atleta:{int(data['id_atleta'])}")
+            return jsonify({"mensaje":"Nutrición registrada"}), 200
+    except pg_errors.ForeignKeyViolation:
+        return jsonify({"error": "Atleta no encontrado"}), 404
     except Exception:
-        logging.exception("Error en /nutricion")
-        return jsonify({"error":"Error interno"}), 500
-    finally:
-        release_db(conn)
+        return error_interno("Error en /nutricion", "Error interno")
 
 # ——— Médico ———
 @app.route('/medico', methods=['POST'])
@@ -314,22 +367,22 @@ def medico():
         if k not in data:
             return jsonify({"error": f"{k} es obligatorio"}), 400
 
-    conn = get_db()
     try:
-        with conn.cursor() as c:
-            c.execute("""
-                INSERT INTO medico (atleta_id, fecha, temperatura, presion_arterial, diagnostico, tratamiento, observaciones)
-                VALUES (%s,%s,%s,%s,%s,%s,%s);
-            """, (int(data['id_atleta']), datetime.strptime(data['fecha'],'%Y-%m-%d').date(),
-                  float(data['temperatura']), data['presion_arterial'], data['diagnostico'],
-                  data['tratamiento'], data['observaciones']))
-        conn.commit()
-        return jsonify({"mensaje":"Médico registrado"}), 200
+        with conexion() as conn:
+            with conn.cursor() as c:
+                c.execute("""
+                    INSERT INTO medico (atleta_id, fecha, temperatura, presion_arterial, diagnostico, tratamiento, observaciones)
+                    VALUES (%s,%s,%s,%s,%s,%s,%s);
+                """, (int(data['id_atleta']), datetime.strptime(data['fecha'],'%Y-%m-%d').date(),
+                      float(data['temperatura']), data['presion_arterial'], data['diagnostico'],
+                      data['tratamiento'], data['observaciones']))
+            conn.commit()
+            response_cache.invalidar(f"atleta:{int(data['id_atleta'])}")
+            return jsonify({"mensaje":"Médico registrado"}), 200
+    except pg_errors.ForeignKeyViolation:
+        return jsonify({"error": "Atleta no encontrado"}), 404
     except Exception:
-        logging.exception("Error en /medico")
-        return jsonify({"error":"Error interno"}), 500
-    finally:
-        release_db(conn)
+        return error_interno("Error en /medico", "Error interno")
 
 # ——— Entrenamiento ———
 @app.route('/entrenamiento', methods=['POST'])
@@ -338,22 +391,28 @@ def entrenamiento():
     for k in ('atleta_id', 'tipo_entrenamiento', 'duracion', 'intensidad', 'observaciones'):
         if k not in data:
             return jsonify({"error": f"{k} es obligatorio"}), 400
+    try:
+        fecha = datetime.strptime(data['fecha'], '%Y-%m-%d').date() if data.get('fecha') else None
+    except ValueError:
+        return jsonify({"error": "Formato de fecha inválido"}), 400
 
-    conn = get_db()
     try:
-        with conn.cursor() as c:
-            c.execute("""
-                INSERT INTO entrenamiento (id_atleta, tipo_entrenamiento, duracion, intensidad, observaciones)
-                VALUES (%s,%s,%s,%s,%s);
-            """, (data['atleta_id'], data['tipo_entrenamiento'], int(data['duracion']),
-                  data['intensidad'], data['observaciones']))
-        conn.commit()
-        return jsonify({"mensaje": "Entrenamiento registrado"}), 200
+        with conexion() as conn:
+            with conn.cursor() as c:
+                c.execute("""
+                    INSERT INTO entrenamiento (id_atleta, tipo_entrenamiento, duracion, intensidad, observaciones, fecha)
+                    VALUES (%s,%s,%s,%s,%s,COALESCE(%s, CURRENT_DATE))
+                    RETURNING fecha;
+                """, (data['atleta_id'], data['tipo_entrenamiento'], int(data['duracion']),
+                      data['intensidad'], data['observaciones'], fecha))
+                carga_entrenamiento.registrar(c, int(data['atleta_id']), [c.fetchone()[0]])
+            conn.commit()
+            response_cache.invalidar(f"atleta:{int(data['atleta_id'])}")
+            return jsonify({"mensaje": "Entrenamiento registrado"}), 200
+    except pg_errors.ForeignKeyViolation:
+        return jsonify({"error": "Atleta no encontrado"}), 404
     except Exception:
-        logging.exception("Error en /entrenamiento")
-        return jsonify({"error": "Error interno"}), 500
-    finally:
-        release_db(conn)
+        return error_interno("Error en /entrenamiento", "Error interno")
 
 # ——— Eventos ———
 @app.route('/add_evento', methods=['POST'])
@@ -363,23 +422,35 @@ def agregar_evento():
         if k not in data:
             return jsonify({"error": f"{k} es obligatorio"}), 400
 
-    conn = get_db()
     try:
-        with conn.cursor() as c:
-            c.execute("""
-                INSERT INTO evento (id_atleta, nombre, fecha, lugar, descripcion)
-                VALUES (%s,%s,%s,%s,%s);
-            """, (int(data['id_atleta']), data['nombre'], datetime.strptime(data['fecha'],'%Y-%m-%d').date(),
-                  data['lugar'], data['descripcion']))
-        conn.commit()
-        return jsonify({"mensaje":"Evento registrado"}), 200
+        with conexion() as conn:
+            with conn.cursor() as c:
+                c.execute("""
+                    INSERT INTO evento (id_atleta, nombre, fecha, lugar, descripcion)
+                    VALUES (%s,%s,%s,%s,%s);
+                """, (int(data['id_atleta']), data['nombre'], datetime.strptime(data['fecha'],'%Y-%m-%d').date(),
+                      data['lugar'], data['descripcion']))
+            conn.commit()
+            response_cache.invalidar(f"atleta:{int(data['id_atleta'])}")
+            return jsonify({"mensaje":"Evento registrado"}), 200
+    except pg_errors.ForeignKeyViolation:
+        return jsonify({"error": "Atleta no encontrado"}), 404
     except Exception:
-        logging.exception("Error en /add_evento")
-        return jsonify({"error":"Error interno"}), 500
-    finally:
-        release_db(conn)
+        return error_interno("Error en /add_evento", "Error interno")
 
 # ——— Autoseguimiento ———
+def leer_autoseguimiento(data):
+    """Tupla para SQL_INSERTAR_AUTOSEGUIMIENTO; ValueError si un número no es válido."""
+    id_atleta     = int(data['id_atleta'])
+    calidad       = int(data.get('calidad_sueno'))    if data.get('calidad_sueno') else None
+    horas         = float(data.get('horas_sueno'))    if data.get('horas_sueno') else None
+    fat           = int(data.get('fatiga'))           if data.get('fatiga') else None
+    dolor         = int(data.get('dolor_muscular'))   if data.get('dolor_muscular') else None
+    est           = int(data.get('estres'))           if data.get('estres') else None
+    animo         = int(data.get('estado_animo'))     if data.get('estado_animo') else None
+    comentarios   = data.get('comentarios')
+    return (id_atleta, calidad, horas, fat, dolor, est, animo, comentarios)
+
 @app.route('/add_autoseguimiento', methods=['POST'])
 def agregar_autoseguimiento():
     data = request.get_json() or {}
@@ -387,32 +458,68 @@ def agregar_autoseguimiento():
         return jsonify({"error":"id_atleta es obligatorio"}), 400
 
     try:
-        id_atleta     = int(data['id_atleta'])
-        calidad       = int(data.get('calidad_sueno'))    if data.get('calidad_sueno') else None
-        horas         = float(data.get('horas_sueno'))    if data.get('horas_sueno') else None
-        fat           = int(data.get('fatiga'))           if data.get('fatiga') else None
-        dolor         = int(data.get('dolor_muscular'))   if data.get('dolor_muscular') else None
-        est           = int(data.get('estres'))           if data.get('estres') else None
-        animo         = int(data.get('estado_animo'))     if data.get('estado_animo') else None
-        comentarios   = data.get('comentarios')
+        fila = leer_autoseguimiento(data)
     except ValueError:
         return jsonify({"error":"Formato numérico inválido"}), 400
 
-    conn = get_db()
     try:
-        with conn.cursor() as c:
-            c.execute("""
-                INSERT INTO autoseguimiento
-                (id_atleta, calidad_sueno, horas_sueno, fatiga, dolor_muscular, estres, estado_animo, comentarios)
-                VALUES (%s,%s,%s,%s,%s,%s,%s,%s);
-            """, (id_atleta, calidad, horas, fat, dolor, est, animo, comentarios))
-        conn.commit()
-        return jsonify({"mensaje":"Autoseguimiento registrado"}), 200
+        if escritura_diferida.ESCRITURA_DIFERIDA:
+            return escribir_diferido('autoseguimiento', fila, {"mensaje": "Autoseguimiento registrado"})
+        with conexion() as conn:
+            with conn.cursor() as c:
+                insertar_autoseguimiento(c, fila)
+            conn.commit()
+            response_cache.invalidar(f"atleta:{fila[0]}")
+            return jsonify({"mensaje":"Autoseguimiento registrado"}), 200
+    except pg_errors.ForeignKeyViolation:
+        return jsonify({"error": "Atleta no encontrado"}), 404
     except Exception:
-        logging.exception("Error en /add_autoseguimiento")
-        return jsonify({"error":"Error interno"}), 500
-    finally:
-        release_db(conn)
+        return error_interno("Error en /add_autoseguimiento", "Error interno")
+
+# ——— Carga masiva por recurso ———
+# Hermana de cada ruta de un registro: mismo formato de registro, en un array
+# JSON o NDJSON, validado por columnas y escrito en una sola transacción.
+RECURSOS_POR_RUTA = {
+    'psicologia': 'psicologia',
+    'nutricion': 'nutricion',
+    'medico': 'medico',
+    'entrenamiento': 'entrenamiento',
+    'add_evento': 'evento',
+    'add_autoseguimiento': 'autoseguimiento',
+}
+
+@app.route('/<any(psicologia, nutricion, medico, entrenamiento, add_evento, add_autoseguimiento):ruta>/bulk',
+           methods=['POST'])
+def carga_masiva(ruta):
+    lineas = None
+    if request.mimetype == 'application/x-ndjson':
+        # Las líneas en blanco se saltan: los errores llevan la línea del cuerpo, no la posición
+        lineas, registros = [], []
+        for linea, registro in hrv_store.leer_ndjson(request.stream):
+            lineas.append(linea)
+            registros.append(registro)
+    else:
+        registros = request.get_json(silent=True)
+        if not isinstance(registros, list):
+            return jsonify({"error": "Se esperaba un array de registros o NDJSON"}), 400
+    if len(registros) > lotes.LOTE_MAX_REGISTROS:
+        return jsonify({"error": f"Máximo {lotes.LOTE_MAX_REGISTROS} registros por lote"}), 413
+
+    try:
+        with conexion() as conn:
+            with conn.cursor() as cur:
+                resultado = lotes.escribir(cur, lotes.RECURSOS[RECURSOS_POR_RUTA[ruta]], registros, lineas)
+            conn.commit()
+            atletas = resultado.pop("atletas")
+            response_cache.invalidar(*(f"atleta:{a}" for a in atletas))
+            escritas = resultado["insertadas"] + resultado["actualizadas"]
+            codigo = 400 if escritas == 0 and resultado["rechazadas"] else 200
+            return jsonify(resultado), codigo
+
+    except pg_errors.ForeignKeyViolation:
+        return jsonify({"error": "Atleta no encontrado"}), 404
+    except Exception:
+        return error_interno(f"Error en /{ruta}/bulk", "Error interno del servidor")
 
 # ——— Consentimiento de tutores ———
 @app.route('/consentimiento_tutor', methods=['GET','POST'])
@@ -425,109 +532,131 @@ def consentimiento_tutor():
         if campo not in data:
             return jsonify({"error": f"{campo} es obligatorio"}), 400
 
-    conn = get_db()
     try:
-        with conn.cursor() as c:
-            c.execute("""
-                INSERT INTO Consentimientos_Tutores
-                (nombre_menor, edad_menor, nombre_tutor, relacion_tutor, contacto_tutor, aceptado)
-                VALUES (%s, %s, %s, %s, %s, %s);
-            """, (data['nombre_menor'], int(data['edad_menor']), data['nombre_tutor'],
-                  data.get('relacion_tutor', None), data['contacto_tutor'], True))
-        conn.commit()
-        return jsonify({"mensaje": "Consentimiento de tutor registrado correctamente"}), 200
+        with conexion() as conn:
+            with conn.cursor() as c:
+                c.execute("""
+                    INSERT INTO Consentimientos_Tutores
+                    (nombre_menor, edad_menor, nombre_tutor, relacion_tutor, contacto_tutor, aceptado)
+                    VALUES (%s, %s, %s, %s, %s, %s);
+                """, (data['nombre_menor'], int(data['edad_menor']), data['nombre_tutor'],
+                      data.get('relacion_tutor', None), data['contacto_tutor'], True))
+            conn.commit()
+            return jsonify({"mensaje": "Consentimiento de tutor registrado correctamente"}), 200
     except Exception:
-        logging.exception("Error en /consentimiento_tutor")
-        return jsonify({"error": "Error interno"}), 500
-    finally:
-        release_db(conn)
+        return error_interno("Error en /consentimiento_tutor", "Error interno")
 
-# ——— HRV ———
 # ——— HRV ———
 @app.route('/add_hrv', methods=['POST'])
 def add_hrv():
     data = request.get_json() or {}
 
-    atleta_id = data.get("id_atleta")
-    hrv_value = data.get("hrv")
-    mean_rr = data.get("mean_rr")
-    bpm = data.get("bpm")
-    calidad_senal = data.get("calidad_senal")
-    duracion = data.get("duracion")
-    rr_intervals = data.get("rr_intervals")
-
-    if atleta_id is None or hrv_value is None:
-        return jsonify({"error": "Faltan datos obligatorios"}), 400
-
-    conn = get_db()
     try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO hrv 
-                (id_atleta, fecha, hrv, mean_rr, bpm, calidad_senal, duracion, rr_intervals)
-                VALUES (%s, CURRENT_DATE, %s, %s, %s, %s, %s, %s)
-            """, (
-                int(atleta_id),
-                float(hrv_value),
-                float(mean_rr) if mean_rr is not None else None,
-                float(bpm) if bpm is not None else None,
-                int(calidad_senal) if calidad_senal is not None else None,
-                int(duracion) if duracion is not None else None,
-                json.dumps(rr_intervals) if rr_intervals is not None else None
-            ))
+        fila = hrv_store.normalizar_lectura(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        conn.commit()
-        return jsonify({"message": "HRV agregado correctamente"}), 200
+    try:
+        if escritura_diferida.ESCRITURA_DIFERIDA:
+            return escribir_diferido('hrv', fila, {"message": "HRV agregado correctamente"})
+        with conexion() as conn:
+            with conn.cursor() as cur:
+                hrv_store.insertar_lectura(cur, fila)
+
+            conn.commit()
+            response_cache.invalidar(f"atleta:{fila[0]}")
+            return jsonify({"message": "HRV agregado correctamente"}), 200
+
+    except pg_errors.ForeignKeyViolation:
+        return jsonify({"error": "Atleta no encontrado"}), 404
+    except Exception:
+        return error_interno("Error en /add_hrv", "Error interno del servidor")
+
+# Carga masiva: array JSON o NDJSON (application/x-ndjson), una transacción con COPY
+@app.route('/add_hrv/bulk', methods=['POST'])
+def add_hrv_bulk():
+    if request.mimetype == 'application/x-ndjson':
+        lecturas = hrv_store.leer_ndjson(request.stream)
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, list):
+            return jsonify({"error": "Se esperaba un array de lecturas o NDJSON"}), 400
+        lecturas = enumerate(data)
 
+    try:
+        with conexion() as conn:
+            with conn.cursor() as cur:
+                insertadas, rechazadas, errores, atletas = hrv_store.insertar_lecturas(cur, lecturas)
+            conn.commit()
+            response_cache.invalidar(*(f"atleta:{a}" for a in atletas))
+            codigo = 400 if insertadas == 0 and rechazadas else 200
+            return jsonify({"insertadas": insertadas, "rechazadas": rechazadas, "errores": errores}), codigo
+
+    except pg_errors.ForeignKeyViolation:
+        return jsonify({"error": "Atleta no encontrado"}), 404
     except Exception:
-        logging.exception("Error en /add_hrv")
-        return jsonify({"error": "Error interno del servidor"}), 500
+        return error_interno("Error en /add_hrv/bulk", "Error interno del servidor")
 
-    finally:
-        release_db(conn)
+def fila_hrv(r):
+    return {"fecha": str(r[0]), "hrv": float(r[2]) if r[2] is not None else None}
 
+# Sin `limite` ni `cursor` devuelve todo el histórico por trozos (mismo formato de
+# siempre); con ellos, una página {"datos": [...], "siguiente": cursor}. Con
+# `agregado=semana|mes`, los periodos (n, media, mínimo, máximo) de los resúmenes.
+# Con `format=columns`, {"columnas": [...], "filas": [...]} (y "siguiente" si pagina).
 @app.route('/hrv/<int:id_atleta>', methods=['GET'])
 def get_hrv(id_atleta):
-    conn = get_db()
     try:
+        params = historial.leer_parametros(request.args)
+    except ValueError:
+        return jsonify({"error": "Parámetros inválidos"}), 400
+
+    conn = None
+    transmitiendo = False
+    try:
+        conn = get_db()
+        columnas = params["formato"] == 'columns'
+        if params["agregado"]:
+            with conn.cursor() as cur:
+                filas, siguiente = resumenes.pagina(cur, 'hrv', id_atleta, params)
+            if columnas:
+                return serializacion.respuesta_columnas(resumenes.COLUMNAS_RESUMEN, filas, agregado=params["agregado"],
+                                                        siguiente=siguiente), 200
+            datos = [resumenes.fila_resumen(r) for r in filas]
+            return jsonify({"agregado": params["agregado"], "datos": datos, "siguiente": siguiente}), 200
+        if params["limite"] is None and params["c_fecha"] is None:
+            if columnas:
+                prefijo = serializacion.prefijo_columnas(historial.nombres_columnas(['hrv']))
+                respuesta = historial.transmitir(conn, release_db, 'hrv', ['hrv'], id_atleta, params, None,
+                                                 prefijo=prefijo, sufijo=']}')
+            else:
+                respuesta = historial.transmitir(conn, release_db, 'hrv', ['hrv'], id_atleta, params, fila_hrv)
+            transmitiendo = True
+            return respuesta
+
         with conn.cursor() as cur:
-            cur.execute("SELECT fecha, hrv FROM hrv WHERE id_atleta = %s ORDER BY fecha ASC", (id_atleta,))
-            rows = cur.fetchall()
-        return jsonify([{"fecha": str(r[0]), "hrv": float(r[1])} for r in rows]), 200
+            filas, siguiente = historial.pagina(cur, 'hrv', ['hrv'], id_atleta, params)
+        if columnas:
+            return serializacion.respuesta_columnas(historial.nombres_columnas(['hrv']), filas,
+                                                    siguiente=siguiente), 200
+        return jsonify({"datos": [fila_hrv(r) for r in filas], "siguiente": siguiente}), 200
     except Exception:
-        logging.exception("Error en /hrv/<id>")
-        return jsonify({"error": "Error interno"}), 500
+        return error_interno("Error en /hrv/<id>", "Error interno")
     finally:
-        release_db(conn)
+        if not transmitiendo:
+            release_db(conn)
 
-@app.get("/hrv_status/{id_atleta}")
-def get_hrv_status(id_atleta: int):
+@app.route('/hrv_status/<int:id_atleta>', methods=['GET'])
+def get_hrv_status(id_atleta):
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-
-        cur.execute("SELECT * FROM get_hrv_status(%s);", (id_atleta,))
-        result = cur.fetchone()
-
-        cur.close()
-        conn.close()
-
-        if not result:
-            return {
-                "message": "Datos insuficientes para análisis"
-            }
-
-        return {
-            "baseline_ln": float(result[0]),
-            "sd_ln": float(result[1]),
-            "ln_actual": float(result[2]),
-            "z_score": float(result[3]),
-            "estado": result[4],
-            "n_mediciones": int(result[5])
-        }
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        with conexion() as conn:
+            with conn.cursor() as cur:
+                estado = hrv_baseline.obtener_estado(cur, id_atleta)
+            if estado is None:
+                return jsonify({"message": "Datos insuficientes para análisis"}), 200
+            return jsonify(estado), 200
+    except Exception:
+        return error_interno("Error en /hrv_status/<id>", "Error interno")
 
 @app.route('/add_rpe', methods=['POST'])
 def add_rpe():
@@ -540,61 +669,129 @@ def add_rpe():
     if atleta_id is None or rpe_value is None:
         return jsonify({"error": "Faltan datos obligatorios"}), 400
 
-    conn = get_db()
     try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO rpe
-                (id_atleta, fecha, rpe, notas)
-                VALUES (%s, CURRENT_DATE, %s, %s)
-            """, (
-                int(atleta_id),
-                int(rpe_value),            # RPE generalmente es entero 1-10
-                notas if notas is not None else None
-            ))
+        with conexion() as conn:
+            with conn.cursor() as cur:
+                cur.execute(SQL_INSERTAR_RPE, (
+                    int(atleta_id),
+                    int(rpe_value),            # RPE generalmente es entero 1-10
+                    notas if notas is not None else None
+                ))
+                fecha = cur.fetchone()[0]
+                carga_entrenamiento.registrar(cur, int(atleta_id), [fecha])
+                resumenes.registrar(cur, 'rpe', int(atleta_id), [fecha])
+
+            conn.commit()
+            response_cache.invalidar(f"atleta:{int(atleta_id)}")
+            return jsonify({"message": "RPE agregado correctamente"}), 200
+
+    except pg_errors.ForeignKeyViolation:
+        return jsonify({"error": "Atleta no encontrado"}), 404
+    except Exception:
+        return error_interno("Error en /add_rpe", "Error interno del servidor")
 
-        conn.commit()
-        return jsonify({"message": "RPE agregado correctamente"}), 200
+# ——— Carga de entrenamiento (EWMA aguda/crónica y ACWR) ———
+# `actual` son los valores a hoy; `serie`, los últimos `dias` días con sesión.
+@app.route('/carga/<int:id_atleta>', methods=['GET'])
+def get_carga(id_atleta):
+    try:
+        dias = min(int(request.args.get('dias', 28)), historial.PAGINA_MAX)
+    except ValueError:
+        return jsonify({"error": "Parámetros inválidos"}), 400
 
+    try:
+        with conexion() as conn:
+            with conn.cursor() as cur:
+                actual, serie = carga_entrenamiento.obtener(cur, id_atleta, max(dias, 0))
+            if actual is None:
+                return jsonify({"message": "Sin entrenamientos ni RPE registrados"}), 200
+            return jsonify({"actual": actual, "serie": serie}), 200
     except Exception:
-        logging.exception("Error en /add_rpe")
-        return jsonify({"error": "Error interno del servidor"}), 500
+        return error_interno("Error en /carga/<id>", "Error interno")
 
-    finally:
-        release_db(conn)
+def fila_rpe(r):
+    return {"fecha": r[0].isoformat(), "rpe": r[2], "notas": r[3]}
 
+# Por defecto las 30 últimas; admite desde/hasta/limite/cursor/orden,
+# `stream=1` para transmitir todo el rango por trozos, `agregado=semana|mes`
+# y `format=columns`.
 @app.route('/rpe_status/<int:id_atleta>', methods=['GET'])
 def get_rpe_status(id_atleta):
-    conn = get_db()
     try:
+        params = historial.leer_parametros(request.args, orden='desc')
+    except ValueError:
+        return jsonify({"error": "Parámetros inválidos"}), 400
+
+    conn = None
+    transmitiendo = False
+    try:
+        conn = get_db()
+        columnas = params["formato"] == 'columns'
+        if params["agregado"]:
+            with conn.cursor() as cur:
+                filas, siguiente = resumenes.pagina(cur, 'rpe', id_atleta, params)
+            if columnas:
+                return serializacion.respuesta_columnas(resumenes.COLUMNAS_RESUMEN, filas, agregado=params["agregado"],
+                                                        siguiente=siguiente), 200
+            datos = [resumenes.fila_resumen(r) for r in filas]
+            return jsonify({"agregado": params["agregado"], "rpe_history": datos, "siguiente": siguiente}), 200
+        if request.args.get('stream') == '1':
+            if columnas:
+                prefijo = serializacion.prefijo_columnas(historial.nombres_columnas(['rpe', 'notas']))
+                respuesta = historial.transmitir(conn, release_db, 'rpe', ['rpe', 'notas'], id_atleta, params,
+                                                 None, prefijo=prefijo, sufijo=']}')
+            else:
+                respuesta = historial.transmitir(conn, release_db, 'rpe', ['rpe', 'notas'], id_atleta, params,
+                                                 fila_rpe, prefijo='{"rpe_history":[', sufijo=']}')
+            transmitiendo = True
+            return respuesta
+
+        if params["limite"] is None:
+            params["limite"] = 30
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT fecha, rpe, notas
-                FROM rpe
-                WHERE id_atleta = %s
-                ORDER BY fecha DESC
-                LIMIT 30
-            """, (id_atleta,))
-
-            rows = cur.fetchall()
-
-            # Transformar en lista de dicts
-            rpe_history = [
-                {
-                    "fecha": row[0].isoformat(),
-                    "rpe": row[1],
-                    "notas": row[2]
-                }
-                for row in rows
-            ]
-
-        return jsonify({"rpe_history": rpe_history}), 200
+            filas, siguiente = historial.pagina(cur, 'rpe', ['rpe', 'notas'], id_atleta, params)
+        if columnas:
+            return serializacion.respuesta_columnas(historial.nombres_columnas(['rpe', 'notas']), filas,
+                                                    siguiente=siguiente), 200
+
+        return jsonify({"rpe_history": [fila_rpe(r) for r in filas], "siguiente": siguiente}), 200
 
     except Exception:
-        logging.exception("Error en /rpe_status")
-        return jsonify({"error": "Error interno del servidor"}), 500
+        return error_interno("Error en /rpe_status", "Error interno del servidor")
 
     finally:
-        release_db(conn)
+        if not transmitiendo:
+            release_db(conn)
+
+# ——— Exportación columnar ———
+# Una tabla entera (o filtrada por atletas=1,2, equipo, desde y hasta) en
+# `format=parquet|arrow|csv`, generada por trozos. Para todas las tablas a la
+# vez en una misma instantánea, `flask --app app exportar`.
+@app.route('/exportar/<tabla>', methods=['GET'])
+def exportar_tabla(tabla):
+    if tabla not in exportacion.TABLAS_EXPORTACION:
+        return jsonify({"error": "Tabla no exportable"}), 404
+    formato = request.args.get('format') or 'parquet'
+    try:
+        filtros = exportacion.leer_filtros(request.args)
+    except ValueError:
+        return jsonify({"error": "Parámetros inválidos"}), 400
+    if formato not in exportacion.FORMATOS_EXPORTACION:
+        return jsonify({"error": f"format debe ser uno de {', '.join(exportacion.FORMATOS_EXPORTACION)}"}), 400
+    if not exportacion.formato_disponible(formato):
+        return jsonify({"error": f"El formato {formato} no está disponible en este servidor"}), 501
+
+    conn = None
+    transmitiendo = False
+    try:
+        conn = get_db()
+        respuesta = exportacion.transmitir(conn, release_db, tabla, formato, filtros)
+        transmitiendo = True
+        return respuesta
+    except Exception:
+        return error_interno("Error en /exportar/<tabla>", "Error al exportar")
+    finally:
+        if not transmitiendo:
+            release_db(conn)
 
 # ——— Fin del archivo: no usar app.run
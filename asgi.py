@@ -0,0 +1,515 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+import weakref
+from contextlib import asynccontextmanager
+
+import anyio
+from a2wsgi import WSGIMiddleware
+from psycopg import errors as pg_errors
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+from psycopg2 import errors as pg2_errors
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.http import parse_etags
+
+import busqueda
+import carga_entrenamiento
+import escritura_diferida
+import hrv_baseline
+import hrv_store
+import historial
+import metricas
+import response_cache
+import resumenes
+import serializacion
+from app import app as flask_app
+from app import (COLUMNAS_ATLETA, SQL_ATLETA, SQL_INSERTAR_AUTOSEGUIMIENTO, SQL_INSERTAR_RPE, SQL_LISTAR_ATLETAS,
+                 fila_atleta, fila_hrv, fila_rpe, leer_autoseguimiento)
+from db import (DATABASE_URL, DB_POOL_MAX, DB_POOL_MAX_VIDA, DB_POOL_MIN, DB_POOL_TIMEOUT, DB_POOL_VERIFICAR_TRAS,
+                estadisticas_pool)
+
+# Modo ASGI: `uvicorn asgi:app` (SERVIDOR=asgi en start.sh). Las rutas de más
+# tráfico se atienden aquí con psycopg 3 async, de modo que miles de clientes
+# ociosos o una consulta lenta no ocupan hilos; el resto de la API (predicción,
+# altas, formularios...) es la app Flask montada debajo, que corre en un pool de
+# ASGI_WSGI_HILOS hilos con su propio pool psycopg2 (db.py).
+
+# ——— Configuración ———
+ASGI_WSGI_HILOS = int(os.getenv('ASGI_WSGI_HILOS', '8'))
+ASGI_POOL_MAX = int(os.getenv('ASGI_POOL_MAX', str(DB_POOL_MAX)))
+# Un histórico en streaming retiene su conexión al ritmo de lectura del cliente;
+# con este tope los clientes lentos no dejan sin conexiones al resto de rutas.
+ASGI_STREAMS_MAX = int(os.getenv('ASGI_STREAMS_MAX', str(max(1, ASGI_POOL_MAX // 2))))
+
+
+# ——— Pool async ———
+# Como en db.PoolConexiones: sólo se hace ping a las conexiones que llevan más
+# de DB_POOL_VERIFICAR_TRAS ociosas, no en cada préstamo.
+_devuelta = weakref.WeakKeyDictionary()
+
+
+async def _verificar(conn):
+    if time.monotonic() - _devuelta.get(conn, 0.0) > DB_POOL_VERIFICAR_TRAS:
+        await conn.execute("SELECT 1")
+        await conn.rollback()
+
+
+async def _al_devolver(conn):
+    _devuelta[conn] = time.monotonic()
+
+
+pool = AsyncConnectionPool(
+    DATABASE_URL,
+    min_size=DB_POOL_MIN,
+    max_size=ASGI_POOL_MAX,
+    timeout=DB_POOL_TIMEOUT,
+    max_lifetime=DB_POOL_MAX_VIDA,
+    check=_verificar,
+    reset=_al_devolver,
+    open=False,
+)
+
+
+# ——— Respuestas ———
+class RespuestaJSON(Response):
+    """JSON serializado como el proveedor de la app Flask: mismo cuerpo en ambos modos."""
+    media_type = "application/json"
+
+    def render(self, contenido):
+        return serializacion.dumps(contenido) + b"\n"
+
+
+class RespuestaColumnas(Response):
+    """Formato columns: `contenido` es el cuerpo ya serializado (serializacion.cuerpo_columnas)."""
+    media_type = "application/json"
+
+
+def error_interno(exc, contexto, mensaje):
+    if isinstance(exc, (PoolTimeout, TimeoutError)):
+        return RespuestaJSON({"error": "Servidor ocupado, reintente en unos segundos"}, 503, {"Retry-After": "1"})
+    logging.error(contexto, exc_info=exc)
+    return RespuestaJSON({"error": mensaje}, 500)
+
+
+async def escribir_diferido(tipo, fila, cuerpo):
+    """Como app.escribir_diferido, sin bloquear el bucle mientras el lote hace commit.
+    El lote lo escribe psycopg2 (db.py): sus errores no son los de psycopg 3."""
+    try:
+        futuro = escritura_diferida.escritor.encolar(tipo, fila)
+    except escritura_diferida.ColaLlena:
+        return RespuestaJSON({"error": "Servidor ocupado, reintente en unos segundos"}, 503, {"Retry-After": "1"})
+    if escritura_diferida.ESCRITURA_ACK == 'memoria':
+        return RespuestaJSON(cuerpo, 202)
+    try:
+        await asyncio.wait_for(asyncio.wrap_future(futuro), escritura_diferida.ESCRITURA_TIMEOUT)
+    except pg2_errors.ForeignKeyViolation:
+        return RespuestaJSON({"error": "Atleta no encontrado"}, 404)
+    return RespuestaJSON(cuerpo)
+
+
+async def _cache(metodo, *args):
+    # La caché local responde en microsegundos; la de Redis bloquearía el bucle
+    if isinstance(response_cache.cache, response_cache.CacheLocal):
+        return metodo(*args)
+    return await run_in_threadpool(metodo, *args)
+
+
+async def invalidar(*etiquetas):
+    await _cache(response_cache.invalidar, *etiquetas)
+
+
+async def cacheado(request, vista, clave, etiquetas, generar):
+    """Equivalente async de response_cache.cacheado; comparte las entradas con la vista Flask `vista`."""
+    try:
+        completa = f"{vista}:{clave}:{await _cache(response_cache.cache.generaciones, etiquetas)}"
+        entrada = await _cache(response_cache.cache.obtener, completa)
+    except Exception:
+        logging.exception("Error leyendo la caché de %s", vista)
+        return await generar()
+
+    if entrada is None:
+        respuesta = await generar()
+        if respuesta.status_code != 200:
+            return respuesta
+        entrada = (respuesta.body, respuesta.media_type, hashlib.sha1(respuesta.body).hexdigest())
+        try:
+            await _cache(response_cache.cache.guardar, completa, entrada, response_cache.CACHE_TTL)
+        except Exception:
+            logging.exception("Error guardando en la caché de %s", vista)
+
+    cuerpo, mimetype, etag = entrada
+    cabeceras = {"ETag": f'"{etag}"'}
+    if parse_etags(request.headers.get("if-none-match")).contains(etag):
+        return Response(status_code=304, headers=cabeceras)
+    return Response(cuerpo, 200, cabeceras, media_type=mimetype)
+
+
+async def leer_json(request):
+    try:
+        return serializacion.loads(await request.body())
+    except ValueError:
+        return None
+
+
+# ——— Rutas ———
+async def home(request):
+    return RespuestaJSON({"estado": "API corriendo"})
+
+
+async def estado_pool(request):
+    return RespuestaJSON({"async": pool.get_stats(), "wsgi": estadisticas_pool()})
+
+
+async def listar_atletas(request):
+    try:
+        formato = serializacion.leer_formato(request.query_params)
+    except ValueError as e:
+        return RespuestaJSON({"error": str(e)}, 400)
+
+    async def generar():
+        try:
+            async with pool.connection() as conn:
+                cur = await conn.execute(SQL_LISTAR_ATLETAS)
+                filas = await cur.fetchall()
+            if formato == 'columns':
+                return RespuestaColumnas(serializacion.cuerpo_columnas(COLUMNAS_ATLETA, filas))
+            return RespuestaJSON([fila_atleta(a) for a in filas])
+        except Exception as e:
+            return error_interno(e, "Error en /atletas", "Error al listar atletas")
+
+    clave = f"todos:{request.query_params.get('format', '')}"
+    return await cacheado(request, "listar_atletas", clave, ["atletas"], generar)
+
+
+async def buscar_atletas(request):
+    try:
+        params = busqueda.leer_parametros(request.query_params)
+        formato = serializacion.leer_formato(request.query_params)
+    except ValueError:
+        return RespuestaJSON({"error": "Parámetros inválidos"}, 400)
+    try:
+        async with pool.connection() as conn:
+            async with conn.cursor() as cur:
+                filas, siguiente = await busqueda.buscar_async(cur, params)
+        if formato == 'columns':
+            return RespuestaColumnas(serializacion.cuerpo_columnas(busqueda.COLUMNAS_BUSQUEDA, filas,
+                                                                   siguiente=siguiente))
+        return RespuestaJSON({"datos": [busqueda.fila_busqueda(f) for f in filas], "siguiente": siguiente})
+    except Exception as e:
+        return error_interno(e, "Error en /atletas/buscar", "Error al buscar atletas")
+
+
+async def obtener_atleta(request):
+    id_atleta = request.path_params["id_atleta"]
+
+    async def generar():
+        try:
+            async with pool.connection() as conn:
+                cur = await conn.execute(SQL_ATLETA, (id_atleta,))
+                atleta = await cur.fetchone()
+                if not atleta:
+                    return RespuestaJSON({"error": "Atleta no encontrado"}, 404)
+                columnas = [desc[0] for desc in cur.description]
+                return RespuestaJSON(dict(zip(columnas, atleta)))
+        except Exception as e:
+            return error_interno(e, "Error en /atletas/<id>", "Error al obtener atleta")
+
+    return await cacheado(request, "obtener_atleta", id_atleta, ["atletas", f"atleta:{id_atleta}"], generar)
+
+
+async def add_hrv(request):
+    data = await leer_json(request) or {}
+
+    try:
+        fila = hrv_store.normalizar_lectura(data)
+    except ValueError as e:
+        return RespuestaJSON({"error": str(e)}, 400)
+
+    try:
+        if escritura_diferida.ESCRITURA_DIFERIDA:
+            return await escribir_diferido('hrv', fila, {"message": "HRV agregado correctamente"})
+        async with pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await hrv_store.insertar_lectura_async(cur, fila)
+        await invalidar(f"atleta:{fila[0]}")
+        return RespuestaJSON({"message": "HRV agregado correctamente"})
+    except pg_errors.ForeignKeyViolation:
+        return RespuestaJSON({"error": "Atleta no encontrado"}, 404)
+    except Exception as e:
+        return error_interno(e, "Error en /add_hrv", "Error interno del servidor")
+
+
+_streams = anyio.Semaphore(ASGI_STREAMS_MAX)
+
+
+async def transmitir(tabla, columnas, id_atleta, params, a_dict, prefijo='[', sufijo=']'):
+    """Versión async de historial.transmitir: cursor de servidor y conexión retenida
+    hasta que termina la respuesta (o el cliente corta). Con `a_dict` None, tuplas (format=columns)."""
+    with anyio.fail_after(DB_POOL_TIMEOUT):
+        await _streams.acquire()
+    try:
+        conn = await pool.getconn()
+    except BaseException:
+        _streams.release()
+        raise
+    liberada = False
+
+    async def liberar():
+        nonlocal liberada
+        if not liberada:
+            liberada = True
+            try:
+                await conn.rollback()
+            finally:
+                # si la conexión quedó rota el pool la descarta
+                await pool.putconn(conn)
+                _streams.release()
+
+    try:
+        cur = conn.cursor(name=f"historial_{tabla}")
+        cur.itersize = historial.STREAM_ITERSIZE
+        await cur.execute(historial.sql_keyset(tabla, columnas, params["orden"], False),
+                          dict(params, id_atleta=id_atleta))
+    except BaseException:
+        await liberar()
+        raise
+
+    async def generar():
+        try:
+            yield prefijo
+            primera = True
+            while True:
+                # un FETCH a medias deja la conexión inservible: la cancelación
+                # por corte del cliente se aplica entre trozos, no durante
+                with anyio.CancelScope(shield=True):
+                    filas = await cur.fetchmany(historial.STREAM_ITERSIZE)
+                if not filas:
+                    break
+                trozo = serializacion.trozo(filas if a_dict is None else [a_dict(fila) for fila in filas])
+                yield trozo if primera else b',' + trozo
+                primera = False
+            yield sufijo
+        finally:
+            with anyio.CancelScope(shield=True):
+                await liberar()
+
+    # La tarea de fondo cubre el caso en que el generador ni siquiera llega a empezar
+    return StreamingResponse(generar(), media_type='application/json', background=BackgroundTask(liberar))
+
+
+async def get_hrv(request):
+    id_atleta = request.path_params["id_atleta"]
+    try:
+        params = historial.leer_parametros(request.query_params)
+    except ValueError:
+        return RespuestaJSON({"error": "Parámetros inválidos"}, 400)
+
+    columnas = params["formato"] == 'columns'
+    try:
+        if params["agregado"]:
+            async with pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    filas, siguiente = await resumenes.pagina_async(cur, 'hrv', id_atleta, params)
+            if columnas:
+                return RespuestaColumnas(serializacion.cuerpo_columnas(
+                    resumenes.COLUMNAS_RESUMEN, filas, agregado=params["agregado"], siguiente=siguiente))
+            datos = [resumenes.fila_resumen(r) for r in filas]
+            return RespuestaJSON({"agregado": params["agregado"], "datos": datos, "siguiente": siguiente})
+        if params["limite"] is None and params["c_fecha"] is None:
+            if columnas:
+                prefijo = serializacion.prefijo_columnas(historial.nombres_columnas(['hrv']))
+                return await transmitir('hrv', ['hrv'], id_atleta, params, None, prefijo=prefijo, sufijo=']}')
+            return await transmitir('hrv', ['hrv'], id_atleta, params, fila_hrv)
+
+        async with pool.connection() as conn:
+            async with conn.cursor() as cur:
+                filas, siguiente = await historial.pagina_async(cur, 'hrv', ['hrv'], id_atleta, params)
+        if columnas:
+            return RespuestaColumnas(serializacion.cuerpo_columnas(historial.nombres_columnas(['hrv']), filas,
+                                                                   siguiente=siguiente))
+        return RespuestaJSON({"datos": [fila_hrv(r) for r in filas], "siguiente": siguiente})
+    except Exception as e:
+        return error_interno(e, "Error en /hrv/<id>", "Error interno")
+
+
+async def get_hrv_status(request):
+    id_atleta = request.path_params["id_atleta"]
+    try:
+        async with pool.connection() as conn:
+            async with conn.cursor() as cur:
+                estado = await hrv_baseline.obtener_estado_async(cur, id_atleta)
+        if estado is None:
+            return RespuestaJSON({"message": "Datos insuficientes para análisis"})
+        return RespuestaJSON(estado)
+    except Exception as e:
+        return error_interno(e, "Error en /hrv_status/<id>", "Error interno")
+
+
+async def add_rpe(request):
+    data = await leer_json(request) or {}
+
+    atleta_id = data.get("id_atleta")
+    rpe_value = data.get("rpe")
+    notas = data.get("notas")
+
+    if atleta_id is None or rpe_value is None:
+        return RespuestaJSON({"error": "Faltan datos obligatorios"}, 400)
+
+    try:
+        async with pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(SQL_INSERTAR_RPE, (int(atleta_id), int(rpe_value), notas))
+                fecha = (await cur.fetchone())[0]
+                await carga_entrenamiento.registrar_async(cur, int(atleta_id), [fecha])
+                await resumenes.registrar_async(cur, 'rpe', int(atleta_id), [fecha])
+        await invalidar(f"atleta:{int(atleta_id)}")
+        return RespuestaJSON({"message": "RPE agregado correctamente"})
+    except pg_errors.ForeignKeyViolation:
+        return RespuestaJSON({"error": "Atleta no encontrado"}, 404)
+    except Exception as e:
+        return error_interno(e, "Error en /add_rpe", "Error interno del servidor")
+
+
+async def get_rpe_status(request):
+    id_atleta = request.path_params["id_atleta"]
+    try:
+        params = historial.leer_parametros(request.query_params, orden='desc')
+    except ValueError:
+        return RespuestaJSON({"error": "Parámetros inválidos"}, 400)
+
+    columnas = params["formato"] == 'columns'
+    try:
+        if params["agregado"]:
+            async with pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    filas, siguiente = await resumenes.pagina_async(cur, 'rpe', id_atleta, params)
+            if columnas:
+                return RespuestaColumnas(serializacion.cuerpo_columnas(
+                    resumenes.COLUMNAS_RESUMEN, filas, agregado=params["agregado"], siguiente=siguiente))
+            datos = [resumenes.fila_resumen(r) for r in filas]
+            return RespuestaJSON({"agregado": params["agregado"], "rpe_history": datos, "siguiente": siguiente})
+        if request.query_params.get('stream') == '1':
+            if columnas:
+                prefijo = serializacion.prefijo_columnas(historial.nombres_columnas(['rpe', 'notas']))
+                return await transmitir('rpe', ['rpe', 'notas'], id_atleta, params, None,
+                                        prefijo=prefijo, sufijo=']}')
+            return await transmitir('rpe', ['rpe', 'notas'], id_atleta, params, fila_rpe,
+                                    prefijo='{"rpe_history":[', sufijo=']}')
+
+        if params["limite"] is None:
+            params["limite"] = 30
+        async with pool.connection() as conn:
+            async with conn.cursor() as cur:
+                filas, siguiente = await historial.pagina_async(cur, 'rpe', ['rpe', 'notas'], id_atleta, params)
+        if columnas:
+            return RespuestaColumnas(serializacion.cuerpo_columnas(historial.nombres_columnas(['rpe', 'notas']),
+                                                                   filas, siguiente=siguiente))
+        return RespuestaJSON({"rpe_history": [fila_rpe(r) for r in filas], "siguiente": siguiente})
+    except Exception as e:
+        return error_interno(e, "Error en /rpe_status", "Error interno del servidor")
+
+
+async def agregar_autoseguimiento(request):
+    data = await leer_json(request) or {}
+    if 'id_atleta' not in data:
+        return RespuestaJSON({"error": "id_atleta es obligatorio"}, 400)
+
+    try:
+        fila = leer_autoseguimiento(data)
+    except ValueError:
+        return RespuestaJSON({"error": "Formato numérico inválido"}, 400)
+
+    try:
+        if escritura_diferida.ESCRITURA_DIFERIDA:
+            return await escribir_diferido('autoseguimiento', fila, {"mensaje": "Autoseguimiento registrado"})
+        async with pool.connection() as conn:
+            cur = await conn.execute(SQL_INSERTAR_AUTOSEGUIMIENTO, fila)
+            await resumenes.registrar_async(cur, 'autoseguimiento', fila[0], [(await cur.fetchone())[0]])
+        await invalidar(f"atleta:{fila[0]}")
+        return RespuestaJSON({"mensaje": "Autoseguimiento registrado"})
+    except pg_errors.ForeignKeyViolation:
+        return RespuestaJSON({"error": "Atleta no encontrado"}, 404)
+    except Exception as e:
+        return error_interno(e, "Error en /add_autoseguimiento", "Error interno")
+
+
+# ——— Métricas ———
+class MedirPeticiones:
+    """Latencia de las rutas nativas hasta el inicio de la respuesta, como en
+    los hooks de Flask; las peticiones que caen en la app Flask montada ya las
+    miden esos hooks. La etiqueta usa la sintaxis de Flask (/hrv/<int:id_atleta>)
+    para que las series coincidan en los dos modos."""
+
+    def __init__(self, app):
+        self.app = app
+        self._rutas = {}
+
+    def _ruta(self, path):
+        if path not in self._rutas:
+            self._rutas[path] = re.sub(r'\{(\w+):(\w+)\}', r'<\2:\1>', path)
+        return self._rutas[path]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        inicio = time.perf_counter()
+        respuesta = {}
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                respuesta.update(estado=mensaje["status"], fin=time.perf_counter())
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            ruta = scope.get("route")
+            if isinstance(ruta, Route):
+                metricas.PETICIONES.observar(respuesta.get("fin", time.perf_counter()) - inicio, self._ruta(ruta.path),
+                                             scope["method"], str(respuesta.get("estado", 500)))
+
+
+# ——— Aplicación ———
+@asynccontextmanager
+async def ciclo_de_vida(app):
+    await pool.open()
+    logging.info("Pool async de conexiones a la DB abierto")
+    try:
+        yield
+    finally:
+        # lo encolado se escribe (con el pool psycopg2 de db.py) antes de salir
+        await run_in_threadpool(escritura_diferida.escritor.cerrar)
+        await pool.close()
+
+
+app = Starlette(
+    routes=[
+        Route('/', home, methods=['GET']),
+        Route('/db/pool', estado_pool, methods=['GET']),
+        Route('/atletas', listar_atletas, methods=['GET']),
+        Route('/atletas/buscar', buscar_atletas, methods=['GET']),
+        Route('/atletas/{id_atleta:int}', obtener_atleta, methods=['GET']),
+        Route('/add_hrv', add_hrv, methods=['POST']),
+        Route('/hrv/{id_atleta:int}', get_hrv, methods=['GET']),
+        Route('/hrv_status/{id_atleta:int}', get_hrv_status, methods=['GET']),
+        Route('/add_rpe', add_rpe, methods=['POST']),
+        Route('/rpe_status/{id_atleta:int}', get_rpe_status, methods=['GET']),
+        Route('/add_autoseguimiento', agregar_autoseguimiento, methods=['POST']),
+        # Todo lo demás: la app Flask tal cual
+        Mount('/', app=WSGIMiddleware(flask_app, workers=ASGI_WSGI_HILOS)),
+    ],
+    middleware=[
+        Middleware(MedirPeticiones),
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+    ],
+    lifespan=ciclo_de_vida,
+)
@@ -0,0 +1,90 @@
+"""Latencia de /atletas/buscar (busqueda.buscar) con una plantilla grande.
+
+Añade `--atletas` atletas con nombres y apellidos realistas (con acentos) a la
+base de DATABASE_URL dentro de una transacción que se deshace al terminar, así
+que la base queda como estaba; necesita las migraciones aplicadas (índices de
+la migración 9). Después mide, con la mediana y el p95 de `--repeticiones`,
+búsquedas típicas de autocompletado: prefijos de 1 a 6 letras con y sin
+acentos, apellidos, equipos, disciplinas y, si hay pg_trgm, erratas.
+
+    DATABASE_URL=... python benchmarks/busqueda.py --atletas 100000
+"""
+import argparse
+import io
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import busqueda  # noqa: E402
+from db import conexion  # noqa: E402
+
+NOMBRES = ["Ana", "Andrés", "Ángela", "Beatriz", "Carlos", "Carmen", "Daniel", "Elena", "Fernando", "Gonzalo",
+           "Héctor", "Inés", "Iván", "Javier", "Jesús", "José", "Julia", "Lucía", "Manuel", "María", "Martín",
+           "Mónica", "Nuria", "Óscar", "Pablo", "Raúl", "Rocío", "Sofía", "Tomás", "Verónica"]
+APELLIDOS = ["Álvarez", "Benítez", "Castro", "Díaz", "Domínguez", "Fernández", "García", "Gómez", "González",
+             "Gutiérrez", "Hernández", "Jiménez", "López", "Martín", "Martínez", "Moreno", "Muñoz", "Navarro",
+             "Núñez", "Ortega", "Pérez", "Ramírez", "Ramos", "Rodríguez", "Romero", "Rubio", "Sánchez", "Sanz",
+             "Serrano", "Suárez", "Torres", "Vázquez"]
+DISCIPLINAS = ["Atletismo", "Natación", "Ciclismo", "Triatlón", "Remo", "Halterofilia"]
+CONSULTAS = ["m", "ma", "mar", "mari", "maria", "maría", "ÁNGELA", "jose m", "perez", "núñez",
+             "equipo 03", "natac", "triat", "zzz", "marai", "gonzales"]
+
+
+def sembrar(cur, n, semilla):
+    rnd = random.Random(semilla)
+    vistos = set()
+    buffer = io.StringIO()
+    while len(vistos) < n:
+        nombre = f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}"
+        if len(vistos) >= len(NOMBRES) * len(APELLIDOS) ** 2 // 2:
+            nombre += f" {len(vistos)}"  # más atletas que combinaciones razonables
+        if nombre in vistos:
+            continue
+        vistos.add(nombre)
+        buffer.write(f"{nombre}\t{rnd.choice(DISCIPLINAS)}\tEquipo {rnd.randint(1, 400):03d}\n")
+    buffer.seek(0)
+    cur.copy_expert("COPY atletas (nombre, disciplina, equipo) FROM STDIN", buffer)
+    cur.execute("ANALYZE atletas")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--atletas", type=int, default=100000)
+    parser.add_argument("--repeticiones", type=int, default=50)
+    parser.add_argument("--limite", type=int, default=busqueda.BUSQUEDA_LIMITE)
+    parser.add_argument("--semilla", type=int, default=1)
+    args = parser.parse_args()
+
+    if not os.getenv("DATABASE_URL"):
+        sys.exit("DATABASE_URL no configurada")
+
+    with conexion() as conn:
+        try:
+            with conn.cursor() as cur:
+                inicio = time.perf_counter()
+                sembrar(cur, args.atletas, args.semilla)
+                print(f"{args.atletas} atletas añadidos en {time.perf_counter() - inicio:.1f}s "
+                      f"(se deshacen al terminar)")
+                cur.execute(busqueda.SQL_TRIGRAMAS)
+                print(f"trigramas: {'sí' if cur.fetchone()[0] else 'no (sólo prefijos)'}")
+                print(f"{'consulta':<12}{'filas':>7}{'p50 ms':>9}{'p95 ms':>9}  primer resultado")
+                for q in CONSULTAS:
+                    params = {"q": q, "limite": args.limite, "cursor": (0, None, None)}
+                    tiempos = []
+                    for _ in range(args.repeticiones):
+                        t = time.perf_counter()
+                        filas, _ = busqueda.buscar(cur, params)
+                        tiempos.append((time.perf_counter() - t) * 1000)
+                    p95 = statistics.quantiles(tiempos, n=20)[-1]
+                    primero = f"{filas[0][1]} ({filas[0][2]}, nivel {filas[0][4]})" if filas else "-"
+                    print(f"{q:<12}{len(filas):>7}{statistics.median(tiempos):>9.2f}{p95:>9.2f}  {primero}")
+        finally:
+            conn.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Benchmark de carga reproducible de las rutas reales contra una base sembrada.
+
+Arranca la API (`--modo wsgi|asgi`, los mismos comandos que servidores.py) o
+usa una ya levantada en `--puerto`, y para cada nivel de `--concurrencia`
+lanza ese número de clientes en bucle cerrado (cada uno envía su siguiente
+petición al recibir la anterior, por una conexión keep-alive) durante
+`--duracion` segundos tras `--calentamiento`. La mezcla de rutas es
+configurable:
+
+    add_hrv  POST /add_hrv con una lectura nueva
+    hrv      GET  /hrv/<id>?limite=100 (una página del histórico)
+    atletas  GET  /atletas
+    predict  GET  /predict/<id> (histórico desde la base, modelos en caché
+             mientras el atleta no tenga datos nuevos)
+
+Informa p50/p95/p99 por ruta, rendimiento (peticiones/s) y la memoria RSS del
+servidor (suma del grupo de procesos: workers y pool de predicción) y guarda
+todo en JSON con el commit y los parámetros, para comparar con comparar.py.
+
+    DATABASE_URL=... python benchmarks/sembrar.py --atletas 300 --anos 2
+    DATABASE_URL=... python benchmarks/carga.py --concurrencia 1,8,32 --etiqueta base
+    python benchmarks/comparar.py benchmarks/resultados/base.json benchmarks/resultados/nuevo.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from servidores import RAIZ, arrancar, detener, enviar, peticion, percentil
+
+MEZCLA = "hrv=40,atletas=25,add_hrv=30,predict=5"
+PAGINA = os.sysconf("SC_PAGE_SIZE")
+
+
+def leer_mezcla(texto):
+    mezcla = {}
+    for parte in texto.split(","):
+        nombre, _, peso = parte.partition("=")
+        if nombre not in ("add_hrv", "hrv", "atletas", "predict"):
+            raise argparse.ArgumentTypeError(f"ruta desconocida: {nombre}")
+        mezcla[nombre] = float(peso or 1)
+    return mezcla
+
+
+def elegir(rnd, mezcla, atletas, atletas_predict):
+    nombre = rnd.choices(list(mezcla), weights=list(mezcla.values()))[0]
+    if nombre == "add_hrv":
+        return nombre, peticion("POST", "/add_hrv",
+                                {"id_atleta": rnd.choice(atletas), "hrv": round(rnd.uniform(40, 90), 1)})
+    if nombre == "hrv":
+        return nombre, peticion("GET", f"/hrv/{rnd.choice(atletas)}?limite=100&orden=desc")
+    if nombre == "atletas":
+        return nombre, peticion("GET", "/atletas")
+    return nombre, peticion("GET", f"/predict/{rnd.choice(atletas_predict)}")
+
+
+# ——— Memoria del servidor ———
+def rss_grupo(pgid):
+    """RSS (bytes) de todos los procesos del grupo `pgid`."""
+    total = 0
+    for entrada in os.listdir("/proc"):
+        if not entrada.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entrada}/stat") as f:
+                campos = f.read().rsplit(")", 1)[1].split()
+            if int(campos[2]) != pgid:
+                continue
+            with open(f"/proc/{entrada}/statm") as f:
+                total += int(f.read().split()[1]) * PAGINA
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+
+async def muestrear_rss(pgid, muestras, fin):
+    while time.monotonic() < fin:
+        muestras.append(rss_grupo(pgid))
+        await asyncio.sleep(0.25)
+
+
+# ——— Carga en bucle cerrado ———
+async def cliente(puerto, rnd, args, mezcla, atletas, atletas_predict, medir_desde, fin, latencias, errores):
+    conexion = None
+    while time.monotonic() < fin:
+        nombre, datos = elegir(rnd, mezcla, atletas, atletas_predict)
+        inicio = time.monotonic()
+        try:
+            conexion, estado, seguir, _ = await enviar(conexion, puerto, datos, args.timeout)
+            if not seguir:
+                conexion[1].close()
+                conexion = None
+            if inicio < medir_desde:
+                continue
+            if estado >= 400:
+                clave = f"{nombre}:{estado}"
+                errores[clave] = errores.get(clave, 0) + 1
+            else:
+                latencias.setdefault(nombre, []).append(time.monotonic() - inicio)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            if inicio >= medir_desde:
+                clave = f"{nombre}:{type(e).__name__}"
+                errores[clave] = errores.get(clave, 0) + 1
+            if conexion is not None:
+                conexion[1].close()
+            conexion = None
+    if conexion is not None:
+        conexion[1].close()
+
+
+async def nivel(puerto, pgid, concurrencia, args, mezcla, atletas):
+    rnd = random.Random(args.semilla * 1000 + concurrencia)
+    # /predict reentrena si el atleta tiene lecturas nuevas: un subconjunto
+    # fijo y pequeño mantiene el coste comparable entre ejecuciones
+    atletas_predict = rnd.sample(atletas, min(len(atletas), args.atletas_predict))
+    ahora = time.monotonic()
+    medir_desde = ahora + args.calentamiento
+    fin = medir_desde + args.duracion
+    latencias, errores, muestras = {}, {}, []
+
+    tareas = [cliente(puerto, random.Random(rnd.random()), args, mezcla, atletas, atletas_predict,
+                      medir_desde, fin, latencias, errores) for _ in range(concurrencia)]
+    if pgid:
+        tareas.append(muestrear_rss(pgid, muestras, fin))
+    await asyncio.gather(*tareas)
+    transcurrido = time.monotonic() - medir_desde
+
+    todas = [x for valores in latencias.values() for x in valores]
+    resultado = {
+        "peticiones": len(todas),
+        "rps": round(len(todas) / transcurrido, 1),
+        "errores": errores,
+        "rutas": {},
+    }
+    for nombre, valores in sorted(latencias.items()) + [("total", todas)]:
+        if valores:
+            resultado["rutas"][nombre] = {
+                "n": len(valores),
+                "rps": round(len(valores) / transcurrido, 1),
+                "p50_ms": round(percentil(valores, 50) * 1000, 2),
+                "p95_ms": round(percentil(valores, 95) * 1000, 2),
+                "p99_ms": round(percentil(valores, 99) * 1000, 2),
+            }
+    if muestras:
+        resultado["rss_max_mb"] = round(max(muestras) / 2 ** 20, 1)
+        resultado["rss_final_mb"] = round(muestras[-1] / 2 ** 20, 1)
+    return resultado
+
+
+def commit_actual():
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True,
+                             check=True).stdout.strip()
+        sucio = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=RAIZ,
+                               capture_output=True, text=True).stdout.strip()
+        return sha + ("-sucio" if sucio else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modo", choices=("wsgi", "asgi"), default="wsgi")
+    parser.add_argument("--puerto", type=int, help="usar un servidor ya levantado en 127.0.0.1:PUERTO")
+    parser.add_argument("--pid", type=int, help="con --puerto: grupo de procesos del servidor para medir RSS")
+    parser.add_argument("--concurrencia", default="1,8,32", help="niveles de clientes simultáneos, separados por comas")
+    parser.add_argument("--duracion", type=float, default=30, help="segundos medidos por nivel")
+    parser.add_argument("--calentamiento", type=float, default=5, help="segundos sin medir al inicio de cada nivel")
+    parser.add_argument("--mezcla", type=leer_mezcla, default=leer_mezcla(MEZCLA), help=f"pesos (def. {MEZCLA})")
+    parser.add_argument("--atletas-predict", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--etiqueta", help="nombre del resultado (por defecto el commit)")
+    parser.add_argument("--salida", help="fichero JSON (por defecto benchmarks/resultados/<etiqueta>.json)")
+    args = parser.parse_args()
+
+    if args.puerto is None and not os.getenv("DATABASE_URL"):
+        sys.exit("DATABASE_URL no configurada")
+
+    commit = commit_actual()
+    etiqueta = args.etiqueta or commit or datetime.now().strftime("%Y%m%d-%H%M%S")
+    salida = args.salida or os.path.join(RAIZ, "benchmarks", "resultados", f"{etiqueta}.json")
+
+    proceso = None
+    if args.puerto is None:
+        args.puerto = 8890
+        inicio = time.monotonic()
+        proceso, atletas = arrancar(args.modo, args.puerto)
+        arranque_s = time.monotonic() - inicio
+        pgid = proceso.pid
+    else:
+        from urllib.request import urlopen
+        with urlopen(f"http://127.0.0.1:{args.puerto}/atletas", timeout=10) as r:
+            atletas = [a["id"] for a in json.loads(r.read())]
+        arranque_s, pgid = None, args.pid
+
+    resultados = {
+        "etiqueta": etiqueta,
+        "commit": commit,
+        "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "entorno": {"python": platform.python_version(), "cpus": os.cpu_count(), "sistema": platform.platform()},
+        "parametros": {k: v for k, v in vars(args).items() if k not in ("salida", "etiqueta", "pid")},
+        "modo": args.modo if proceso else "externo",
+        "atletas": len(atletas),
+        "arranque_s": round(arranque_s, 2) if arranque_s is not None else None,
+        "rss_arranque_mb": round(rss_grupo(pgid) / 2 ** 20, 1) if pgid else None,
+        "niveles": {},
+    }
+    try:
+        if not atletas:
+            sys.exit("No hay atletas: siembre la base con benchmarks/sembrar.py")
+        for concurrencia in (int(c) for c in args.concurrencia.split(",")):
+            r = asyncio.run(nivel(args.puerto, pgid, concurrencia, args, args.mezcla, atletas))
+            resultados["niveles"][str(concurrencia)] = r
+            print(f"concurrencia={concurrencia} rps={r['rps']} errores={r['errores']} "
+                  f"rss_max_mb={r.get('rss_max_mb')}")
+            for nombre, m in r["rutas"].items():
+                print(f"  {nombre:<10}{m['n']:>8}{m['p50_ms']:>10}{m['p95_ms']:>10}{m['p99_ms']:>10}  ms p50/p95/p99")
+    finally:
+        if proceso is not None:
+            detener(proceso)
+
+    os.makedirs(os.path.dirname(salida), exist_ok=True)
+    with open(salida, "w") as f:
+        json.dump(resultados, f, indent=2, ensure_ascii=False)
+    print(f"Resultados en {salida}")
+
+
+if __name__ == "__main__":
+    main()
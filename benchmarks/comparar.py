@@ -0,0 +1,86 @@
+"""Compara dos resultados de benchmarks/carga.py y señala las regresiones.
+
+Para cada nivel de concurrencia y ruta presentes en ambos muestra p50/p95/p99
+antes y después, la variación y el rendimiento; marca con «!!» los p95/p99 que
+empeoran, el rendimiento que cae o la RSS que crece más de `--umbral` por
+ciento. Sale con código 1 si hay alguna regresión, para usarlo en CI.
+
+    python benchmarks/comparar.py benchmarks/resultados/base.json benchmarks/resultados/nuevo.json
+"""
+import argparse
+import json
+import sys
+
+
+def variacion(antes, despues):
+    if not antes:
+        return None
+    return (despues - antes) / antes * 100
+
+
+def fila(nombre, antes, despues, umbral, mayor_es_mejor=False):
+    """Línea de la tabla y si es una regresión."""
+    cambio = variacion(antes, despues)
+    if cambio is None:
+        return f"  {nombre:<16}{antes!s:>10}{despues!s:>10}{'':>9}", False
+    regresion = (-cambio if mayor_es_mejor else cambio) > umbral
+    return f"  {nombre:<16}{antes:>10}{despues:>10}{cambio:>+8.1f}%{'  !!' if regresion else ''}", regresion
+
+
+def comparar(base, nuevo, umbral):
+    lineas = [f"{base.get('etiqueta')} ({base.get('commit')}) -> {nuevo.get('etiqueta')} ({nuevo.get('commit')})"]
+    regresiones = 0
+    for campo in ("arranque_s", "rss_arranque_mb"):
+        if base.get(campo) is not None and nuevo.get(campo) is not None:
+            linea, r = fila(campo, base[campo], nuevo[campo], umbral)
+            lineas.append(linea)
+            regresiones += r
+
+    for concurrencia, b in base["niveles"].items():
+        n = nuevo["niveles"].get(concurrencia)
+        if n is None:
+            continue
+        lineas.append(f"concurrencia={concurrencia}")
+        linea, r = fila("rps", b["rps"], n["rps"], umbral, mayor_es_mejor=True)
+        lineas.append(linea)
+        regresiones += r
+        if "rss_max_mb" in b and "rss_max_mb" in n:
+            linea, r = fila("rss_max_mb", b["rss_max_mb"], n["rss_max_mb"], umbral)
+            lineas.append(linea)
+            regresiones += r
+        for ruta, mb in b["rutas"].items():
+            mn = n["rutas"].get(ruta)
+            if mn is None:
+                continue
+            for p in ("p50_ms", "p95_ms", "p99_ms"):
+                # la mediana se informa pero no se marca: en rutas de ms el ruido pesa más
+                linea, r = fila(f"{ruta} {p}", mb[p], mn[p], umbral if p != "p50_ms" else float("inf"))
+                lineas.append(linea)
+                regresiones += r
+        if n.get("errores"):
+            lineas.append(f"  errores: {n['errores']}")
+    return lineas, regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("nuevo")
+    parser.add_argument("--umbral", type=float, default=10, help="porcentaje a partir del cual se marca regresión")
+    args = parser.parse_args(argv)
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.nuevo) as f:
+        nuevo = json.load(f)
+    if base.get("parametros", {}).get("mezcla") != nuevo.get("parametros", {}).get("mezcla"):
+        print("Aviso: las mezclas de rutas son distintas", file=sys.stderr)
+
+    lineas, regresiones = comparar(base, nuevo, args.umbral)
+    print("\n".join(lineas))
+    print(f"{regresiones} regresiones por encima del {args.umbral:g}%")
+    return 1 if regresiones else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
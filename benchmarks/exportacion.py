@@ -0,0 +1,111 @@
+"""Exportación columnar (exportacion.py) frente a leer la tabla entera y volcarla en JSON.
+
+Para una tabla de la base de DATABASE_URL (hrv por defecto) mide, cada
+variante en un proceso aparte para que el pico de memoria sea sólo suyo:
+
+- json: fetchall de la tabla entera y un dict por fila en JSON, como al
+  juntar las respuestas de las rutas (la memoria crece con la tabla)
+- parquet / arrow / csv con exportacion.escribir_trozos y `--trozo` filas por
+  trozo (la memoria depende del trozo, no de la tabla)
+
+y, de cada fichero, lo que tarda en cargarse en pandas. Da filas/s, tamaño,
+el aumento del RSS máximo del proceso y la carga.
+
+    DATABASE_URL=... python benchmarks/exportacion.py --tabla hrv --trozo 10000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import exportacion  # noqa: E402
+from db import conexion  # noqa: E402
+
+VARIANTES = ('json', 'parquet', 'arrow', 'csv')
+
+
+def rss_max_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def exportar_json(conn, tabla, ruta):
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT * FROM {tabla}")
+        nombres = [d.name for d in cur.description]
+        filas = cur.fetchall()
+    with open(ruta, 'w') as f:
+        json.dump([dict(zip(nombres, fila)) for fila in filas], f, default=str)
+    return len(filas)
+
+
+def cargar(variante, ruta):
+    import pandas as pd
+    import pyarrow as pa
+    if variante == 'json':
+        return pd.read_json(ruta)
+    if variante == 'parquet':
+        return pd.read_parquet(ruta)
+    if variante == 'arrow':
+        return pa.ipc.open_file(pa.memory_map(ruta)).read_all().to_pandas()
+    return pd.read_csv(ruta, compression='gzip')
+
+
+def hijo(args):
+    """Una variante en este proceso; imprime su resultado en JSON."""
+    exportacion.EXPORTACION_TROZO = args.trozo
+    ruta = os.path.join(args.directorio, f"{args.tabla}.{args.variante}")
+    import pandas  # noqa: F401  (importado antes de medir, como en la app)
+    import pyarrow  # noqa: F401
+    base = rss_max_mb()
+    inicio = time.perf_counter()
+    with conexion() as conn:
+        if args.variante == 'json':
+            filas = exportar_json(conn, args.tabla, ruta)
+        else:
+            cursor, cols = exportacion.abrir(conn, args.tabla, {"atletas": None, "equipo": None,
+                                                                "desde": None, "hasta": None})
+            with open(ruta, 'wb') as destino:
+                filas = sum(exportacion.escribir_trozos(cursor, cols, args.variante, destino))
+            cursor.close()
+    segundos = time.perf_counter() - inicio
+    memoria = rss_max_mb() - base
+    inicio = time.perf_counter()
+    cargar(args.variante, ruta)
+    print(json.dumps({"filas": filas, "segundos": segundos, "mb_rss": memoria, "bytes": os.path.getsize(ruta),
+                      "carga_s": time.perf_counter() - inicio}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tabla", default="hrv", choices=list(exportacion.TABLAS_EXPORTACION))
+    parser.add_argument("--trozo", type=int, default=exportacion.EXPORTACION_TROZO)
+    parser.add_argument("--variantes", nargs="+", default=list(VARIANTES), choices=VARIANTES)
+    parser.add_argument("--variante", help=argparse.SUPPRESS)
+    parser.add_argument("--directorio", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if not os.getenv("DATABASE_URL"):
+        sys.exit("DATABASE_URL no configurada")
+    if args.variante:
+        return hijo(args)
+
+    print(f"tabla: {args.tabla}  trozo: {args.trozo} filas")
+    print(f"{'variante':<10}{'filas':>9}{'filas/s':>10}{'MB':>8}{'+RSS MB':>9}{'carga s':>9}")
+    with tempfile.TemporaryDirectory() as directorio:
+        for variante in args.variantes:
+            salida = subprocess.run([sys.executable, __file__, "--tabla", args.tabla, "--trozo", str(args.trozo),
+                                     "--variante", variante, "--directorio", directorio],
+                                    check=True, capture_output=True, text=True).stdout
+            r = json.loads(salida.strip().splitlines()[-1])
+            print(f"{variante:<10}{r['filas']:>9}{r['filas'] / r['segundos']:>10.0f}{r['bytes'] / 2**20:>8.1f}"
+                  f"{r['mb_rss']:>9.1f}{r['carga_s']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Coste de ampliar los clasificadores con días nuevos frente a reentrenarlos.
+
+Para `--atletas` atletas de la base (p. ej. la sembrada con sembrar.py) y, si
+se indica, el grupo de su disciplina, entrena con el histórico sin los últimos
+`--dias` días y después lo pone al día de dos formas: reentrenando desde cero
+(lo que hacía /predict con cada lectura nueva) y ampliando el estado guardado
+(prediccion.clasificadores). Informa el tiempo de cada una, la concordancia
+de las predicciones de fatiga y la exactitud de XGBoost de ambas.
+
+    DATABASE_URL=... python benchmarks/incremental.py --atletas 10 --dias 1,7 --disciplina
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# los estados del benchmark no se mezclan con la caché de modelos del servidor
+os.environ.setdefault("MODEL_CACHE_DIR", tempfile.mkdtemp(prefix="incremental-"))
+
+import numpy as np  # noqa: E402
+
+import prediccion  # noqa: E402
+from ai_module import resolver_atletas  # noqa: E402
+from db import conexion  # noqa: E402
+
+
+def cortar(df, dias, por_atleta):
+    """Histórico sin los últimos `dias` días (de cada atleta si `por_atleta`)."""
+    if not por_atleta:
+        return df.iloc[:-dias]
+    return df[df.groupby("id_atleta").cumcount(ascending=False) >= dias]
+
+
+def medir(clave, df, dias, por_atleta):
+    prediccion.clasificadores(clave, cortar(df, dias, por_atleta), por_atleta)
+
+    inicio = time.perf_counter()
+    completo = prediccion.entrenar_clasificadores(df)
+    ms_completo = (time.perf_counter() - inicio) * 1000
+    inicio = time.perf_counter()
+    ampliado = prediccion.clasificadores(clave, df, por_atleta)
+    ms_ampliado = (time.perf_counter() - inicio) * 1000
+
+    X = df[prediccion.FEATURES_FATIGA].to_numpy()
+    concordancia = float(np.mean(completo["rf"].predict(X) == ampliado["rf"].predict(X)))
+    return {
+        "filas": len(df), "ms_completo": ms_completo, "ms_ampliado": ms_ampliado,
+        "concordancia": concordancia,
+        "exactitud_completo": completo["exactitud_xgb"], "exactitud_ampliado": ampliado["exactitud_xgb"],
+    }
+
+
+def resumir(nombre, dias, medidas):
+    completo = statistics.median(m["ms_completo"] for m in medidas)
+    ampliado = statistics.median(m["ms_ampliado"] for m in medidas)
+    exactitudes = [(m["exactitud_completo"], m["exactitud_ampliado"]) for m in medidas
+                   if m["exactitud_completo"] is not None and m["exactitud_ampliado"] is not None]
+    exactitud = ("{:.3f} / {:.3f}".format(*np.mean(exactitudes, axis=0)) if exactitudes else "-")
+    print(f"{nombre:<12}{dias:>5}{len(medidas):>5}{statistics.median(m['filas'] for m in medidas):>8.0f}"
+          f"{completo:>12.1f}{ampliado:>12.1f}{completo / ampliado:>8.1f}x"
+          f"{statistics.fmean(m['concordancia'] for m in medidas):>8.3f}  {exactitud}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--atletas", type=int, default=10)
+    parser.add_argument("--dias", default="1,7", help="días nuevos por actualización, separados por comas")
+    parser.add_argument("--disciplina", action="store_true", help="medir también el modelo por disciplina")
+    args = parser.parse_args()
+
+    if not os.getenv("DATABASE_URL"):
+        sys.exit("DATABASE_URL no configurada")
+    logging.getLogger().setLevel(logging.WARNING)
+
+    ids = resolver_atletas()[:args.atletas]
+    historial = prediccion.con_historial_suficiente(prediccion.cargar_historial(ids))
+    print(f"{'clave':<12}{'días':>5}{'n':>5}{'filas':>8}{'completo ms':>12}{'ampliado ms':>12}{'':>9}"
+          f"{'concord.':>8}  exactitud xgb completo / ampliado")
+    for dias in (int(d) for d in args.dias.split(",")):
+        medidas = [medir(f"benchmark:{id_atleta}:{dias}", df.reset_index(drop=True), dias, False)
+                   for id_atleta, df in historial.groupby("id_atleta")]
+        resumir("atleta", dias, medidas)
+
+        if args.disciplina:
+            medidas = []
+            for disciplina in disciplinas(ids):
+                df = prediccion.con_historial_suficiente(
+                    prediccion.cargar_historial(resolver_atletas(disciplina=disciplina)))
+                medidas.append(medir(f"benchmark:disciplina:{disciplina}:{dias}", df.reset_index(drop=True),
+                                     dias, True))
+            resumir("disciplina", dias, medidas)
+
+
+def disciplinas(ids):
+    """Disciplinas de los atletas medidos."""
+    with conexion() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT DISTINCT disciplina FROM atletas WHERE id_atleta = ANY(%s) AND disciplina IS NOT NULL"
+                        " ORDER BY 1", (ids,))
+            return [r[0] for r in cur.fetchall()]
+
+
+if __name__ == "__main__":
+    main()
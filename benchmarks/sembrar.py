@@ -0,0 +1,170 @@
+"""Siembra un club sintético en la base de datos de DATABASE_URL para los benchmarks.
+
+Aplica las migraciones (el mismo esquema que `flask --app app init-db`) y carga
+con COPY `--atletas` atletas repartidos en equipos, con `--anos` años de
+histórico diario: HRV, entrenamientos con su RPE, autoseguimiento y algún
+parte médico, creando antes las particiones mensuales de todo el rango.
+Después materializa carga_diaria, hrv_baseline y los resúmenes semanales y
+mensuales como harían las escrituras por la API y ejecuta ANALYZE. Con la misma `--semilla` los datos son
+idénticos, así que dos ejecuciones del benchmark parten del mismo estado.
+
+    DATABASE_URL=postgresql://localhost/bench python benchmarks/sembrar.py --atletas 300 --anos 2
+
+Se niega a sembrar sobre una base con atletas salvo con `--reiniciar`, que
+VACÍA todas las tablas de datos: úsese sólo con una base de pruebas.
+"""
+import argparse
+import csv
+import io
+import logging
+import math
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import carga_entrenamiento  # noqa: E402
+import hrv_baseline  # noqa: E402
+import migrations  # noqa: E402
+import particiones  # noqa: E402
+import resumenes  # noqa: E402
+from db import conexion  # noqa: E402
+
+DISCIPLINAS = ["Atletismo", "Natación", "Ciclismo", "Triatlón", "Remo", "Judo"]
+TIPOS = [("Fuerza", "Media"), ("Resistencia", "Baja"), ("Series", "Alta"), ("Técnica", "Baja"), ("Competición", "Alta")]
+DIAGNOSTICOS = ["Sobrecarga isquiotibiales", "Tendinopatía rotuliana", "Esguince de tobillo", "Lumbalgia",
+                "Fascitis plantar"]
+
+# Tablas que escribe la siembra, en orden de borrado
+TABLAS = ["resumen_semana", "resumen_mes", "carga_diaria", "hrv_baseline", "hrv", "rpe", "entrenamiento",
+          "autoseguimiento", "medico", "atletas"]
+
+
+def copiar(cur, tabla, columnas, filas):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(filas)
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {tabla} ({', '.join(columnas)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def generar_atleta(rnd, id_atleta, inicio, dias, filas):
+    """Histórico de un atleta: la HRV baja y la fatiga sube tras días de carga alta,
+    para que los modelos de predicción tengan algo que aprender."""
+    base_hrv = rnd.uniform(45, 85)
+    carga_reciente = 0.0
+    for d in range(dias):
+        fecha = inicio + timedelta(days=d)
+        carga = 0.0
+        if rnd.random() < 5 / 7:
+            tipo, intensidad = rnd.choice(TIPOS)
+            duracion = rnd.randint(30, 120)
+            rpe = max(1, min(10, round(duracion / 15 + rnd.gauss(0, 1.5))))
+            carga = duracion * rpe
+            filas["entrenamiento"].append((id_atleta, tipo, duracion, intensidad, "", fecha))
+            filas["rpe"].append((id_atleta, fecha, rpe, ""))
+        carga_reciente = 0.7 * carga_reciente + 0.3 * carga
+
+        if rnd.random() < 0.9:
+            hrv = base_hrv * math.exp(rnd.gauss(0, 0.08) - carga_reciente / 6000)
+            filas["hrv"].append((id_atleta, fecha, round(hrv, 1)))
+        if rnd.random() < 0.8:
+            fatiga = min(3, int(carga_reciente / 250 + rnd.random()))
+            registro = datetime.combine(fecha, datetime.min.time()) + timedelta(minutes=rnd.randint(360, 540))
+            filas["autoseguimiento"].append((
+                id_atleta, registro, rnd.randint(1, 5), round(rnd.uniform(5, 9.5), 1), fatiga,
+                rnd.randint(1, 5), rnd.randint(1, 5), rnd.randint(1, 5), "",
+            ))
+        if rnd.random() < 0.004 + carga_reciente / 200000:
+            filas["medico"].append((
+                id_atleta, fecha, round(rnd.uniform(36, 37.8), 1), "120/80", rnd.choice(DIAGNOSTICOS), "Reposo", "",
+            ))
+
+
+COLUMNAS = {
+    "entrenamiento": ("id_atleta", "tipo_entrenamiento", "duracion", "intensidad", "observaciones", "fecha"),
+    "rpe": ("id_atleta", "fecha", "rpe", "notas"),
+    "hrv": ("id_atleta", "fecha", "hrv"),
+    "autoseguimiento": ("id_atleta", "fecha_registro", "calidad_sueno", "horas_sueno", "fatiga", "dolor_muscular",
+                        "estres", "estado_animo", "comentarios"),
+    "medico": ("atleta_id", "fecha", "temperatura", "presion_arterial", "diagnostico", "tratamiento", "observaciones"),
+}
+
+
+def sembrar(conn, atletas, anos, equipos, semilla, bloque=50):
+    rnd = random.Random(semilla)
+    dias = int(anos * 365)
+    hoy = date.today()
+    inicio = hoy - timedelta(days=dias - 1)
+    conteo = dict.fromkeys(COLUMNAS, 0)
+
+    with conn.cursor() as cur:
+        copiar(cur, "atletas", ("nombre", "fecha_nacimiento", "disciplina", "sexo", "equipo"), [
+            (f"Atleta {i:04d}", date(rnd.randint(1990, 2008), rnd.randint(1, 12), rnd.randint(1, 28)),
+             rnd.choice(DISCIPLINAS), rnd.choice("MF"), f"Equipo {i % equipos + 1:02d}")
+            for i in range(1, atletas + 1)
+        ])
+        cur.execute("SELECT id_atleta FROM atletas ORDER BY id_atleta")
+        ids = [fila[0] for fila in cur.fetchall()]
+        for tabla in particiones.TABLAS:
+            particiones.asegurar_rango(cur, tabla, inicio, hoy)
+
+        # Por bloques de atletas para no tener todo el histórico en memoria
+        for i in range(0, len(ids), bloque):
+            filas = {tabla: [] for tabla in COLUMNAS}
+            for id_atleta in ids[i:i + bloque]:
+                generar_atleta(rnd, id_atleta, inicio, dias, filas)
+            for tabla, columnas in COLUMNAS.items():
+                copiar(cur, tabla, columnas, filas[tabla])
+                conteo[tabla] += len(filas[tabla])
+
+        carga_entrenamiento.recalcular_pendientes(cur)
+        hrv_baseline.recalcular_pendientes(cur)
+        resumenes.recalcular_pendientes(cur)
+    conn.commit()
+
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE")
+    finally:
+        conn.autocommit = False
+    conteo["atletas"] = len(ids)
+    return conteo
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--atletas", type=int, default=300)
+    parser.add_argument("--anos", type=float, default=2)
+    parser.add_argument("--equipos", type=int, default=12)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--reiniciar", action="store_true", help="vaciar las tablas de datos antes de sembrar")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if not os.getenv("DATABASE_URL"):
+        sys.exit("DATABASE_URL no configurada")
+
+    with conexion() as conn:
+        migrations.aplicar(conn)
+        with conn.cursor() as cur:
+            cur.execute("SELECT EXISTS (SELECT 1 FROM atletas)")
+            hay_datos = cur.fetchone()[0]
+            if hay_datos and not args.reiniciar:
+                sys.exit("La base de datos ya tiene atletas; use --reiniciar para vaciarla (¡borra los datos!)")
+            if args.reiniciar:
+                cur.execute(f"TRUNCATE {', '.join(TABLAS)} RESTART IDENTITY CASCADE")
+        conn.commit()
+
+        inicio = time.monotonic()
+        conteo = sembrar(conn, args.atletas, args.anos, args.equipos, args.semilla)
+    logging.info("Siembra completada en %.1fs: %s", time.monotonic() - inicio,
+                 ", ".join(f"{tabla}={n}" for tabla, n in conteo.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
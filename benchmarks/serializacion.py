@@ -0,0 +1,106 @@
+"""Coste de serializar 10k filas de los listados antes y después del proveedor JSON.
+
+Para cada forma de fila de las rutas de listado (historial de HRV y de RPE,
+/atletas y la tendencia de /predict) genera `--filas` tuplas como las que
+devuelve el cursor y mide, con la mediana de `--repeticiones`:
+
+- antes: dicts por fila + el proveedor JSON por defecto de Flask (jsonify de siempre)
+- proveedor: dicts por fila + serializacion.ProveedorJSON (JSON_MOTOR)
+- columns: las tuplas tal cual con serializacion.cuerpo_columnas (?format=columns)
+
+No necesita base de datos. Los tiempos se dan en ms por 10k filas.
+
+    JSON_MOTOR=orjson python benchmarks/serializacion.py --filas 10000 --json serializacion.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd  # noqa: E402
+from flask import Flask  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+
+import historial  # noqa: E402
+import serializacion  # noqa: E402
+from ai_module import COLUMNAS_TENDENCIA  # noqa: E402
+from app import COLUMNAS_ATLETA, fila_atleta, fila_hrv, fila_rpe  # noqa: E402
+
+
+def generar(n, semilla):
+    """Filas de cada listado: (nombres de columna, tuplas, función fila -> dict)."""
+    rnd = random.Random(semilla)
+    inicio = date.today() - timedelta(days=n)
+    dias = [inicio + timedelta(days=i) for i in range(n)]
+    return {
+        "hrv": (historial.nombres_columnas(['hrv']),
+                [(d, i, round(rnd.gauss(70, 8), 1)) for i, d in enumerate(dias)], fila_hrv),
+        "rpe": (historial.nombres_columnas(['rpe', 'notas']),
+                [(d, i, rnd.randint(1, 10), rnd.choice([None, "Series en pista"])) for i, d in enumerate(dias)],
+                fila_rpe),
+        "atletas": (COLUMNAS_ATLETA,
+                    [(i, f"Atleta {i:05d}", rnd.choice(["Atletismo", "Natación", "Ciclismo"])) for i in range(n)],
+                    fila_atleta),
+        "tendencia": (COLUMNAS_TENDENCIA,
+                      [(pd.Timestamp(d), rnd.uniform(0, 600)) for d in dias],
+                      lambda t: dict(zip(COLUMNAS_TENDENCIA, t))),
+    }
+
+
+def medir(fn, repeticiones):
+    tiempos, tamano = [], 0
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        tamano = len(fn())
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos), tamano
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, default=10000)
+    parser.add_argument("--repeticiones", type=int, default=15)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--json", help="guardar los resultados en este fichero")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    antes = DefaultJSONProvider(app)
+    proveedor = serializacion.ProveedorJSON(app)
+    escala = 10000 / args.filas * 1000  # segundos -> ms por 10k filas
+
+    resultados = {}
+    with app.app_context():
+        for listado, (nombres, filas, a_dict) in generar(args.filas, args.semilla).items():
+            variantes = {
+                "antes": lambda: antes.response([a_dict(f) for f in filas]).get_data(),
+                "proveedor": lambda: proveedor.response([a_dict(f) for f in filas]).get_data(),
+                "columns": lambda: serializacion.cuerpo_columnas(nombres, filas),
+            }
+            resultados[listado] = {}
+            for variante, fn in variantes.items():
+                segundos, tamano = medir(fn, args.repeticiones)
+                resultados[listado][variante] = {"ms_10k": round(segundos * escala, 2), "bytes": tamano}
+
+    print(f"motor: {serializacion.motor()}  filas: {args.filas}  (ms por 10k filas)")
+    print(f"{'listado':<12}{'antes':>10}{'proveedor':>11}{'columns':>10}{'x prov.':>9}{'x columns':>11}"
+          f"{'KB antes':>10}{'KB columns':>12}")
+    for listado, r in resultados.items():
+        base = r["antes"]["ms_10k"]
+        print(f"{listado:<12}{base:>10}{r['proveedor']['ms_10k']:>11}{r['columns']['ms_10k']:>10}"
+              f"{base / r['proveedor']['ms_10k']:>8.1f}x{base / r['columns']['ms_10k']:>10.1f}x"
+              f"{r['antes']['bytes'] / 1024:>10.0f}{r['columns']['bytes'] / 1024:>12.0f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"parametros": vars(args), "motor": serializacion.motor(), "listados": resultados}, f,
+                      indent=2)
+
+
+if __name__ == "__main__":
+    main()
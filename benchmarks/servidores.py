@@ -0,0 +1,234 @@
+"""Carga comparada: modo WSGI (gunicorn, start.sh) frente a modo ASGI (uvicorn asgi:app).
+
+Levanta cada servidor contra la misma base de datos y simula `--clientes`
+móviles con conexión keep-alive que hacen una petición y quedan ociosos
+`--pausa` segundos (con jitter), durante `--duracion` segundos. Con `--lentos`
+se añaden clientes que descargan el histórico completo de HRV leyendo muy
+despacio (retienen una conexión de DB mientras dura la respuesta).
+Un cliente cuya conexión keep-alive cerró el servidor reconecta y reintenta;
+esas reconexiones se cuentan aparte.
+
+    DATABASE_URL=... python benchmarks/servidores.py --clientes 2000 --duracion 30
+
+El cliente es HTTP/1.1 mínimo sobre asyncio para que el generador de carga no
+sea el cuello de botella. Necesita gunicorn, uvicorn y las dependencias de
+asgi.py; la base de datos debe tener atletas con lecturas (p. ej. tras una carga
+con /add_hrv/bulk).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVIDORES = {
+    "wsgi": ["gunicorn", "--bind", "127.0.0.1:{puerto}", "--workers", "1", "--threads", "8",
+             "--timeout", "120", "app:app"],
+    "asgi": ["uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", "{puerto}", "--timeout-keep-alive", "75",
+             "--no-access-log"],
+}
+
+
+def arrancar(modo, puerto):
+    comando = [parte.format(puerto=puerto) for parte in SERVIDORES[modo]]
+    proceso = subprocess.Popen(comando, cwd=RAIZ, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               start_new_session=True)
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{puerto}/atletas", timeout=2) as r:
+                return proceso, [a["id"] for a in json.loads(r.read())]
+        except OSError:
+            time.sleep(0.5)
+    detener(proceso)
+    raise RuntimeError(f"El servidor {modo} no arrancó")
+
+
+def detener(proceso):
+    try:
+        os.killpg(proceso.pid, signal.SIGTERM)
+        proceso.wait(timeout=30)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(proceso.pid, signal.SIGKILL)
+
+
+# ——— Cliente HTTP/1.1 mínimo ———
+async def leer_respuesta(lector, lento=False):
+    cabecera = await lector.readuntil(b"\r\n\r\n")
+    estado = int(cabecera.split(b" ", 2)[1])
+    cabeceras = {}
+    for linea in cabecera.split(b"\r\n")[1:]:
+        if b":" in linea:
+            nombre, valor = linea.split(b":", 1)
+            cabeceras[nombre.strip().lower()] = valor.strip().lower()
+
+    if b"content-length" in cabeceras:
+        await lector.readexactly(int(cabeceras[b"content-length"]))
+    elif cabeceras.get(b"transfer-encoding") == b"chunked":
+        while True:
+            tamano = int((await lector.readuntil(b"\r\n")).split(b";")[0], 16)
+            await lector.readexactly(tamano + 2)
+            if tamano == 0:
+                break
+            if lento:
+                await asyncio.sleep(0.5)
+    else:
+        await lector.read()
+    return estado, cabeceras.get(b"connection") != b"close"
+
+
+def peticion(metodo, ruta, cuerpo=None):
+    datos = json.dumps(cuerpo).encode() if cuerpo is not None else b""
+    return (f"{metodo} {ruta} HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(datos)}\r\n\r\n").encode() + datos
+
+
+def elegir(atletas, escrituras):
+    a = random.choice(atletas)
+    if random.random() < escrituras:
+        return "add_hrv", peticion("POST", "/add_hrv", {"id_atleta": a, "hrv": round(random.uniform(30, 90), 1)})
+    ruta = random.choice((
+        ("atleta", f"/atletas/{a}"),
+        ("hrv_pagina", f"/hrv/{a}?limite=50&orden=desc"),
+        ("hrv_status", f"/hrv_status/{a}"),
+        ("rpe_status", f"/rpe_status/{a}"),
+    ))
+    return ruta[0], peticion("GET", ruta[1])
+
+
+async def enviar(conexion, puerto, datos, timeout):
+    """Envía por la conexión keep-alive; si el servidor ya la había cerrado por
+    inactividad reconecta y reintenta una vez, como haría un cliente HTTP real."""
+    reutilizada = conexion is not None
+    reconectada = False
+    while True:
+        if conexion is None:
+            conexion = await asyncio.open_connection("127.0.0.1", puerto)
+        lector, escritor = conexion
+        try:
+            escritor.write(datos)
+            estado, seguir = await asyncio.wait_for(leer_respuesta(lector), timeout)
+            return conexion, estado, seguir, reconectada
+        except (ConnectionError, asyncio.IncompleteReadError):
+            escritor.close()
+            conexion = None
+            if not reutilizada or reconectada:
+                raise
+            reconectada = True
+
+
+async def cliente(puerto, atletas, args, fin, latencias, errores, reconexiones):
+    conexion = None
+    await asyncio.sleep(random.uniform(0, args.pausa))  # arranque escalonado
+    while time.monotonic() < fin:
+        nombre, datos = elegir(atletas, args.escrituras)
+        inicio = time.monotonic()
+        try:
+            conexion, estado, seguir, reconectada = await enviar(conexion, puerto, datos, args.timeout)
+            reconexiones[0] += reconectada
+            if not seguir:
+                conexion[1].close()
+                conexion = None
+            if estado >= 500:
+                errores[str(estado)] = errores.get(str(estado), 0) + 1
+            else:
+                latencias.setdefault(nombre, []).append(time.monotonic() - inicio)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            errores[type(e).__name__] = errores.get(type(e).__name__, 0) + 1
+            if conexion is not None:
+                conexion[1].close()
+            conexion = None
+        await asyncio.sleep(args.pausa * random.uniform(0.5, 1.5))
+    if conexion is not None:
+        conexion[1].close()
+
+
+async def cliente_lento(puerto, atletas, fin):
+    while time.monotonic() < fin:
+        try:
+            lector, escritor = await asyncio.open_connection("127.0.0.1", puerto)
+            escritor.write(peticion("GET", f"/hrv/{random.choice(atletas)}"))
+            await leer_respuesta(lector, lento=True)
+            escritor.close()
+        except (OSError, asyncio.IncompleteReadError):
+            await asyncio.sleep(1)
+
+
+def percentil(valores, p):
+    return statistics.quantiles(valores, n=100, method="inclusive")[p - 1] if len(valores) > 1 else valores[0]
+
+
+async def medir(puerto, atletas, args):
+    fin = time.monotonic() + args.duracion
+    latencias, errores, reconexiones = {}, {}, [0]
+    tareas = [cliente(puerto, atletas, args, fin, latencias, errores, reconexiones) for _ in range(args.clientes)]
+    tareas += [cliente_lento(puerto, atletas, fin) for _ in range(args.lentos)]
+    inicio = time.monotonic()
+    await asyncio.gather(*tareas)
+    transcurrido = time.monotonic() - inicio
+
+    todas = [x for valores in latencias.values() for x in valores]
+    resumen = {
+        "peticiones": len(todas),
+        "rps": round(len(todas) / transcurrido, 1),
+        "errores": errores,
+        "reconexiones": reconexiones[0],
+        "rutas": {},
+    }
+    for nombre, valores in sorted(latencias.items()) + [("total", todas)]:
+        if valores:
+            resumen["rutas"][nombre] = {
+                "n": len(valores),
+                "p50_ms": round(percentil(valores, 50) * 1000, 1),
+                "p95_ms": round(percentil(valores, 95) * 1000, 1),
+                "p99_ms": round(percentil(valores, 99) * 1000, 1),
+            }
+    return resumen
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modos", default="wsgi,asgi")
+    parser.add_argument("--clientes", type=int, default=1000)
+    parser.add_argument("--lentos", type=int, default=0)
+    parser.add_argument("--duracion", type=float, default=30)
+    parser.add_argument("--pausa", type=float, default=1.0, help="segundos ociosos entre peticiones de un cliente")
+    parser.add_argument("--escrituras", type=float, default=0.1, help="fracción de POST /add_hrv")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--puerto", type=int, default=8790)
+    parser.add_argument("--json", help="guardar los resultados en este fichero")
+    args = parser.parse_args()
+
+    if not os.getenv("DATABASE_URL"):
+        sys.exit("DATABASE_URL no configurada")
+
+    resultados = {"parametros": vars(args), "modos": {}}
+    for i, modo in enumerate(args.modos.split(",")):
+        proceso, atletas = arrancar(modo, args.puerto + i)
+        try:
+            if not atletas:
+                sys.exit("No hay atletas en la base de datos")
+            resultados["modos"][modo] = asyncio.run(medir(args.puerto + i, atletas, args))
+        finally:
+            detener(proceso)
+
+    print(f"{'modo':<6}{'ruta':<12}{'n':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for modo, r in resultados["modos"].items():
+        for nombre, m in r["rutas"].items():
+            print(f"{modo:<6}{nombre:<12}{m['n']:>8}{m['p50_ms']:>10}{m['p95_ms']:>10}{m['p99_ms']:>10}")
+        print(f"{modo:<6}rps={r['rps']} errores={r['errores']} reconexiones={r['reconexiones']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(resultados, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Precisión y latencia de los motores de tendencia sobre los mismos históricos.
+
+Toma `--atletas` atletas de la base (p. ej. la sembrada con sembrar.py) y,
+para cada uno, `--origenes` cortes semanales hacia atrás: ajusta cada motor con
+el histórico hasta el corte, igual que lo recibe /predict, y compara los 7 días
+pronosticados con la carga real de esos días (0 si no hubo sesión). Informa
+el tiempo de ajuste (media, p50, p95), MAE, RMSE y MASE frente al pronóstico
+ingenuo semanal (repetir la semana anterior), que se incluye como referencia.
+
+    DATABASE_URL=... python benchmarks/tendencias.py --atletas 20 --origenes 3 --json tendencias.json
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import prediccion  # noqa: E402
+import tendencias  # noqa: E402
+from ai_module import resolver_atletas  # noqa: E402
+
+
+def evaluar(df, motores, origenes):
+    """Errores y tiempos de cada motor para los cortes de un atleta."""
+    dias, y = tendencias.serie_diaria(pd.to_datetime(df['fecha']).to_numpy(), df['carga'].to_numpy())
+    fechas = pd.to_datetime(df['fecha']).to_numpy().astype('datetime64[D]')
+    resultados = {motor: {"errores": [], "escala": [], "ms": []} for motor in motores + ["naive_semanal"]}
+
+    for k in range(1, origenes + 1):
+        corte = len(y) - 7 * k - 1  # índice del último día de entrenamiento
+        if corte < 28:
+            break
+        real = y[corte + 1:corte + 8]
+        entrenamiento = df[fechas <= dias[corte]]
+        # escala del MASE: error del ingenuo semanal dentro del entrenamiento
+        escala = np.mean(np.abs(y[7:corte + 1] - y[:corte - 6])) or 1.0
+
+        for motor in motores:
+            inicio = time.perf_counter()
+            pronostico = prediccion.ajustar_tendencia(entrenamiento, motor)
+            resultados[motor]["ms"].append((time.perf_counter() - inicio) * 1000)
+            yhat = np.array([p["yhat"] for p in pronostico])
+            resultados[motor]["errores"].append(yhat - real)
+            resultados[motor]["escala"].append(escala)
+        resultados["naive_semanal"]["errores"].append(y[corte - 6:corte + 1] - real)
+        resultados["naive_semanal"]["escala"].append(escala)
+    return resultados
+
+
+def resumir(acumulado):
+    errores = np.concatenate(acumulado["errores"])
+    escalas = np.repeat(acumulado["escala"], 7)
+    resumen = {
+        "pronosticos": len(acumulado["errores"]),
+        "mae": round(float(np.mean(np.abs(errores))), 1),
+        "rmse": round(float(np.sqrt(np.mean(errores ** 2))), 1),
+        "mase": round(float(np.mean(np.abs(errores) / escalas)), 3),
+    }
+    if acumulado["ms"]:
+        ms = acumulado["ms"]
+        resumen.update({
+            "ajuste_media_ms": round(statistics.fmean(ms), 2),
+            "ajuste_p50_ms": round(statistics.median(ms), 2),
+            "ajuste_p95_ms": round(statistics.quantiles(ms, n=20)[-1], 2) if len(ms) > 1 else round(ms[0], 2),
+        })
+    return resumen
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--atletas", type=int, default=20)
+    parser.add_argument("--origenes", type=int, default=3, help="cortes semanales por atleta")
+    parser.add_argument("--motores", default=",".join(tendencias.MOTORES))
+    parser.add_argument("--json", help="guardar los resultados en este fichero")
+    args = parser.parse_args()
+
+    if not os.getenv("DATABASE_URL"):
+        sys.exit("DATABASE_URL no configurada")
+    logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+    logging.getLogger("prophet").setLevel(logging.WARNING)
+
+    motores = args.motores.split(",")
+    ids = resolver_atletas()[:args.atletas]
+    historial = prediccion.cargar_historial(ids)
+    acumulado = {}
+    for _, df in historial.groupby("id_atleta"):
+        for motor, r in evaluar(df, motores, args.origenes).items():
+            destino = acumulado.setdefault(motor, {"errores": [], "escala": [], "ms": []})
+            for clave in destino:
+                destino[clave] += r[clave]
+
+    resultados = {motor: resumir(r) for motor, r in acumulado.items() if r["errores"]}
+    print(f"{'motor':<15}{'n':>5}{'MAE':>9}{'RMSE':>9}{'MASE':>8}{'media ms':>11}{'p50 ms':>10}{'p95 ms':>10}")
+    for motor, r in resultados.items():
+        print(f"{motor:<15}{r['pronosticos']:>5}{r['mae']:>9}{r['rmse']:>9}{r['mase']:>8}"
+              f"{r.get('ajuste_media_ms', '-'):>11}{r.get('ajuste_p50_ms', '-'):>10}{r.get('ajuste_p95_ms', '-'):>10}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"parametros": vars(args), "atletas": len(ids), "motores": resultados}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
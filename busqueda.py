@@ -0,0 +1,179 @@
+import logging
+import os
+
+# ——— Búsqueda de atletas ———
+# /atletas/buscar?q= busca sin distinguir mayúsculas ni acentos en nombre,
+# equipo y disciplina, por niveles que se consultan en orden hasta llenar la
+# página. Cada nivel de prefijo tiene un btree (migración 9) sobre su clave,
+# que es también su orden, así que LIMIT corta el recorrido del índice sin
+# ordenar las coincidencias:
+#   0. el nombre empieza por q              clave: el nombre
+#   1. los apellidos empiezan por q         clave: el nombre sin la primera palabra
+#   2. el equipo empieza por q              clave: equipo y nombre ("equipo 03 ana")
+#   3. la disciplina empieza por q          clave: disciplina y nombre
+#   4. q aparece dentro del texto o se le parece    GIN de trigramas (pg_trgm)
+# Un autocompletado corto se resuelve con el nivel 0 sin tocar los demás. El
+# nivel 4 sólo existe si la migración pudo instalar pg_trgm; sin él la búsqueda
+# se queda en los prefijos, y se ordena por nombre. La clave normalizada y el
+# id de la última fila forman el cursor.
+BUSQUEDA_LIMITE = int(os.getenv('BUSQUEDA_LIMITE', '20'))
+BUSQUEDA_LIMITE_MAX = int(os.getenv('BUSQUEDA_LIMITE_MAX', '100'))
+MIN_TRIGRAMAS = 3  # con menos caracteres los trigramas no filtran nada
+
+# translate() en vez de la extensión unaccent: inmutable, sirve en índices y
+# no depende de que el servidor tenga los módulos contrib
+CON_ACENTOS = 'ÁÀÂÄÃÅÉÈÊËÍÌÎÏÓÒÔÖÕÚÙÛÜÑÇÝáàâäãåéèêëíìîïóòôöõúùûüñçýÿ'
+SIN_ACENTOS = 'AAAAAAEEEEIIIIOOOOOUUUUNCYaaaaaaeeeeiiiiooooouuuuncyy'
+
+# Lo que sigue a la primera palabra del nombre (el nombre entero si sólo tiene una)
+APELLIDOS = "substr(nombre, strpos(nombre, ' ') + 1)"
+
+# Clave de cada nivel de prefijo, en el orden de los niveles
+CLAVES = {
+    'nombre': 'normalizar_busqueda(nombre) COLLATE "C"',
+    'apellidos': f'normalizar_busqueda({APELLIDOS}) COLLATE "C"',
+    'equipo': 'normalizar_busqueda(equipo || \' \' || nombre) COLLATE "C"',
+    'disciplina': 'normalizar_busqueda(disciplina || \' \' || nombre) COLLATE "C"',
+}
+
+DDL_BUSQUEDA = [
+    f"""
+    CREATE OR REPLACE FUNCTION normalizar_busqueda(texto TEXT) RETURNS TEXT
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$ SELECT lower(translate(texto, '{CON_ACENTOS}', '{SIN_ACENTOS}')) $$
+    """,
+    # COLLATE "C": orden por bytes, con el que un prefijo es un rango del índice
+    *[f"""CREATE INDEX IF NOT EXISTS atletas_{nombre}_busqueda_idx
+          ON atletas (({clave}), id_atleta)""" for nombre, clave in CLAVES.items()],
+]
+
+# Texto de cada atleta para los trigramas
+DOCUMENTO = "normalizar_busqueda(nombre || ' ' || COALESCE(equipo, '') || ' ' || COALESCE(disciplina, ''))"
+
+
+def indice_trigramas(cur):
+    """Paso de migración: pg_trgm y el índice GIN del nivel 4, si el servidor lo permite."""
+    cur.execute("SAVEPOINT trigramas")
+    try:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except Exception as e:
+        cur.execute("ROLLBACK TO SAVEPOINT trigramas")
+        logging.warning("Sin pg_trgm (%s): la búsqueda de atletas sólo usará prefijos", str(e).splitlines()[0])
+        return
+    cur.execute("RELEASE SAVEPOINT trigramas")
+    cur.execute(f"""
+        CREATE INDEX IF NOT EXISTS atletas_busqueda_trgm_idx ON atletas USING gin (({DOCUMENTO}) gin_trgm_ops)
+    """)
+
+
+def _prefijo(clave):
+    # El prefijo como rango explícito y no como LIKE 'q%': el planificador
+    # estima mejor las filas del rango y elige recorrer el índice en orden en
+    # vez de leer todas las coincidencias y ordenarlas
+    return (f"({clave} >= normalizar_busqueda(%(q)s)"
+            f" AND {clave} < normalizar_busqueda(%(q)s) || U&'\\+10FFFF')")
+
+
+_TRIGRAMAS = (f"({DOCUMENTO} LIKE '%%' || normalizar_busqueda(%(q_like)s) || '%%'"
+              f" OR {DOCUMENTO} %%> normalizar_busqueda(%(q)s))")
+# (condición, clave) de cada nivel
+_NIVELES = [(_prefijo(clave), clave) for clave in CLAVES.values()] + [(_TRIGRAMAS, CLAVES['nombre'])]
+
+
+def _sql_nivel(nivel):
+    condicion, clave = _NIVELES[nivel]
+    anteriores = ''.join(f"\n          AND NOT COALESCE({c}, false)" for c, _ in _NIVELES[:nivel])
+    return f"""
+        SELECT id_atleta, nombre, equipo, disciplina, {clave} AS clave
+        FROM atletas
+        WHERE {condicion}{anteriores}
+          AND (%(c_clave)s::text IS NULL OR ({clave}, id_atleta) > (%(c_clave)s, %(c_id)s))
+        ORDER BY {clave}, id_atleta
+        LIMIT %(limite)s
+    """
+
+
+SQL_NIVELES = [_sql_nivel(nivel) for nivel in range(len(_NIVELES))]
+COLUMNAS_BUSQUEDA = ['id', 'nombre', 'equipo', 'disciplina', 'nivel']
+SQL_TRIGRAMAS = "SELECT to_regclass('atletas_busqueda_trgm_idx') IS NOT NULL"
+
+_trigramas = None  # si existe el índice de trigramas; se mira en la primera búsqueda del proceso
+
+
+def escapar(texto):
+    """`texto` literal dentro de un patrón LIKE."""
+    return texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def codificar_cursor(nivel, clave, id_atleta):
+    return f"{nivel}_{id_atleta}_{clave}"
+
+
+def decodificar_cursor(token):
+    nivel, id_atleta, clave = token.split('_', 2)
+    if not 0 <= int(nivel) < len(_NIVELES):
+        raise ValueError(f"nivel de cursor fuera de rango: {nivel}")
+    return int(nivel), clave, int(id_atleta)
+
+
+def leer_parametros(args):
+    """q, limite y cursor de /atletas/buscar; ValueError si faltan o están mal formados."""
+    q = (args.get('q') or '').strip()
+    if not q:
+        raise ValueError("q es obligatorio")
+    limite = int(args['limite']) if args.get('limite') else BUSQUEDA_LIMITE
+    if limite < 1:
+        raise ValueError("limite debe ser positivo")
+    cursor = decodificar_cursor(args['cursor']) if args.get('cursor') else (0, None, None)
+    return {"q": q, "limite": min(limite, BUSQUEDA_LIMITE_MAX), "cursor": cursor}
+
+
+def _niveles(q, cursor, trigramas):
+    """(nivel, parámetros) de las consultas a hacer, desde el nivel del cursor."""
+    c_nivel, c_clave, c_id = cursor
+    ultimo = len(_NIVELES) - (1 if trigramas and len(q) >= MIN_TRIGRAMAS else 2)
+    for nivel in range(c_nivel, ultimo + 1):
+        desde = (c_clave, c_id) if nivel == c_nivel else (None, None)
+        yield nivel, {"q": q, "q_like": escapar(q), "c_clave": desde[0], "c_id": desde[1]}
+
+
+def _pagina(filas, limite):
+    siguiente = None
+    if len(filas) == limite:
+        nivel, fila = filas[-1]
+        siguiente = codificar_cursor(nivel, fila[4], fila[0])
+    return [(f[0], f[1], f[2], f[3], nivel) for nivel, f in filas], siguiente
+
+
+def buscar(cur, params):
+    """(filas, cursor_siguiente); las filas son las COLUMNAS_BUSQUEDA."""
+    global _trigramas
+    if _trigramas is None:
+        cur.execute(SQL_TRIGRAMAS)
+        _trigramas = cur.fetchone()[0]
+    filas = []
+    for nivel, valores in _niveles(params["q"], params["cursor"], _trigramas):
+        cur.execute(SQL_NIVELES[nivel], dict(valores, limite=params["limite"] - len(filas)))
+        filas += [(nivel, f) for f in cur.fetchall()]
+        if len(filas) == params["limite"]:
+            break
+    return _pagina(filas, params["limite"])
+
+
+def fila_busqueda(f):
+    return dict(zip(COLUMNAS_BUSQUEDA, f))
+
+
+# ——— Variante async (cursor de psycopg 3, usada por asgi.py) ———
+async def buscar_async(cur, params):
+    global _trigramas
+    if _trigramas is None:
+        await cur.execute(SQL_TRIGRAMAS)
+        _trigramas = (await cur.fetchone())[0]
+    filas = []
+    for nivel, valores in _niveles(params["q"], params["cursor"], _trigramas):
+        await cur.execute(SQL_NIVELES[nivel], dict(valores, limite=params["limite"] - len(filas)))
+        filas += [(nivel, f) for f in await cur.fetchall()]
+        if len(filas) == params["limite"]:
+            break
+    return _pagina(filas, params["limite"])
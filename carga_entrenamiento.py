@@ -0,0 +1,201 @@
+import os
+from datetime import date
+
+from psycopg2.extras import execute_values
+
+# ——— Configuración ———
+CARGA_DIAS_AGUDA = int(os.getenv('CARGA_DIAS_AGUDA', '7'))
+CARGA_DIAS_CRONICA = int(os.getenv('CARGA_DIAS_CRONICA', '28'))
+
+# EWMA con λ = 2 / (N + 1); los días sin sesión cuentan como carga 0
+LAMBDA_AGUDA = 2 / (CARGA_DIAS_AGUDA + 1)
+LAMBDA_CRONICA = 2 / (CARGA_DIAS_CRONICA + 1)
+
+# Clave (con el id del atleta) del pg_advisory_xact_lock que serializa sus escrituras
+LOCK_CARGA = 7261002
+
+# Una fila por atleta y día con sesión o RPE: carga = duración total × RPE
+# medio del día (la misma definición que usa prediccion). Las EWMA y el ACWR
+# son los valores a ese día; cada escritura recalcula su día y arrastra las
+# EWMA desde ahí, que en el caso normal (el día más reciente) es una sola fila.
+DDL_CARGA = """
+    CREATE TABLE IF NOT EXISTS carga_diaria (
+        id_atleta INTEGER NOT NULL REFERENCES atletas (id_atleta),
+        fecha DATE NOT NULL,
+        duracion DOUBLE PRECISION,
+        rpe DOUBLE PRECISION,
+        carga DOUBLE PRECISION NOT NULL DEFAULT 0,
+        ewma_aguda DOUBLE PRECISION,
+        ewma_cronica DOUBLE PRECISION,
+        acwr DOUBLE PRECISION,
+        PRIMARY KEY (id_atleta, fecha)
+    );
+"""
+
+SQL_BLOQUEAR = "SELECT pg_advisory_xact_lock(%s, %s)"
+
+SQL_AGREGAR_DIAS = """
+    INSERT INTO carga_diaria (id_atleta, fecha, duracion, rpe, carga)
+    SELECT d.id_atleta, d.fecha, e.duracion, r.rpe, COALESCE(e.duracion * r.rpe, 0)
+    FROM (SELECT %s::int AS id_atleta, unnest(%s::date[]) AS fecha) d
+    CROSS JOIN LATERAL (
+        SELECT SUM(duracion)::float8 AS duracion FROM entrenamiento
+        WHERE id_atleta = d.id_atleta AND fecha = d.fecha
+    ) e
+    CROSS JOIN LATERAL (
+        SELECT AVG(rpe)::float8 AS rpe FROM rpe
+        WHERE id_atleta = d.id_atleta AND fecha = d.fecha
+    ) r
+    ON CONFLICT (id_atleta, fecha) DO UPDATE SET
+      duracion = EXCLUDED.duracion,
+      rpe = EXCLUDED.rpe,
+      carga = EXCLUDED.carga
+"""
+
+SQL_DIAS_ATLETA = """
+    SELECT fecha FROM entrenamiento WHERE id_atleta = %s AND fecha IS NOT NULL
+    UNION SELECT fecha FROM rpe WHERE id_atleta = %s
+"""
+
+SQL_ANTERIOR = """
+    SELECT fecha, ewma_aguda, ewma_cronica FROM carga_diaria
+    WHERE id_atleta = %s AND fecha < %s
+    ORDER BY fecha DESC LIMIT 1
+"""
+
+SQL_DESDE = """
+    SELECT fecha, carga FROM carga_diaria
+    WHERE id_atleta = %s AND fecha >= %s
+    ORDER BY fecha
+"""
+
+SQL_GUARDAR_EWMA = """
+    UPDATE carga_diaria SET ewma_aguda = %s, ewma_cronica = %s, acwr = %s
+    WHERE id_atleta = %s AND fecha = %s
+"""
+
+SQL_ULTIMO = """
+    SELECT fecha, ewma_aguda, ewma_cronica FROM carga_diaria
+    WHERE id_atleta = %s
+    ORDER BY fecha DESC LIMIT 1
+"""
+
+SQL_SERIE = """
+    SELECT fecha, duracion, rpe, carga, ewma_aguda, ewma_cronica, acwr FROM carga_diaria
+    WHERE id_atleta = %s
+    ORDER BY fecha DESC LIMIT %s
+"""
+
+
+# ——— Cálculo ———
+def ratio(aguda, cronica):
+    return aguda / cronica if cronica else None
+
+
+def propagar(id_atleta, anterior, filas):
+    """EWMA aguda/crónica y ACWR de `filas` [(fecha, carga)] en orden, partiendo
+    de `anterior` (fecha, aguda, crónica) o de cero. Entre dos sesiones
+    separadas `g` días la EWMA anterior decae (1 - λ)^g."""
+    fecha_ant, aguda, cronica = anterior or (None, 0.0, 0.0)
+    for fecha, carga in filas:
+        hueco = (fecha - fecha_ant).days if fecha_ant else 1
+        aguda = LAMBDA_AGUDA * carga + (1 - LAMBDA_AGUDA) ** hueco * aguda
+        cronica = LAMBDA_CRONICA * carga + (1 - LAMBDA_CRONICA) ** hueco * cronica
+        fecha_ant = fecha
+        yield (aguda, cronica, ratio(aguda, cronica), id_atleta, fecha)
+
+
+def estado_actual(ultimo, hoy=None):
+    """Carga aguda, crónica y ACWR a `hoy` a partir de la última fila, sin recorrer el histórico."""
+    if ultimo is None:
+        return None
+    fecha, aguda, cronica = ultimo
+    hoy = hoy or date.today()
+    dias = max((hoy - fecha).days, 0)
+    aguda *= (1 - LAMBDA_AGUDA) ** dias
+    cronica *= (1 - LAMBDA_CRONICA) ** dias
+    return {
+        "fecha": hoy.isoformat(),
+        "ultima_sesion": fecha.isoformat(),
+        "carga_aguda": aguda,
+        "carga_cronica": cronica,
+        "acwr": ratio(aguda, cronica),
+    }
+
+
+# ——— Mantenimiento ———
+def registrar(cur, id_atleta, fechas):
+    """Recalcula los días `fechas` del atleta y arrastra las EWMA (misma transacción)."""
+    fechas = sorted(set(fechas))
+    if not fechas:
+        return
+    cur.execute(SQL_BLOQUEAR, (LOCK_CARGA, id_atleta))
+    cur.execute(SQL_AGREGAR_DIAS, (id_atleta, fechas))
+    cur.execute(SQL_ANTERIOR, (id_atleta, fechas[0]))
+    anterior = cur.fetchone()
+    cur.execute(SQL_DESDE, (id_atleta, fechas[0]))
+    execute_values(cur, """
+        UPDATE carga_diaria SET ewma_aguda = v.aguda, ewma_cronica = v.cronica, acwr = v.acwr
+        FROM (VALUES %s) AS v(aguda, cronica, acwr, id_atleta, fecha)
+        WHERE carga_diaria.id_atleta = v.id_atleta AND carga_diaria.fecha = v.fecha
+    """, list(propagar(id_atleta, anterior, cur.fetchall())), template="(%s, %s, %s::float8, %s, %s::date)",
+        page_size=1000)
+
+
+def registrar_filas(cur, filas):
+    """Para las cargas masivas: `filas` son (id_atleta, fecha); fecha None es hoy."""
+    por_atleta = {}
+    hoy = None
+    for id_atleta, fecha in filas:
+        if fecha is None:
+            if hoy is None:
+                cur.execute("SELECT CURRENT_DATE")
+                hoy = cur.fetchone()[0]
+            fecha = hoy
+        por_atleta.setdefault(id_atleta, set()).add(fecha)
+    for id_atleta in sorted(por_atleta):
+        registrar(cur, id_atleta, por_atleta[id_atleta])
+
+
+def recalcular(cur, id_atleta):
+    """Reconstruye todas las filas del atleta desde entrenamiento y rpe."""
+    cur.execute(SQL_DIAS_ATLETA, (id_atleta, id_atleta))
+    fechas = [fila[0] for fila in cur.fetchall()]
+    cur.execute("DELETE FROM carga_diaria WHERE id_atleta = %s", (id_atleta,))
+    registrar(cur, id_atleta, fechas)
+
+
+def recalcular_pendientes(cur):
+    """Crea las filas de los atletas con entrenamientos o RPE y sin carga calculada."""
+    cur.execute("""
+        SELECT id_atleta FROM (SELECT id_atleta FROM entrenamiento UNION SELECT id_atleta FROM rpe) t
+        WHERE NOT EXISTS (SELECT 1 FROM carga_diaria c WHERE c.id_atleta = t.id_atleta)
+          AND EXISTS (SELECT 1 FROM atletas a WHERE a.id_atleta = t.id_atleta)
+    """)
+    for (id_atleta,) in cur.fetchall():
+        recalcular(cur, id_atleta)
+
+
+def obtener(cur, id_atleta, dias):
+    """Estado actual (O(1)) y las últimas `dias` filas en orden cronológico."""
+    cur.execute(SQL_ULTIMO, (id_atleta,))
+    actual = estado_actual(cur.fetchone())
+    cur.execute(SQL_SERIE, (id_atleta, dias))
+    serie = [{
+        "fecha": f.isoformat(), "duracion": duracion, "rpe": rpe, "carga": carga,
+        "ewma_aguda": aguda, "ewma_cronica": cronica, "acwr": acwr,
+    } for f, duracion, rpe, carga, aguda, cronica, acwr in reversed(cur.fetchall())]
+    return actual, serie
+
+
+# ——— Variante async (cursor de psycopg 3, usada por asgi.py) ———
+async def registrar_async(cur, id_atleta, fechas):
+    fechas = sorted(set(fechas))
+    if not fechas:
+        return
+    await cur.execute(SQL_BLOQUEAR, (LOCK_CARGA, id_atleta))
+    await cur.execute(SQL_AGREGAR_DIAS, (id_atleta, fechas))
+    await cur.execute(SQL_ANTERIOR, (id_atleta, fechas[0]))
+    anterior = await cur.fetchone()
+    await cur.execute(SQL_DESDE, (id_atleta, fechas[0]))
+    await cur.executemany(SQL_GUARDAR_EWMA, list(propagar(id_atleta, anterior, await cur.fetchall())))
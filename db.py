@@ -0,0 +1,266 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+import metricas
+
+DATABASE_URL = os.getenv('DATABASE_URL')
+
+# ——— Configuración del pool ———
+# DB_POOL_MAX debe cubrir los hilos de gunicorn (start.sh: 8) más las respuestas
+# en streaming que retienen conexión mientras se envían.
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))  # espera máxima por una conexión (s)
+DB_POOL_MAX_VIDA = float(os.getenv('DB_POOL_MAX_VIDA', '1800'))  # se recicla tras este tiempo (s)
+DB_POOL_VERIFICAR_TRAS = float(os.getenv('DB_POOL_VERIFICAR_TRAS', '30'))  # ping si estuvo ociosa más (s)
+
+
+class PoolAgotado(Exception):
+    """No se obtuvo conexión dentro del tiempo de espera."""
+
+
+class CursorMedido(extensions.cursor):
+    """Cursor que registra la duración de cada sentencia en `metricas` (y las
+    lentas en el log si SLOW_QUERY_MS > 0). En los cursores con nombre mide el
+    DECLARE; el tiempo de lectura queda en la retención de la conexión."""
+
+    def execute(self, query, vars=None):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            metricas.observar_consulta(query, time.perf_counter() - inicio)
+
+    def executemany(self, query, vars_list):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            metricas.observar_consulta(query, time.perf_counter() - inicio)
+
+    def copy_expert(self, sql, file, size=8192):
+        inicio = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            metricas.observar_consulta(sql, time.perf_counter() - inicio)
+
+
+class PoolConexiones:
+    """Pool de conexiones thread-safe con espera acotada y reciclaje.
+
+    - `obtener` reutiliza la conexión libre más reciente; si no hay y no se
+      llegó a `maximo` abre una nueva, y si no espera hasta `timeout`.
+    - Las conexiones ociosas más de `verificar_tras` se comprueban con
+      SELECT 1 antes de entregarse; las rotas o más viejas que `max_vida` se
+      cierran y se sustituyen.
+    - `devolver` hace rollback de transacciones abiertas y descarta las
+      conexiones cerradas o en estado desconocido.
+    """
+
+    def __init__(self, dsn, minimo=DB_POOL_MIN, maximo=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT,
+                 max_vida=DB_POOL_MAX_VIDA, verificar_tras=DB_POOL_VERIFICAR_TRAS):
+        self.dsn = dsn
+        self.minimo = minimo
+        self.maximo = maximo
+        self.timeout = timeout
+        self.max_vida = max_vida
+        self.verificar_tras = verificar_tras
+
+        self._cond = threading.Condition()
+        self._libres = deque()  # (conn, creada, devuelta)
+        self._en_uso = {}  # id(conn) -> (creada, prestada)
+        self._total = 0
+        self._esperando = 0
+        self._metricas = {
+            "checkouts": 0,
+            "esperas": 0,
+            "timeouts": 0,
+            "creadas": 0,
+            "descartadas": 0,
+            "espera_total_s": 0.0,
+            "espera_max_s": 0.0,
+        }
+
+        for _ in range(self.minimo):
+            conn = self._conectar()
+            self._libres.append((conn, time.monotonic(), time.monotonic()))
+            self._total += 1
+            self._metricas["creadas"] += 1
+
+    def _conectar(self):
+        return psycopg2.connect(self.dsn, cursor_factory=CursorMedido)
+
+    def _cerrar(self, conn):
+        self._metricas["descartadas"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _viva(self, conn, creada, devuelta):
+        ahora = time.monotonic()
+        if conn.closed or ahora - creada > self.max_vida:
+            return False
+        if ahora - devuelta > self.verificar_tras:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def obtener(self, timeout=None):
+        inicio = time.monotonic()
+        limite = inicio + (self.timeout if timeout is None else timeout)
+        esperado = False
+
+        while True:
+            conn = None
+            with self._cond:
+                while not self._libres and self._total >= self.maximo:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        self._metricas["timeouts"] += 1
+                        metricas.POOL_ESPERA.observar(time.monotonic() - inicio)
+                        raise PoolAgotado(f"Sin conexiones libres tras {self.timeout}s")
+                    esperado = True
+                    self._esperando += 1
+                    try:
+                        self._cond.wait(restante)
+                    finally:
+                        self._esperando -= 1
+                if self._libres:
+                    conn, creada, devuelta = self._libres.pop()
+                else:
+                    self._total += 1
+
+            if conn is None:
+                try:
+                    conn, creada, devuelta = self._conectar(), time.monotonic(), None
+                except Exception:
+                    with self._cond:
+                        self._total -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._viva(conn, creada, devuelta):
+                with self._cond:
+                    self._cerrar(conn)
+                    self._total -= 1
+                    self._cond.notify()
+                continue
+
+            ahora = time.monotonic()
+            espera = ahora - inicio
+            metricas.POOL_ESPERA.observar(espera)
+            with self._cond:
+                if devuelta is None:
+                    self._metricas["creadas"] += 1
+                self._en_uso[id(conn)] = (creada, ahora)
+                self._metricas["checkouts"] += 1
+                self._metricas["esperas"] += int(esperado)
+                self._metricas["espera_total_s"] += espera
+                self._metricas["espera_max_s"] = max(self._metricas["espera_max_s"], espera)
+            return conn
+
+    def devolver(self, conn, descartar=False):
+        with self._cond:
+            prestamo = self._en_uso.pop(id(conn), None)
+        if prestamo is None:
+            return
+        creada, prestada = prestamo
+        metricas.POOL_RETENCION.observar(time.monotonic() - prestada)
+
+        if not descartar and not conn.closed:
+            estado = conn.info.transaction_status
+            if estado == extensions.TRANSACTION_STATUS_UNKNOWN:
+                descartar = True
+            elif estado != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    descartar = True
+
+        with self._cond:
+            if descartar or conn.closed or time.monotonic() - creada > self.max_vida:
+                self._cerrar(conn)
+                self._total -= 1
+            else:
+                self._libres.append((conn, creada, time.monotonic()))
+            self._cond.notify()
+
+    def estadisticas(self):
+        with self._cond:
+            datos = dict(self._metricas)
+            datos.update({
+                "en_uso": len(self._en_uso),
+                "libres": len(self._libres),
+                "total": self._total,
+                "maximo": self.maximo,
+                "esperando": self._esperando,
+            })
+        datos["espera_media_s"] = datos["espera_total_s"] / datos["checkouts"] if datos["checkouts"] else 0.0
+        return datos
+
+
+# ——— Pool de la aplicación ———
+# Se crea en el primer uso: los procesos que sólo importan módulos (p. ej. el
+# pool de predicción) no abren conexiones.
+db_pool = None
+_pool_lock = threading.Lock()
+
+
+def _obtener_pool():
+    global db_pool
+    if db_pool is None:
+        with _pool_lock:
+            if db_pool is None:
+                try:
+                    db_pool = PoolConexiones(DATABASE_URL)
+                    logging.info("Pool de conexiones a la DB creado correctamente")
+                except Exception:
+                    logging.exception("Error creando pool de conexiones")
+                    raise
+    return db_pool
+
+
+def get_db():
+    try:
+        return _obtener_pool().obtener()
+    except PoolAgotado:
+        logging.warning("Pool de conexiones agotado")
+        raise
+    except Exception:
+        logging.exception("Error obteniendo conexión de pool")
+        raise
+
+
+def release_db(conn, descartar=False):
+    if conn:
+        db_pool.devolver(conn, descartar)
+
+
+@contextmanager
+def conexion():
+    """Conexión del pool para la duración de un bloque `with`.
+
+    Al salir se devuelve siempre: las transacciones abiertas se deshacen y las
+    conexiones rotas (cerradas o en estado desconocido) se descartan.
+    """
+    conn = get_db()
+    try:
+        yield conn
+    finally:
+        release_db(conn)
+
+
+def estadisticas_pool():
+    return db_pool.estadisticas() if db_pool is not None else {}
@@ -0,0 +1,204 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import hrv_store
+import metricas
+import response_cache
+from db import conexion
+
+# ——— Configuración ———
+# Escritura diferida (write-behind) de /add_hrv y /add_autoseguimiento: cada
+# lectura validada entra en una cola acotada del proceso y un hilo la escribe
+# junto con las demás en una sola transacción cuando se juntan ESCRITURA_LOTE
+# registros o pasan ESCRITURA_ESPERA_MS desde el primero. Con la avalancha de
+# la mañana, decenas de peticiones comparten un préstamo del pool y un commit
+# (un vaciado del WAL) en vez de uno cada una.
+#
+# ESCRITURA_ACK=durable (por defecto) responde cuando la transacción del lote
+# ya hizo commit, con el mismo código que la escritura directa (404 si el
+# atleta no existe). ESCRITURA_ACK=memoria responde 202 al encolar: más rápido,
+# pero una caída del proceso pierde lo que esté en cola y los errores sólo
+# quedan en el log.
+ESCRITURA_DIFERIDA = os.getenv('ESCRITURA_DIFERIDA', '0') == '1'
+ESCRITURA_ACK = os.getenv('ESCRITURA_ACK', 'durable')
+if ESCRITURA_ACK not in ('durable', 'memoria'):
+    raise RuntimeError("ESCRITURA_ACK debe ser 'durable' o 'memoria'")
+ESCRITURA_LOTE = int(os.getenv('ESCRITURA_LOTE', '200'))
+ESCRITURA_ESPERA_MS = float(os.getenv('ESCRITURA_ESPERA_MS', '20'))
+ESCRITURA_COLA_MAX = int(os.getenv('ESCRITURA_COLA_MAX', '5000'))
+ESCRITURA_TIMEOUT = float(os.getenv('ESCRITURA_TIMEOUT', '30'))  # espera máxima del ack durable
+ESCRITURA_DRENAJE_S = float(os.getenv('ESCRITURA_DRENAJE_S', '30'))  # al apagar
+
+# Tipo de registro -> función que lo escribe con un cursor, sin commit. app.py
+# registra las suyas con `registrar`.
+ESCRITORES = {'hrv': hrv_store.insertar_lectura}
+
+
+def registrar(tipo, escribir):
+    ESCRITORES[tipo] = escribir
+
+
+LOTES = metricas.histograma('escritura_lote_segundos', 'Transacción de un lote de escritura diferida', ('resultado',))
+
+
+class ColaLlena(Exception):
+    """La cola de escritura está llena o cerrándose."""
+
+
+class EscrituraDiferida:
+    """Cola acotada de registros y un hilo que los escribe por lotes.
+
+    `encolar` devuelve un Future que se resuelve con None cuando el commit del
+    lote que contiene el registro termina, o con la excepción de ese registro.
+    Si el lote falla, se repite registro a registro con un SAVEPOINT cada uno:
+    un atleta inexistente sólo hace fallar su propia petición. Los registros de
+    HRV se escriben ordenados por atleta para que los bloqueos de la línea base
+    se tomen siempre en el mismo orden que en otras transacciones de lote.
+    """
+
+    def __init__(self, lote=ESCRITURA_LOTE, espera_ms=ESCRITURA_ESPERA_MS, max_cola=ESCRITURA_COLA_MAX):
+        self.lote = lote
+        self.espera = espera_ms / 1000
+        self._cola = queue.Queue(max_cola)
+        self._hilo = None
+        self._cerrada = False
+        self._lock = threading.Lock()
+        self._contadores = {'encolados': 0, 'escritos': 0, 'fallidos': 0, 'lotes': 0, 'rechazados': 0}
+
+    def _arrancar(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, name='escritura-diferida', daemon=True)
+            self._hilo.start()
+            atexit.register(self.cerrar)
+
+    def encolar(self, tipo, fila):
+        futuro = Future()
+        with self._lock:
+            if self._cerrada:
+                self._contadores['rechazados'] += 1
+                raise ColaLlena()
+            self._arrancar()
+            try:
+                self._cola.put_nowait((tipo, fila, futuro))
+            except queue.Full:
+                self._contadores['rechazados'] += 1
+                raise ColaLlena()
+            self._contadores['encolados'] += 1
+        return futuro
+
+    # ——— Hilo escritor ———
+    def _bucle(self):
+        while True:
+            primero = self._cola.get()
+            if primero is None:
+                return
+            registros = [primero]
+            limite = time.monotonic() + self.espera
+            fin = False
+            while len(registros) < self.lote:
+                restante = limite - time.monotonic()
+                try:
+                    registro = self._cola.get(timeout=restante) if restante > 0 else self._cola.get_nowait()
+                except queue.Empty:
+                    break
+                if registro is None:
+                    fin = True
+                    break
+                registros.append(registro)
+            self._vaciar(registros)
+            if fin:
+                return
+
+    def _vaciar(self, registros):
+        # orden estable por (tipo, atleta): se conserva el de llegada de cada atleta
+        registros.sort(key=lambda r: (r[0], r[1][0]))
+        for _, _, futuro in registros:
+            # desde aquí el Future ya no se puede cancelar (p. ej. por un timeout
+            # en asgi); uno cancelado antes se escribe igual, sin nadie esperando
+            futuro.set_running_or_notify_cancel()
+        inicio = time.perf_counter()
+        try:
+            with conexion() as conn:
+                try:
+                    with conn.cursor() as cur:
+                        for tipo, fila, _ in registros:
+                            ESCRITORES[tipo](cur, fila)
+                    conn.commit()
+                    fallidos = {}
+                except Exception:
+                    conn.rollback()
+                    fallidos = self._uno_a_uno(conn, registros)
+        except Exception as e:
+            LOTES.observar(time.perf_counter() - inicio, 'error')
+            logging.exception("Error escribiendo un lote diferido de %s registros", len(registros))
+            self._resolver(registros, {id(r): e for r in registros})
+            return
+        LOTES.observar(time.perf_counter() - inicio, 'ok')
+        self._resolver(registros, fallidos)
+
+    def _uno_a_uno(self, conn, registros):
+        """Reintenta el lote en una transacción con un SAVEPOINT por registro; {id(registro): excepción}."""
+        fallidos = {}
+        with conn.cursor() as cur:
+            for registro in registros:
+                tipo, fila, _ = registro
+                cur.execute("SAVEPOINT registro")
+                try:
+                    ESCRITORES[tipo](cur, fila)
+                except Exception as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT registro")
+                    fallidos[id(registro)] = e
+                else:
+                    cur.execute("RELEASE SAVEPOINT registro")
+        conn.commit()
+        return fallidos
+
+    def _resolver(self, registros, fallidos):
+        atletas = set()
+        for registro in registros:
+            tipo, fila, futuro = registro
+            error = fallidos.get(id(registro))
+            if error is None:
+                atletas.add(fila[0])
+            elif ESCRITURA_ACK == 'memoria' or futuro.cancelled():
+                logging.error("Registro diferido de %s perdido (atleta %s): %s", tipo, fila[0], error)
+            if futuro.cancelled():
+                continue
+            if error is None:
+                futuro.set_result(None)
+            else:
+                futuro.set_exception(error)
+        response_cache.invalidar(*(f"atleta:{a}" for a in sorted(atletas)))
+        with self._lock:
+            self._contadores['lotes'] += 1
+            self._contadores['escritos'] += len(registros) - len(fallidos)
+            self._contadores['fallidos'] += len(fallidos)
+
+    # ——— Ciclo de vida ———
+    def cerrar(self, timeout=ESCRITURA_DRENAJE_S):
+        """Deja de aceptar registros y espera a que se escriba lo encolado."""
+        with self._lock:
+            if self._cerrada:
+                return
+            self._cerrada = True
+            hilo = self._hilo
+        if hilo is None:
+            return
+        self._cola.put(None)  # detrás de todo lo pendiente
+        hilo.join(timeout)
+        if hilo.is_alive():
+            logging.error("Escritura diferida: %s registros sin escribir al apagar", self._cola.qsize())
+        else:
+            logging.info("Escritura diferida drenada")
+
+    def estadisticas(self):
+        with self._lock:
+            return dict(self._contadores, pendientes=self._cola.qsize())
+
+
+escritor = EscrituraDiferida()
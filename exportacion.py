@@ -0,0 +1,300 @@
+import csv
+import gzip
+import importlib
+import io
+import logging
+import os
+from datetime import date
+
+from flask import Response
+
+import serializacion
+
+# ——— Exportación columnar ———
+# Todo el registro de los atletas (ficha, médico, nutrición, psicología,
+# entrenamiento, HRV, RPE y autoseguimiento) en un fichero por tabla, para
+# entrenar modelos fuera de la API sin recorrer cada ruta y juntar JSON:
+#   - parquet: comprimido con zstd, un row group por trozo; pd.read_parquet
+#   - arrow:   formato de fichero IPC de Arrow (Feather v2); con
+#              pa.ipc.open_file(pa.memory_map(ruta)).read_all() se lee sin
+#              copias, y pd.read_feather también lo abre
+#   - csv:     CSV comprimido con gzip, para quien no tenga pyarrow; las
+#              columnas de arrays (hrv.rr_intervals_ms) van como arrays JSON,
+#              [800.0,null] (vacío si la celda es NULL), que se leen con
+#              converters={'rr_intervals_ms': lambda v: json.loads(v) if v else None}
+# Las filas se leen con un cursor de servidor de EXPORTACION_TROZO en
+# EXPORTACION_TROZO y cada trozo se escribe antes de pedir el siguiente, así
+# que la memoria no depende del tamaño de la tabla. Se filtra por atletas,
+# equipo y rango de fechas (las tablas sin fecha, atletas y psicologia, sólo
+# por atleta y equipo). Desde `flask --app app exportar DIRECTORIO` (todas las
+# tablas en una misma instantánea) o GET /exportar/<tabla> (una tabla en
+# streaming). pyarrow, como pandas en ai_module, se importa en la primera
+# exportación y no al arrancar la app.
+EXPORTACION_TROZO = int(os.getenv('EXPORTACION_TROZO', '10000'))  # filas por trozo / row group
+FORMATOS_EXPORTACION = ('parquet', 'arrow', 'csv')
+EXTENSIONES = {'parquet': 'parquet', 'arrow': 'arrow', 'csv': 'csv.gz'}
+TIPOS_MIME = {
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.file',
+    'csv': 'application/gzip',
+}
+
+# Tabla -> (columna del atleta, columna de fecha o None), en el orden de exportación
+TABLAS_EXPORTACION = {
+    'atletas': ('id_atleta', None),
+    'medico': ('atleta_id', 'fecha'),
+    'nutricion': ('id_atleta', 'fecha'),
+    'psicologia': ('atleta_id', None),
+    'entrenamiento': ('id_atleta', 'fecha'),
+    'hrv': ('id_atleta', 'fecha'),
+    'rpe': ('id_atleta', 'fecha'),
+    'autoseguimiento': ('id_atleta', 'fecha_registro'),
+}
+
+# OID de PostgreSQL -> tipo de Arrow (nombre en pyarrow y argumentos). NUMERIC
+# se exporta como float8 y cualquier otro tipo (jsonb, time...) como texto.
+_TIPOS = {
+    16: ('bool_',), 21: ('int16',), 23: ('int32',), 20: ('int64',),
+    700: ('float32',), 701: ('float64',), 25: ('string',), 1043: ('string',),
+    1082: ('date32',), 1114: ('timestamp', 'us'), 1184: ('timestamp', 'us', 'UTC'),
+}
+_LISTAS = {1005: 21, 1007: 23, 1016: 20, 1021: 700, 1022: 701, 1009: 25}  # arrays -> OID del elemento
+_NUMERIC = 1700
+_TEXTO = 25
+
+
+def formato_disponible(formato):
+    """Si se puede exportar en `formato` (parquet y arrow necesitan pyarrow)."""
+    if formato == 'csv':
+        return True
+    try:
+        _pyarrow()
+    except ImportError:
+        return False
+    return True
+
+
+def _pyarrow():
+    pa = importlib.import_module('pyarrow')
+    importlib.import_module('pyarrow.parquet')
+    return pa
+
+
+def leer_filtros(args):
+    """atletas (ids separados por comas), equipo, desde y hasta; ValueError si están mal formados."""
+    atletas = [int(a) for a in args['atletas'].split(',')] if args.get('atletas') else None
+    filtros = {
+        "atletas": atletas,
+        "equipo": args.get('equipo') or None,
+        "desde": date.fromisoformat(args['desde']) if args.get('desde') else None,
+        "hasta": date.fromisoformat(args['hasta']) if args.get('hasta') else None,
+    }
+    if filtros["desde"] and filtros["hasta"] and filtros["desde"] > filtros["hasta"]:
+        raise ValueError("desde no puede ser posterior a hasta")
+    return filtros
+
+
+# ——— Consulta ———
+def columnas(cur, tabla):
+    """(nombre, OID) de las columnas de `tabla`."""
+    cur.execute(f"SELECT * FROM {tabla} LIMIT 0")
+    return [(d.name, d.type_code) for d in cur.description]
+
+
+def tipo_exportado(oid):
+    """OID con el que sale una columna de tipo `oid`: el mismo, float8 (NUMERIC) o text."""
+    if oid == _NUMERIC:
+        return 701
+    return oid if oid in _TIPOS or oid in _LISTAS else _TEXTO
+
+
+def sql_exportacion(tabla, cols):
+    """SELECT de `tabla` con los filtros de `leer_filtros`, ordenado por atleta y fecha."""
+    atleta, fecha = TABLAS_EXPORTACION[tabla]
+    seleccion = []
+    for nombre, oid in cols:
+        exportado = tipo_exportado(oid)
+        seleccion.append(nombre if exportado == oid else f"{nombre}::{'float8' if exportado == 701 else 'text'}")
+    condiciones = [
+        f"(%(atletas)s::int[] IS NULL OR t.{atleta} = ANY(%(atletas)s::int[]))",
+        f"""(%(equipo)s::text IS NULL OR EXISTS (
+               SELECT 1 FROM atletas a WHERE a.id_atleta = t.{atleta} AND a.equipo = %(equipo)s))""",
+    ]
+    orden = [atleta]
+    if fecha:
+        # `hasta` incluye el día entero también cuando la columna es un timestamp
+        condiciones += [f"(%(desde)s::date IS NULL OR t.{fecha} >= %(desde)s::date)",
+                        f"(%(hasta)s::date IS NULL OR t.{fecha} < %(hasta)s::date + 1)"]
+        orden.append(fecha)
+    if any(nombre == 'id' for nombre, _ in cols):
+        orden.append('id')
+    return f"""
+        SELECT {', '.join(seleccion)}
+        FROM {tabla} t
+        WHERE {' AND '.join(condiciones)}
+        ORDER BY {', '.join(f't.{c}' for c in orden)}
+    """
+
+
+def abrir(conn, tabla, filtros):
+    """Cursor de servidor con la exportación de `tabla` ya ejecutada y (nombre, OID) de sus columnas.
+
+    La consulta se ejecuta aquí para que sus errores salgan antes de empezar a escribir.
+    """
+    with conn.cursor() as cur:
+        cols = columnas(cur, tabla)
+    cursor = conn.cursor(name=f"exportar_{tabla}")
+    cursor.itersize = EXPORTACION_TROZO
+    cursor.execute(sql_exportacion(tabla, cols), filtros)
+    return cursor, cols
+
+
+# ——— Escritura ———
+class _EscritorArrow:
+    """Parquet o IPC: cada trozo del cursor es un RecordBatch (y en parquet un row group)."""
+
+    def __init__(self, formato, destino, cols):
+        pa = _pyarrow()
+        self._pa = pa
+        self._esquema = pa.schema([(nombre, _tipo_arrow(pa, tipo_exportado(oid))) for nombre, oid in cols])
+        if formato == 'parquet':
+            self._escritor = pa.parquet.ParquetWriter(destino, self._esquema, compression='zstd')
+        else:
+            self._escritor = pa.ipc.new_file(destino, self._esquema)
+
+    def escribir(self, filas):
+        valores = list(zip(*filas))
+        lote = self._pa.record_batch([self._pa.array(v, type=t) for v, t in zip(valores, self._esquema.types)],
+                                     schema=self._esquema)
+        self._escritor.write_batch(lote)
+
+    def cerrar(self):
+        self._escritor.close()
+
+
+def _tipo_arrow(pa, oid):
+    if oid in _LISTAS:
+        return pa.list_(_tipo_arrow(pa, _LISTAS[oid]))
+    nombre, *args = _TIPOS[oid]
+    return getattr(pa, nombre)(*args)
+
+
+class _EscritorCSV:
+    """CSV comprimido con gzip: NULL es el campo vacío, fechas en ISO 8601 y arrays en JSON."""
+
+    def __init__(self, destino, cols):
+        self._gzip = gzip.GzipFile(fileobj=destino, mode='wb', compresslevel=6)
+        self._texto = io.TextIOWrapper(self._gzip, encoding='utf-8', newline='')
+        self._csv = csv.writer(self._texto)
+        self._csv.writerow([nombre for nombre, _ in cols])
+        self._listas = [i for i, (_, oid) in enumerate(cols) if tipo_exportado(oid) in _LISTAS]
+
+    def escribir(self, filas):
+        if self._listas:
+            filas = [self._con_json(fila) for fila in filas]
+        self._csv.writerows(filas)
+        self._texto.flush()
+
+    def _con_json(self, fila):
+        # csv escribiría el repr de Python ("[800.0, None]"); NULL sigue siendo el campo vacío
+        fila = list(fila)
+        for i in self._listas:
+            if fila[i] is not None:
+                fila[i] = serializacion.dumps_iso(fila[i]).decode('utf-8')
+        return fila
+
+    def cerrar(self):
+        self._texto.close()  # cierra el gzip (y escribe su cola) sin cerrar `destino`
+
+
+def escribir_trozos(cursor, cols, formato, destino):
+    """Generador: vuelca el cursor en `destino` trozo a trozo y cede las filas de cada uno.
+
+    Al agotarse, el escritor ya está cerrado y `destino` tiene el fichero completo.
+    """
+    escritor = _EscritorCSV(destino, cols) if formato == 'csv' else _EscritorArrow(formato, destino, cols)
+    while True:
+        filas = cursor.fetchmany(EXPORTACION_TROZO)
+        if not filas:
+            break
+        escritor.escribir(filas)
+        yield len(filas)
+    escritor.cerrar()
+
+
+def exportar_directorio(conn, directorio, formato, tablas, filtros):
+    """Escribe cada tabla de `tablas` en DIRECTORIO/<tabla>.<extensión>; devuelve {tabla: filas}.
+
+    Todas las tablas se leen en una transacción REPEATABLE READ de sólo
+    lectura, así que son coherentes entre sí aunque la API siga escribiendo.
+    Cada fichero se escribe con otro nombre y se renombra al terminar.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    with conn.cursor() as cur:
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+    exportadas = {}
+    try:
+        for tabla in tablas:
+            ruta = os.path.join(directorio, f"{tabla}.{EXTENSIONES[formato]}")
+            cursor, cols = abrir(conn, tabla, filtros)
+            try:
+                with open(ruta + '.tmp', 'wb') as destino:
+                    exportadas[tabla] = sum(escribir_trozos(cursor, cols, formato, destino))
+            finally:
+                cursor.close()
+            os.replace(ruta + '.tmp', ruta)
+            logging.info("Exportadas %s filas de %s a %s", exportadas[tabla], tabla, ruta)
+    finally:
+        conn.rollback()
+    return exportadas
+
+
+# ——— Respuesta en streaming ———
+class _Tubo:
+    """Destino de escritura que guarda lo escrito hasta que se recoge con `vaciar`."""
+
+    closed = False
+
+    def __init__(self):
+        self._partes = []
+        self._posicion = 0
+
+    def write(self, datos):
+        datos = bytes(datos)
+        self._partes.append(datos)
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._posicion
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def vaciar(self):
+        datos = b''.join(self._partes)
+        self._partes = []
+        return datos
+
+
+def transmitir(conn, liberar, tabla, formato, filtros):
+    """Respuesta con el fichero de `tabla` en `formato`, generado trozo a trozo.
+
+    Como historial.transmitir: la consulta se abre antes de devolver la
+    respuesta y `liberar(conn)` se llama al cerrarla, se haya enviado entera o no.
+    """
+    cursor, cols = abrir(conn, tabla, filtros)
+    tubo = _Tubo()
+
+    def generar():
+        for _ in escribir_trozos(cursor, cols, formato, tubo):
+            yield tubo.vaciar()
+        yield tubo.vaciar()
+
+    respuesta = Response(generar(), mimetype=TIPOS_MIME[formato])
+    respuesta.headers['Content-Disposition'] = f'attachment; filename="{tabla}.{EXTENSIONES[formato]}"'
+    respuesta.call_on_close(lambda: liberar(conn))
+    return respuesta
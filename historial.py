@@ -0,0 +1,117 @@
+import os
+from datetime import date
+
+from flask import Response
+
+import serializacion
+
+# ——— Configuración ———
+PAGINA_MAX = int(os.getenv('PAGINA_MAX', '1000'))
+STREAM_ITERSIZE = int(os.getenv('STREAM_ITERSIZE', '2000'))  # filas por viaje del cursor de servidor
+
+
+def codificar_cursor(fecha, id_fila):
+    return f"{fecha.isoformat()}_{id_fila}"
+
+
+def decodificar_cursor(token):
+    fecha, id_fila = token.split('_', 1)
+    return date.fromisoformat(fecha), int(id_fila)
+
+
+def leer_parametros(args, orden='asc'):
+    """Filtros comunes de los históricos: desde, hasta, limite, cursor, orden,
+    agregado (semana|mes: leer de los resúmenes en vez de las filas) y format
+    (records|columns, en params["formato"]).
+
+    Lanza ValueError si algún parámetro está mal formado.
+    """
+    params = {
+        "desde": date.fromisoformat(args['desde']) if args.get('desde') else None,
+        "hasta": date.fromisoformat(args['hasta']) if args.get('hasta') else None,
+        "limite": min(int(args['limite']), PAGINA_MAX) if args.get('limite') else None,
+        "orden": args.get('orden', orden).lower(),
+        "c_fecha": None,
+        "c_id": None,
+        "agregado": args.get('agregado') or None,
+        "formato": serializacion.leer_formato(args),
+    }
+    if params["orden"] not in ('asc', 'desc'):
+        raise ValueError("orden debe ser asc o desc")
+    if params["agregado"] not in (None, 'semana', 'mes'):
+        raise ValueError("agregado debe ser semana o mes")
+    if params["limite"] is not None and params["limite"] < 1:
+        raise ValueError("limite debe ser positivo")
+    if args.get('cursor'):
+        params["c_fecha"], params["c_id"] = decodificar_cursor(args['cursor'])
+    return params
+
+
+def sql_keyset(tabla, columnas, orden, con_limite):
+    """Consulta por (fecha, id) para el índice (id_atleta, fecha, id)."""
+    comparador = '>' if orden == 'asc' else '<'
+    direccion = 'ASC' if orden == 'asc' else 'DESC'
+    return f"""
+        SELECT fecha, id, {', '.join(columnas)}
+        FROM {tabla}
+        WHERE id_atleta = %(id_atleta)s
+          AND (%(desde)s::date IS NULL OR fecha >= %(desde)s)
+          AND (%(hasta)s::date IS NULL OR fecha <= %(hasta)s)
+          AND (%(c_fecha)s::date IS NULL OR (fecha, id) {comparador} (%(c_fecha)s, %(c_id)s))
+        ORDER BY fecha {direccion}, id {direccion}
+        {'LIMIT %(limite)s' if con_limite else ''}
+    """
+
+
+def nombres_columnas(columnas):
+    """Nombres de las columnas de las filas de `sql_keyset` (format=columns)."""
+    return ['fecha', 'id', *columnas]
+
+
+def pagina(cur, tabla, columnas, id_atleta, params):
+    """Devuelve (filas, cursor_siguiente); las filas empiezan por (fecha, id)."""
+    cur.execute(sql_keyset(tabla, columnas, params["orden"], True), dict(params, id_atleta=id_atleta))
+    filas = cur.fetchall()
+    siguiente = None
+    if params["limite"] is not None and len(filas) == params["limite"]:
+        siguiente = codificar_cursor(filas[-1][0], filas[-1][1])
+    return filas, siguiente
+
+
+async def pagina_async(cur, tabla, columnas, id_atleta, params):
+    """Igual que `pagina` con un cursor async de psycopg 3."""
+    await cur.execute(sql_keyset(tabla, columnas, params["orden"], True), dict(params, id_atleta=id_atleta))
+    filas = await cur.fetchall()
+    siguiente = None
+    if params["limite"] is not None and len(filas) == params["limite"]:
+        siguiente = codificar_cursor(filas[-1][0], filas[-1][1])
+    return filas, siguiente
+
+
+def transmitir(conn, liberar, tabla, columnas, id_atleta, params, a_dict, prefijo='[', sufijo=']'):
+    """Respuesta JSON por trozos leída con un cursor de servidor (memoria constante).
+
+    La consulta se abre antes de devolver la respuesta para que los errores de
+    SQL todavía puedan responderse con 500. `liberar(conn)` se llama al cerrar
+    la respuesta, tanto si se consumió entera como si el cliente cortó. Con
+    `a_dict` None se transmiten las tuplas del cursor (format=columns).
+    """
+    cur = conn.cursor(name=f"historial_{tabla}")
+    cur.itersize = STREAM_ITERSIZE
+    cur.execute(sql_keyset(tabla, columnas, params["orden"], False), dict(params, id_atleta=id_atleta))
+
+    def generar():
+        yield prefijo
+        primera = True
+        while True:
+            filas = cur.fetchmany(STREAM_ITERSIZE)
+            if not filas:
+                break
+            trozo = serializacion.trozo(filas if a_dict is None else [a_dict(fila) for fila in filas])
+            yield trozo if primera else b',' + trozo
+            primera = False
+        yield sufijo
+
+    respuesta = Response(generar(), mimetype='application/json')
+    respuesta.call_on_close(lambda: liberar(conn))
+    return respuesta
@@ -0,0 +1,198 @@
+import math
+import os
+
+# ——— Configuración ———
+HRV_BASELINE_VENTANA = int(os.getenv('HRV_BASELINE_VENTANA', '30'))  # lecturas previas en la línea base
+HRV_BASELINE_MIN = int(os.getenv('HRV_BASELINE_MIN', '7'))  # lecturas mínimas para dar un estado
+HRV_Z_UMBRAL = float(os.getenv('HRV_Z_UMBRAL', '1.0'))
+
+# La línea base son las últimas HRV_BASELINE_VENTANA lecturas anteriores a la
+# actual (media y M2 de Welford sobre ln(rMSSD)). Cada lectura nueva empuja la
+# anterior a la ventana y, si se llena, saca la más antigua: el coste por
+# escritura y por lectura no depende del tamaño del histórico.
+DDL_BASELINE = """
+    CREATE TABLE IF NOT EXISTS hrv_baseline (
+        id_atleta INTEGER PRIMARY KEY,
+        n INTEGER NOT NULL DEFAULT 0,
+        media_ln DOUBLE PRECISION NOT NULL DEFAULT 0,
+        m2_ln DOUBLE PRECISION NOT NULL DEFAULT 0,
+        ln_actual DOUBLE PRECISION,
+        fecha_actual DATE,
+        actualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+"""
+
+SQL_ASEGURAR = "INSERT INTO hrv_baseline (id_atleta) VALUES (%s) ON CONFLICT (id_atleta) DO NOTHING"
+
+SQL_BLOQUEAR = """
+    SELECT n, media_ln, m2_ln, ln_actual, fecha_actual
+    FROM hrv_baseline WHERE id_atleta = %s FOR UPDATE
+"""
+
+SQL_LECTURA_EN = """
+    SELECT hrv FROM hrv
+    WHERE id_atleta = %s AND hrv > 0
+    ORDER BY fecha DESC, id DESC
+    OFFSET %s LIMIT 1
+"""
+
+SQL_ULTIMAS = """
+    SELECT hrv, fecha FROM hrv
+    WHERE id_atleta = %s AND hrv > 0
+    ORDER BY fecha DESC, id DESC
+    LIMIT %s
+"""
+
+SQL_GUARDAR = """
+    INSERT INTO hrv_baseline (id_atleta, n, media_ln, m2_ln, ln_actual, fecha_actual, actualizado)
+    VALUES (%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+    ON CONFLICT (id_atleta) DO UPDATE SET
+      n = EXCLUDED.n,
+      media_ln = EXCLUDED.media_ln,
+      m2_ln = EXCLUDED.m2_ln,
+      ln_actual = EXCLUDED.ln_actual,
+      fecha_actual = EXCLUDED.fecha_actual,
+      actualizado = EXCLUDED.actualizado
+"""
+
+SQL_ESTADO = "SELECT n, media_ln, m2_ln, ln_actual FROM hrv_baseline WHERE id_atleta = %s"
+
+
+# ——— Estadística de Welford ———
+def agregar(n, media, m2, x):
+    n += 1
+    delta = x - media
+    media += delta / n
+    m2 += delta * (x - media)
+    return n, media, m2
+
+
+def quitar(n, media, m2, x):
+    if n <= 1:
+        return 0, 0.0, 0.0
+    media_ant = (n * media - x) / (n - 1)
+    m2 -= (x - media) * (x - media_ant)
+    return n - 1, media_ant, max(m2, 0.0)
+
+
+def estado_hrv(n, media, m2, ln_actual):
+    """Resumen de estado o None si aún no hay suficientes lecturas."""
+    if ln_actual is None or n < max(HRV_BASELINE_MIN, 2):
+        return None
+    sd = math.sqrt(m2 / (n - 1))
+    z = (ln_actual - media) / sd if sd > 0 else 0.0
+    if z < -HRV_Z_UMBRAL:
+        estado = "bajo"
+    elif z > HRV_Z_UMBRAL:
+        estado = "alto"
+    else:
+        estado = "normal"
+    return {
+        "baseline_ln": media,
+        "sd_ln": sd,
+        "ln_actual": ln_actual,
+        "z_score": z,
+        "estado": estado,
+        "n_mediciones": n
+    }
+
+
+# ——— Mantenimiento ———
+def recalcular(cur, id_atleta):
+    """Reconstruye la línea base desde las últimas lecturas (p. ej. tras cargas fuera de orden)."""
+    cur.execute(SQL_ULTIMAS, (id_atleta, HRV_BASELINE_VENTANA + 1))
+    filas = cur.fetchall()
+    n, media, m2 = 0, 0.0, 0.0
+    ln_actual, fecha_actual = None, None
+    if filas:
+        ln_actual, fecha_actual = math.log(filas[0][0]), filas[0][1]
+        for hrv, _ in reversed(filas[1:]):
+            n, media, m2 = agregar(n, media, m2, math.log(hrv))
+    cur.execute(SQL_GUARDAR, (id_atleta, n, media, m2, ln_actual, fecha_actual))
+
+
+def registrar_lectura(cur, id_atleta, hrv, fecha):
+    """Actualiza la línea base tras insertar una lectura, dentro de la misma transacción."""
+    if hrv is None or hrv <= 0:
+        return
+    cur.execute(SQL_ASEGURAR, (id_atleta,))
+    cur.execute(SQL_BLOQUEAR, (id_atleta,))
+    n, media, m2, ln_actual, fecha_actual = cur.fetchone()
+
+    if fecha_actual is not None and fecha < fecha_actual:
+        recalcular(cur, id_atleta)
+        return
+
+    if ln_actual is not None:
+        n, media, m2 = agregar(n, media, m2, ln_actual)
+        if n > HRV_BASELINE_VENTANA:
+            # actual en offset 0, ventana en 1..VENTANA: sale la de VENTANA + 1
+            cur.execute(SQL_LECTURA_EN, (id_atleta, HRV_BASELINE_VENTANA + 1))
+            saliente = cur.fetchone()
+            if saliente:
+                n, media, m2 = quitar(n, media, m2, math.log(saliente[0]))
+
+    cur.execute(SQL_GUARDAR, (id_atleta, n, media, m2, math.log(hrv), fecha))
+
+
+def recalcular_pendientes(cur):
+    """Crea la línea base de los atletas con lecturas pero sin fila en hrv_baseline."""
+    cur.execute("""
+        SELECT DISTINCT id_atleta FROM hrv
+        WHERE NOT EXISTS (SELECT 1 FROM hrv_baseline b WHERE b.id_atleta = hrv.id_atleta)
+    """)
+    for (id_atleta,) in cur.fetchall():
+        recalcular(cur, id_atleta)
+
+
+def obtener_estado(cur, id_atleta):
+    cur.execute(SQL_ESTADO, (id_atleta,))
+    fila = cur.fetchone()
+    if not fila:
+        return None
+    return estado_hrv(*fila)
+
+
+# ——— Variantes async (cursor de psycopg 3, usadas por asgi.py) ———
+# Mismo SQL y misma lógica que las funciones de arriba; cualquier cambio debe
+# hacerse en las dos.
+async def recalcular_async(cur, id_atleta):
+    await cur.execute(SQL_ULTIMAS, (id_atleta, HRV_BASELINE_VENTANA + 1))
+    filas = await cur.fetchall()
+    n, media, m2 = 0, 0.0, 0.0
+    ln_actual, fecha_actual = None, None
+    if filas:
+        ln_actual, fecha_actual = math.log(filas[0][0]), filas[0][1]
+        for hrv, _ in reversed(filas[1:]):
+            n, media, m2 = agregar(n, media, m2, math.log(hrv))
+    await cur.execute(SQL_GUARDAR, (id_atleta, n, media, m2, ln_actual, fecha_actual))
+
+
+async def registrar_lectura_async(cur, id_atleta, hrv, fecha):
+    if hrv is None or hrv <= 0:
+        return
+    await cur.execute(SQL_ASEGURAR, (id_atleta,))
+    await cur.execute(SQL_BLOQUEAR, (id_atleta,))
+    n, media, m2, ln_actual, fecha_actual = await cur.fetchone()
+
+    if fecha_actual is not None and fecha < fecha_actual:
+        await recalcular_async(cur, id_atleta)
+        return
+
+    if ln_actual is not None:
+        n, media, m2 = agregar(n, media, m2, ln_actual)
+        if n > HRV_BASELINE_VENTANA:
+            await cur.execute(SQL_LECTURA_EN, (id_atleta, HRV_BASELINE_VENTANA + 1))
+            saliente = await cur.fetchone()
+            if saliente:
+                n, media, m2 = quitar(n, media, m2, math.log(saliente[0]))
+
+    await cur.execute(SQL_GUARDAR, (id_atleta, n, media, m2, math.log(hrv), fecha))
+
+
+async def obtener_estado_async(cur, id_atleta):
+    await cur.execute(SQL_ESTADO, (id_atleta,))
+    fila = await cur.fetchone()
+    if not fila:
+        return None
+    return estado_hrv(*fila)
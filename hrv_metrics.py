@@ -0,0 +1,69 @@
+import os
+import warnings
+
+import numpy as np
+
+# ——— Configuración ———
+RR_MIN_MS = float(os.getenv('RR_MIN_MS', '300'))
+RR_MAX_MS = float(os.getenv('RR_MAX_MS', '2000'))
+RR_SALTO_MAX = float(os.getenv('RR_SALTO_MAX', '0.2'))  # cambio relativo máximo entre latidos
+RR_MIN_VALIDOS = int(os.getenv('RR_MIN_VALIDOS', '10'))
+
+METRICAS = ('hrv', 'sdnn', 'pnn50', 'mean_rr', 'bpm', 'calidad_rr')
+
+
+def _matriz(series):
+    """Empaqueta series de longitud variable en una matriz rellena con NaN."""
+    longitudes = np.fromiter((len(s) for s in series), dtype=np.int64, count=len(series))
+    matriz = np.full((len(series), max(int(longitudes.max(initial=0)), 1)), np.nan)
+    if longitudes.sum():
+        filas = np.repeat(np.arange(len(series)), longitudes)
+        inicios = np.repeat(np.cumsum(longitudes) - longitudes, longitudes)
+        columnas = np.arange(longitudes.sum()) - inicios
+        matriz[filas, columnas] = np.concatenate([np.asarray(s, dtype=float) for s in series if len(s)])
+    return matriz, longitudes
+
+
+def calcular_metricas_lote(series):
+    """Métricas de HRV para varias series de intervalos RR (ms) a la vez.
+
+    Un latido es artefacto si cae fuera de [RR_MIN_MS, RR_MAX_MS] o difiere más
+    de RR_SALTO_MAX del anterior (latido ectópico). Los artefactos se descartan
+    y las diferencias sucesivas sólo se usan entre latidos válidos contiguos.
+    `calidad_rr` es la fracción de latidos válidos. Devuelve un dict de arrays;
+    las series con menos de RR_MIN_VALIDOS latidos válidos quedan en NaN.
+    """
+    rr, longitudes = _matriz(series)
+
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        validos = (rr >= RR_MIN_MS) & (rr <= RR_MAX_MS)
+        salto = np.abs(np.diff(rr, axis=1)) / rr[:, :-1]
+        validos[:, 1:] &= ~(salto > RR_SALTO_MAX)
+
+        limpio = np.where(validos, rr, np.nan)
+        diferencias = np.diff(limpio, axis=1)
+        n_validos = validos.sum(axis=1)
+        n_diferencias = np.count_nonzero(~np.isnan(diferencias), axis=1)
+
+        rmssd = np.sqrt(np.nanmean(diferencias ** 2, axis=1))
+        sdnn = np.nanstd(limpio, axis=1, ddof=1)
+        pnn50 = 100.0 * np.nansum(np.abs(diferencias) > 50, axis=1) / n_diferencias
+        mean_rr = np.nanmean(limpio, axis=1)
+        bpm = 60000.0 / mean_rr
+        calidad = n_validos / np.maximum(longitudes, 1)
+
+    insuficiente = (n_validos < RR_MIN_VALIDOS) | (n_diferencias == 0)
+    resultado = {
+        'hrv': rmssd, 'sdnn': sdnn, 'pnn50': pnn50, 'mean_rr': mean_rr, 'bpm': bpm,
+    }
+    for nombre in resultado:
+        resultado[nombre][insuficiente] = np.nan
+    resultado['calidad_rr'] = calidad
+    return resultado
+
+
+def calcular_metricas(rr_intervals):
+    """Métricas de una sola serie como dict de floats (None si no son calculables)."""
+    lote = calcular_metricas_lote([rr_intervals])
+    return {nombre: (float(lote[nombre][0]) if np.isfinite(lote[nombre][0]) else None) for nombre in METRICAS}
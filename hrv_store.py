@@ -0,0 +1,288 @@
+import csv
+import io
+import json
+import math
+import os
+from datetime import date
+
+from psycopg2.extras import execute_values
+
+import hrv_baseline
+import hrv_metrics
+import resumenes
+
+# ——— Configuración ———
+HRV_BULK_LOTE = int(os.getenv('HRV_BULK_LOTE', '5000'))  # filas por COPY dentro de la transacción
+HRV_BULK_MAX_ERRORES = int(os.getenv('HRV_BULK_MAX_ERRORES', '100'))
+
+COLUMNAS = ('id_atleta', 'fecha', 'hrv', 'mean_rr', 'bpm', 'calidad_senal', 'duracion', 'rr_intervals_ms',
+            'sdnn', 'pnn50', 'calidad_rr')
+_POS = {columna: i for i, columna in enumerate(COLUMNAS)}
+
+DDL_COLUMNAS = """
+    ALTER TABLE hrv
+      ADD COLUMN IF NOT EXISTS mean_rr REAL,
+      ADD COLUMN IF NOT EXISTS bpm REAL,
+      ADD COLUMN IF NOT EXISTS calidad_senal INTEGER,
+      ADD COLUMN IF NOT EXISTS duracion INTEGER,
+      ADD COLUMN IF NOT EXISTS rr_intervals JSONB,
+      ADD COLUMN IF NOT EXISTS rr_intervals_ms REAL[],
+      ADD COLUMN IF NOT EXISTS sdnn REAL,
+      ADD COLUMN IF NOT EXISTS pnn50 REAL,
+      ADD COLUMN IF NOT EXISTS calidad_rr REAL;
+"""
+
+
+def _opcional(valor, tipo):
+    return tipo(valor) if valor is not None else None
+
+
+def normalizar_lectura(data, calcular=True):
+    """Valida una lectura y la convierte en lista en el orden de COLUMNAS.
+
+    Si llegan `rr_intervals`, las métricas (hrv = rMSSD, mean_rr, bpm, sdnn,
+    pnn50, calidad_rr) se calculan en el servidor y prevalecen sobre las del
+    cliente; con `calcular=False` se dejan para `completar_metricas`.
+    Lanza ValueError con un mensaje apto para el cliente.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("La lectura debe ser un objeto")
+    rr = data.get("rr_intervals")
+    if data.get("id_atleta") is None or (data.get("hrv") is None and rr is None):
+        raise ValueError("Faltan datos obligatorios")
+
+    if rr is not None:
+        if not isinstance(rr, list):
+            raise ValueError("rr_intervals debe ser una lista")
+        try:
+            rr = [float(x) for x in rr]
+        except (TypeError, ValueError):
+            raise ValueError("rr_intervals debe contener números")
+        if not all(math.isfinite(x) and x > 0 for x in rr):
+            raise ValueError("rr_intervals debe contener valores positivos")
+
+    try:
+        fila = [
+            int(data["id_atleta"]),
+            date.fromisoformat(data["fecha"]) if data.get("fecha") else date.today(),
+            _opcional(data.get("hrv"), float),
+            _opcional(data.get("mean_rr"), float),
+            _opcional(data.get("bpm"), float),
+            _opcional(data.get("calidad_senal"), int),
+            _opcional(data.get("duracion"), int),
+            rr,
+            None,
+            None,
+            None,
+        ]
+    except (TypeError, ValueError):
+        raise ValueError("Formato inválido")
+    if fila[_POS['hrv']] is not None and not math.isfinite(fila[_POS['hrv']]):
+        raise ValueError("hrv debe ser un número finito")
+
+    if calcular and rr is not None:
+        _aplicar_metricas(fila, hrv_metrics.calcular_metricas(rr))
+        if fila[_POS['hrv']] is None:
+            raise ValueError("rr_intervals sin suficientes latidos válidos")
+    return fila
+
+
+def _aplicar_metricas(fila, metricas):
+    fila[_POS['calidad_rr']] = metricas['calidad_rr']
+    if metricas['hrv'] is None:
+        return
+    for nombre in ('hrv', 'mean_rr', 'bpm', 'sdnn', 'pnn50'):
+        fila[_POS[nombre]] = metricas[nombre]
+
+
+def completar_metricas(filas):
+    """Calcula de una vez (NumPy) las métricas de todas las filas con intervalos RR."""
+    con_rr = [fila for fila in filas if fila[_POS['rr_intervals_ms']] is not None]
+    if not con_rr:
+        return
+    lote = hrv_metrics.calcular_metricas_lote([fila[_POS['rr_intervals_ms']] for fila in con_rr])
+    for i, fila in enumerate(con_rr):
+        _aplicar_metricas(fila, {
+            nombre: (float(lote[nombre][i]) if math.isfinite(lote[nombre][i]) else None)
+            for nombre in hrv_metrics.METRICAS
+        })
+
+
+def leer_ndjson(stream):
+    """Itera (índice, objeto) de un cuerpo NDJSON sin cargarlo entero en memoria."""
+    if isinstance(stream, io.RawIOBase):
+        # readline() de un stream sin buffer lee byte a byte
+        stream = io.BufferedReader(stream, buffer_size=1024 * 1024)
+    for indice, linea in enumerate(stream):
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            yield indice, json.loads(linea)
+        except ValueError:
+            yield indice, None
+
+
+SQL_INSERTAR = f"""
+    INSERT INTO hrv ({', '.join(COLUMNAS)})
+    VALUES ({', '.join(['%s'] * len(COLUMNAS))})
+    RETURNING fecha, hrv
+"""
+
+
+def insertar_lectura(cur, fila):
+    """Inserta una lectura y actualiza la línea base del atleta."""
+    cur.execute(SQL_INSERTAR, fila)
+    fecha, hrv_guardado = cur.fetchone()
+    hrv_baseline.registrar_lectura(cur, fila[0], hrv_guardado, fecha)
+    resumenes.registrar(cur, 'hrv', fila[0], [fecha])
+
+
+async def insertar_lectura_async(cur, fila):
+    """Igual que `insertar_lectura` con un cursor async de psycopg 3."""
+    await cur.execute(SQL_INSERTAR, fila)
+    fecha, hrv_guardado = await cur.fetchone()
+    await hrv_baseline.registrar_lectura_async(cur, fila[0], hrv_guardado, fecha)
+    await resumenes.registrar_async(cur, 'hrv', fila[0], [fecha])
+
+
+def _formato_copy(fila):
+    fila = list(fila)
+    rr = fila[_POS['rr_intervals_ms']]
+    if rr is not None:
+        fila[_POS['rr_intervals_ms']] = '{' + ','.join(map(repr, rr)) + '}'
+    return fila
+
+
+def copiar_lecturas(cur, filas):
+    """Escribe un bloque de lecturas con COPY ... FROM STDIN (CSV)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for fila in filas:
+        writer.writerow(_formato_copy(fila))
+    buffer.seek(0)
+    cur.copy_expert(f"COPY hrv ({', '.join(COLUMNAS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def insertar_lecturas(cur, lecturas):
+    """Valida e inserta un iterable de (índice, objeto) en bloques de HRV_BULK_LOTE.
+
+    Las filas inválidas se saltan; se devuelve cuántas fueron, el detalle de las
+    primeras HRV_BULK_MAX_ERRORES y los atletas afectados, cuya línea base y
+    resúmenes se recalculan al terminar. No hace commit.
+    """
+    insertadas = 0
+    rechazadas = 0
+    errores = []
+    atletas = set()
+    dias = set()
+    bloque = []
+
+    def rechazar(indice, mensaje):
+        nonlocal rechazadas
+        rechazadas += 1
+        if len(errores) < HRV_BULK_MAX_ERRORES:
+            errores.append({"fila": indice, "error": mensaje})
+
+    def volcar():
+        completar_metricas([fila for _, fila in bloque])
+        filas = []
+        for indice, fila in bloque:
+            if fila[_POS['hrv']] is None:
+                rechazar(indice, "rr_intervals sin suficientes latidos válidos")
+            else:
+                filas.append(fila)
+                atletas.add(fila[0])
+                dias.add((fila[0], fila[_POS['fecha']]))
+        if filas:
+            copiar_lecturas(cur, filas)
+        return len(filas)
+
+    for indice, data in lecturas:
+        try:
+            if data is None:
+                raise ValueError("JSON inválido")
+            bloque.append((indice, normalizar_lectura(data, calcular=False)))
+        except ValueError as e:
+            rechazar(indice, str(e))
+            continue
+        if len(bloque) >= HRV_BULK_LOTE:
+            insertadas += volcar()
+            bloque = []
+
+    if bloque:
+        insertadas += volcar()
+
+    for id_atleta in sorted(atletas):
+        hrv_baseline.recalcular(cur, id_atleta)
+    resumenes.registrar_filas(cur, 'hrv', dias)
+
+    return insertadas, rechazadas, errores, atletas
+
+
+def recalcular_metricas(conn, lote=1000):
+    """Recalcula las métricas de toda la tabla hrv desde los intervalos RR guardados.
+
+    Recorre la tabla con un cursor de servidor en bloques de `lote` filas y
+    migra de paso los `rr_intervals` en JSON a `rr_intervals_ms`. Hace commit
+    por bloque y al final reconstruye las líneas base y los resúmenes. Devuelve
+    las filas tocadas.
+    """
+    actualizadas = 0
+    atletas = set()
+    with conn.cursor(name='recalcular_hrv', withhold=True) as lector:
+        lector.itersize = lote
+        lector.execute("""
+            SELECT id, id_atleta, rr_intervals_ms, rr_intervals::text
+            FROM hrv
+            WHERE rr_intervals_ms IS NOT NULL OR rr_intervals IS NOT NULL
+        """)
+        while True:
+            filas = lector.fetchmany(lote)
+            if not filas:
+                break
+            ids, series, migradas = [], [], []
+            for id_hrv, id_atleta, rr, rr_json in filas:
+                migrada = None
+                if rr is None:
+                    try:
+                        rr = migrada = [float(x) for x in json.loads(rr_json)]
+                    except (TypeError, ValueError):
+                        continue
+                ids.append(id_hrv)
+                series.append(rr)
+                migradas.append(migrada)
+                atletas.add(id_atleta)
+            if not ids:
+                continue
+
+            m = hrv_metrics.calcular_metricas_lote(series)
+            valores = []
+            for i, id_hrv in enumerate(ids):
+                valores.append((id_hrv, migradas[i]) + tuple(
+                    float(m[nombre][i]) if math.isfinite(m[nombre][i]) else None
+                    for nombre in hrv_metrics.METRICAS
+                ))
+            with conn.cursor() as cur:
+                execute_values(cur, """
+                    UPDATE hrv SET
+                      rr_intervals_ms = COALESCE(v.rr::real[], hrv.rr_intervals_ms),
+                      hrv = COALESCE(v.hrv::real, hrv.hrv),
+                      sdnn = v.sdnn::real,
+                      pnn50 = v.pnn50::real,
+                      mean_rr = COALESCE(v.mean_rr::real, hrv.mean_rr),
+                      bpm = COALESCE(v.bpm::real, hrv.bpm),
+                      calidad_rr = v.calidad_rr::real
+                    FROM (VALUES %s) AS v(id, rr, hrv, sdnn, pnn50, mean_rr, bpm, calidad_rr)
+                    WHERE hrv.id = v.id
+                """, valores, page_size=lote)
+            conn.commit()
+            actualizadas += len(ids)
+
+    with conn.cursor() as cur:
+        for id_atleta in sorted(atletas):
+            hrv_baseline.recalcular(cur, id_atleta)
+        if atletas:
+            resumenes.recalcular(cur, 'hrv', atletas)
+    conn.commit()
+    return actualizadas
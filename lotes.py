@@ -0,0 +1,221 @@
+import functools
+import os
+from collections import namedtuple
+from datetime import date, datetime
+
+from psycopg2.extras import execute_values
+
+import carga_entrenamiento
+import resumenes
+
+# ——— Configuración ———
+LOTE_MAX_REGISTROS = int(os.getenv('LOTE_MAX_REGISTROS', '10000'))
+LOTE_MAX_ERRORES = int(os.getenv('LOTE_MAX_ERRORES', '100'))
+LOTE_PAGINA = int(os.getenv('LOTE_PAGINA', '1000'))  # filas por sentencia de execute_values
+
+# Un campo del JSON y la columna a la que va. Los opcionales vacíos toman
+# `defecto`; `sql_defecto` se aplica en la base de datos (p. ej. CURRENT_DATE).
+Campo = namedtuple('Campo', 'nombre columna tipo obligatorio defecto sql_defecto',
+                   defaults=(True, None, None))
+# `conflicto`: columnas del ON CONFLICT ... DO UPDATE (None: sólo INSERT).
+# `al_escribir(cur, filas)` mantiene lo que dependa de la tabla, en la misma transacción.
+Recurso = namedtuple('Recurso', 'tabla campos conflicto al_escribir', defaults=(None, None))
+
+
+@functools.lru_cache(maxsize=4096)
+def _fecha(valor):
+    # Las hojas de cálculo repiten mucho las fechas: cada una se interpreta una vez
+    return date.fromisoformat(valor)
+
+
+@functools.lru_cache(maxsize=4096)
+def _fecha_hora(valor):
+    return datetime.fromisoformat(valor)
+
+
+def _entero(valor):
+    if isinstance(valor, float) and not valor.is_integer():
+        raise ValueError(valor)
+    return int(valor)
+
+
+def _real(valor):
+    if isinstance(valor, bool):
+        raise ValueError(valor)
+    return float(valor)
+
+
+def _texto(valor):
+    if isinstance(valor, (dict, list)):
+        raise ValueError(valor)
+    return str(valor)
+
+
+CONVERSORES = {
+    'entero': _entero,
+    'real': _real,
+    'texto': _texto,
+    'fecha': lambda v: _fecha(v[:10]) if isinstance(v, str) else _fecha(v),
+    'fecha_hora': _fecha_hora,
+}
+
+# Mismos nombres de campo que las rutas de un registro (/psicologia, /medico...)
+RECURSOS = {
+    'psicologia': Recurso('psicologia', [
+        Campo('atleta_id', 'atleta_id', 'entero'),
+        Campo('estado_emocional', 'estado_emocional', 'texto'),
+        Campo('motivacion', 'motivacion', 'texto'),
+        Campo('estres', 'estres', 'entero'),
+        Campo('observaciones', 'observaciones', 'texto', False, ''),
+    ]),
+    'nutricion': Recurso('nutricion', [
+        Campo('id_atleta', 'id_atleta', 'entero'),
+        Campo('fecha', 'fecha', 'fecha'),
+        Campo('peso', 'peso', 'real'),
+        Campo('altura', 'altura', 'real'),
+        Campo('imc', 'imc', 'real'),
+        Campo('observaciones', 'observaciones', 'texto'),
+    ], conflicto=('id_atleta', 'fecha')),
+    'medico': Recurso('medico', [
+        Campo('id_atleta', 'atleta_id', 'entero'),
+        Campo('fecha', 'fecha', 'fecha'),
+        Campo('temperatura', 'temperatura', 'real'),
+        Campo('presion_arterial', 'presion_arterial', 'texto'),
+        Campo('diagnostico', 'diagnostico', 'texto'),
+        Campo('tratamiento', 'tratamiento', 'texto'),
+        Campo('observaciones', 'observaciones', 'texto'),
+    ]),
+    'entrenamiento': Recurso('entrenamiento', [
+        Campo('atleta_id', 'id_atleta', 'entero'),
+        Campo('tipo_entrenamiento', 'tipo_entrenamiento', 'texto'),
+        Campo('duracion', 'duracion', 'entero'),
+        Campo('intensidad', 'intensidad', 'texto'),
+        Campo('observaciones', 'observaciones', 'texto'),
+        Campo('fecha', 'fecha', 'fecha', False, None, 'CURRENT_DATE'),
+    ], al_escribir=lambda cur, filas: carga_entrenamiento.registrar_filas(cur, [(f[0], f[5]) for f in filas])),
+    'evento': Recurso('evento', [
+        Campo('id_atleta', 'id_atleta', 'entero'),
+        Campo('nombre', 'nombre', 'texto'),
+        Campo('fecha', 'fecha', 'fecha'),
+        Campo('lugar', 'lugar', 'texto'),
+        Campo('descripcion', 'descripcion', 'texto'),
+    ]),
+    'autoseguimiento': Recurso('autoseguimiento', [
+        Campo('id_atleta', 'id_atleta', 'entero'),
+        Campo('calidad_sueno', 'calidad_sueno', 'entero', False),
+        Campo('horas_sueno', 'horas_sueno', 'real', False),
+        Campo('fatiga', 'fatiga', 'entero', False),
+        Campo('dolor_muscular', 'dolor_muscular', 'entero', False),
+        Campo('estres', 'estres', 'entero', False),
+        Campo('estado_animo', 'estado_animo', 'entero', False),
+        Campo('comentarios', 'comentarios', 'texto', False),
+        # para importar históricos; sin ella, la hora actual como en /add_autoseguimiento
+        Campo('fecha_registro', 'fecha_registro', 'fecha_hora', False, None, 'CURRENT_TIMESTAMP'),
+    ], al_escribir=lambda cur, filas: resumenes.registrar_filas(cur, 'autoseguimiento',
+                                                                [(f[0], f[8]) for f in filas])),
+}
+
+
+def validar(recurso, registros):
+    """Valida y convierte los registros columna a columna.
+
+    Devuelve (indices, columnas, errores): los índices de los registros válidos,
+    una lista de valores por campo alineada con `indices` y un dict
+    índice -> mensaje con el primer error de cada registro rechazado.
+    """
+    errores = {i: "El registro debe ser un objeto" for i, r in enumerate(registros) if not isinstance(r, dict)}
+    crudas = []
+    for campo in recurso.campos:
+        convertir = CONVERSORES[campo.tipo]
+        valores = []
+        for i, registro in enumerate(registros):
+            if i in errores:
+                valores.append(None)
+                continue
+            valor = registro.get(campo.nombre)
+            # como en las rutas de un registro, un texto vacío es un valor; una
+            # celda vacía en un campo numérico o de fecha cuenta como ausente
+            if valor is None or (valor == '' and campo.tipo != 'texto'):
+                if campo.obligatorio:
+                    errores[i] = f"{campo.nombre} es obligatorio"
+                valores.append(campo.defecto)
+                continue
+            try:
+                valores.append(convertir(valor))
+            except (TypeError, ValueError, OverflowError):
+                errores[i] = f"{campo.nombre}: formato inválido"
+                valores.append(None)
+        crudas.append(valores)
+
+    indices = [i for i in range(len(registros)) if i not in errores]
+    columnas = [[valores[i] for i in indices] for valores in crudas]
+    return indices, columnas, errores
+
+
+def _sql(recurso):
+    columnas = [campo.columna for campo in recurso.campos]
+    plantilla = ', '.join(
+        f"COALESCE(%s, {campo.sql_defecto})" if campo.sql_defecto else '%s' for campo in recurso.campos
+    )
+    sql = f"INSERT INTO {recurso.tabla} ({', '.join(columnas)}) VALUES %s"
+    if recurso.conflicto:
+        actualizar = [c for c in columnas if c not in recurso.conflicto]
+        sql += f"""
+            ON CONFLICT ({', '.join(recurso.conflicto)}) DO UPDATE SET
+              {', '.join(f'{c} = EXCLUDED.{c}' for c in actualizar)}
+            RETURNING (xmax = 0)
+        """
+    return sql, f"({plantilla})"
+
+
+def escribir(cur, recurso, registros, lineas=None):
+    """Valida e inserta una lista de registros en una sola transacción (sin commit).
+
+    Los registros inválidos o de atletas inexistentes se saltan y se informan
+    por índice: su posición en `registros` o, con `lineas`, la línea de cada
+    uno en el cuerpo NDJSON. Con `conflicto`, si un mismo par se repite en el
+    lote gana el último, como si se hubieran enviado uno a uno.
+    Devuelve un dict con insertadas, actualizadas, rechazadas, errores y atletas.
+    """
+    indices, columnas, errores = validar(recurso, registros)
+    atleta = columnas[0]
+
+    if indices:
+        cur.execute("SELECT id_atleta FROM atletas WHERE id_atleta = ANY(%s)", (sorted(set(atleta)),))
+        existentes = {fila[0] for fila in cur.fetchall()}
+        for i, id_atleta in zip(indices, atleta):
+            if id_atleta not in existentes:
+                errores[i] = "Atleta no encontrado"
+
+    en_conflicto = [i for i, campo in enumerate(recurso.campos) if campo.columna in (recurso.conflicto or ())]
+    filas = {}
+    for posicion, i in enumerate(indices):
+        if i in errores:
+            continue
+        fila = tuple(valores[posicion] for valores in columnas)
+        clave = tuple(fila[k] for k in en_conflicto) if recurso.conflicto else i
+        filas.pop(clave, None)
+        filas[clave] = fila
+
+    insertadas = actualizadas = 0
+    if filas:
+        sql, plantilla = _sql(recurso)
+        resultado = execute_values(cur, sql, list(filas.values()), template=plantilla, page_size=LOTE_PAGINA,
+                                   fetch=bool(recurso.conflicto))
+        if recurso.conflicto:
+            insertadas = sum(1 for (nueva,) in resultado if nueva)
+            actualizadas = len(resultado) - insertadas
+        else:
+            insertadas = len(filas)
+        if recurso.al_escribir:
+            recurso.al_escribir(cur, list(filas.values()))
+
+    return {
+        "insertadas": insertadas,
+        "actualizadas": actualizadas,
+        "rechazadas": len(errores),
+        "errores": [{"fila": lineas[i] if lineas else i, "error": errores[i]}
+                    for i in sorted(errores)[:LOTE_MAX_ERRORES]],
+        "atletas": {fila[0] for fila in filas.values()},
+    }
+
@@ -0,0 +1,154 @@
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# ——— Configuración ———
+# Límites superiores (s) de los buckets de todos los histogramas
+METRICAS_BUCKETS = tuple(float(b) for b in os.getenv(
+    'METRICAS_BUCKETS', '0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60'
+).split(','))
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '0'))  # registrar consultas más lentas (0: desactivado)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+# ——— Histogramas ———
+class Histograma:
+    """Histograma acumulado por combinación de etiquetas, en formato Prometheus.
+
+    Cada serie guarda el conteo por bucket (no acumulado), la suma y el total;
+    `observar` es una búsqueda binaria y tres sumas bajo un lock.
+    """
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=METRICAS_BUCKETS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # valores de etiquetas -> [conteos..., suma, total]
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *valores):
+        if _captura is not None:
+            _captura.append((self.nombre, valores, valor))
+            return
+        posicion = bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            serie[posicion] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    @contextmanager
+    def medir(self, *valores):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, *valores)
+
+    def exportar(self):
+        with self._lock:
+            series = sorted((k, list(v)) for k, v in self._series.items())
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        for valores, serie in series:
+            base = [f'{e}="{_escapar(v)}"' for e, v in zip(self.etiquetas, valores)]
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + (float('inf'),), serie):
+                acumulado += conteo
+                le = 'le="+Inf"' if limite == float('inf') else f'le="{limite!r}"'
+                lineas.append(f"{self.nombre}_bucket{{{','.join(base + [le])}}} {acumulado}")
+            sufijo = f"{{{','.join(base)}}}" if base else ''
+            lineas.append(f"{self.nombre}_sum{sufijo} {serie[-2]!r}")
+            lineas.append(f"{self.nombre}_count{sufijo} {serie[-1]}")
+        return lineas
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+_histogramas = {}
+
+
+def histograma(nombre, ayuda, etiquetas=()):
+    """Histograma registrado con ese nombre (se crea la primera vez)."""
+    if nombre not in _histogramas:
+        _histogramas[nombre] = Histograma(nombre, ayuda, etiquetas)
+    return _histogramas[nombre]
+
+
+PETICIONES = histograma('http_peticion_segundos', 'Latencia de las peticiones HTTP por ruta',
+                        ('ruta', 'metodo', 'estado'))
+POOL_ESPERA = histograma('db_pool_espera_segundos', 'Espera por una conexión del pool')
+POOL_RETENCION = histograma('db_pool_retencion_segundos', 'Tiempo que una conexión pasa prestada')
+CONSULTAS = histograma('db_consulta_segundos', 'Ejecución de sentencias SQL por operación y tabla',
+                       ('consulta',))
+ETAPAS = histograma('prediccion_etapa_segundos', 'Duración de cada etapa de la predicción', ('etapa',))
+
+
+# ——— Consultas ———
+_OPERACION = re.compile(r'\s*(\w+)')
+_TABLA = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN|TABLE)\s+([A-Za-z_][\w.]*)', re.IGNORECASE)
+
+
+def etiqueta_consulta(sql):
+    """'SELECT hrv', 'INSERT rpe'...: agrupa las sentencias sin disparar la cardinalidad."""
+    if isinstance(sql, bytes):
+        sql = sql[:400].decode('utf-8', 'replace')
+    elif not isinstance(sql, str):
+        sql = str(sql)
+    operacion = _OPERACION.match(sql)
+    tabla = _TABLA.search(sql, 0, 400)
+    return f"{operacion.group(1).upper() if operacion else '?'} {tabla.group(1).lower() if tabla else '-'}"
+
+
+def observar_consulta(sql, segundos):
+    CONSULTAS.observar(segundos, etiqueta_consulta(sql))
+    if SLOW_QUERY_MS and segundos * 1000 >= SLOW_QUERY_MS:
+        # Sólo el texto de la sentencia: los parámetros son datos de salud de los atletas
+        texto = sql.decode('utf-8', 'replace') if isinstance(sql, bytes) else str(sql)
+        logging.warning("Consulta lenta (%.1f ms): %s", segundos * 1000, ' '.join(texto.split())[:1000])
+
+
+# ——— Procesos del pool de predicción ———
+# Lo que se mide en un proceso hijo no llega al /metrics del proceso web: el hijo
+# captura sus observaciones y las devuelve con el resultado para que el padre
+# las vuelque en sus histogramas.
+_captura = None
+
+
+def ejecutar_capturando(fn, *args, **kwargs):
+    """Ejecuta `fn` en el proceso hijo y devuelve (resultado, observaciones)."""
+    global _captura
+    _captura = observaciones = []
+    try:
+        return fn(*args, **kwargs), observaciones
+    finally:
+        _captura = None
+
+
+def volcar(observaciones):
+    for nombre, valores, valor in observaciones:
+        if nombre in _histogramas:
+            _histogramas[nombre].observar(valor, *valores)
+
+
+# ——— Exportación ———
+def exportar(extra=()):
+    """Texto de exposición Prometheus de todos los histogramas.
+
+    `extra`: (nombre, tipo, ayuda, valor) de gauges o contadores calculados al vuelo.
+    """
+    lineas = []
+    for nombre, tipo, ayuda, valor in extra:
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}", f"{nombre} {valor!r}"]
+    for nombre in sorted(_histogramas):
+        lineas += _histogramas[nombre].exportar()
+    return '\n'.join(lineas) + '\n'
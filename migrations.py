@@ -0,0 +1,371 @@
+import argparse
+import functools
+import logging
+import sys
+from collections import namedtuple
+
+import busqueda
+import carga_entrenamiento
+import hrv_baseline
+import hrv_store
+import particiones
+import resumenes
+from db import conexion
+
+# ——— Migraciones de esquema ———
+# Cada migración se aplica una sola vez, en su propia transacción, y queda
+# registrada en schema_migrations. Un paso es una sentencia SQL o una función
+# que recibe el cursor. Se ejecutan desde la línea de comandos (ver start.sh),
+# no al importar la app en cada worker.
+Migracion = namedtuple('Migracion', 'version descripcion pasos')
+
+# Clave del pg_advisory_lock que serializa migraciones concurrentes
+LOCK_MIGRACIONES = 7261001
+
+ESQUEMA_INICIAL = [
+    """
+        CREATE TABLE IF NOT EXISTS atletas (
+            id_atleta SERIAL PRIMARY KEY,
+            nombre TEXT NOT NULL,
+            fecha_nacimiento DATE,
+            disciplina TEXT,
+            sexo TEXT,
+            direccion TEXT,
+            correo TEXT,
+            telefono TEXT,
+            genero TEXT,
+            nacionalidad TEXT,
+            condicion_fisica TEXT,
+            nivel_competitivo TEXT,
+            categoria_edad TEXT,
+            equipo TEXT,
+            fecha_ingreso DATE DEFAULT CURRENT_DATE,
+            lugar_nacimiento TEXT
+        );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS psicologia (
+            id SERIAL PRIMARY KEY,
+            atleta_id INTEGER NOT NULL,
+            estado_emocional TEXT,
+            motivacion TEXT,
+            estres INTEGER,
+            observaciones TEXT
+        );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS nutricion (
+            id SERIAL PRIMARY KEY,
+            id_atleta INTEGER NOT NULL,
+            fecha DATE NOT NULL,
+            peso REAL,
+            altura REAL,
+            imc REAL,
+            observaciones TEXT,
+            UNIQUE (id_atleta, fecha)
+        );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS medico (
+            id SERIAL PRIMARY KEY,
+            atleta_id INTEGER NOT NULL,
+            fecha DATE NOT NULL,
+            temperatura REAL,
+            presion_arterial TEXT,
+            diagnostico TEXT,
+            tratamiento TEXT,
+            observaciones TEXT
+        );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS entrenamiento (
+            id SERIAL PRIMARY KEY,
+            id_atleta INTEGER NOT NULL,
+            tipo_entrenamiento TEXT,
+            duracion INTEGER,
+            intensidad TEXT,
+            observaciones TEXT,
+            fecha DATE DEFAULT CURRENT_DATE
+        );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS evento (
+            id SERIAL PRIMARY KEY,
+            id_atleta INTEGER,
+            nombre TEXT,
+            fecha DATE,
+            lugar TEXT,
+            descripcion TEXT
+        );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS autoseguimiento (
+            id SERIAL PRIMARY KEY,
+            id_atleta INTEGER NOT NULL,
+            fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            calidad_sueno INTEGER,
+            horas_sueno REAL,
+            fatiga INTEGER,
+            dolor_muscular INTEGER,
+            estres INTEGER,
+            estado_animo INTEGER,
+            comentarios TEXT
+        );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS Consentimientos_Tutores (
+            id SERIAL PRIMARY KEY,
+            nombre_menor TEXT NOT NULL,
+            edad_menor INTEGER NOT NULL,
+            nombre_tutor TEXT NOT NULL,
+            relacion_tutor TEXT,
+            contacto_tutor TEXT NOT NULL,
+            aceptado BOOLEAN DEFAULT TRUE,
+            fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS hrv (
+            id SERIAL PRIMARY KEY,
+            id_atleta INTEGER NOT NULL,
+            fecha DATE NOT NULL,
+            hrv REAL
+        );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS rpe (
+            id SERIAL PRIMARY KEY,
+            id_atleta INTEGER NOT NULL,
+            fecha DATE NOT NULL,
+            rpe INTEGER,
+            notas TEXT
+        );
+    """,
+]
+
+# (tabla, columna del atleta, columnas de fecha) de las tablas por atleta
+TABLAS_POR_ATLETA = [
+    ('psicologia', 'atleta_id', ()),
+    ('nutricion', 'id_atleta', ('fecha',)),
+    ('medico', 'atleta_id', ('fecha',)),
+    ('entrenamiento', 'id_atleta', ('fecha',)),
+    ('evento', 'id_atleta', ('fecha',)),
+    ('autoseguimiento', 'id_atleta', ('fecha_registro',)),
+    ('hrv', 'id_atleta', ('fecha', 'id')),
+    ('rpe', 'id_atleta', ('fecha', 'id')),
+]
+
+
+def _renombrar_atleta_autoseguimiento(cur):
+    # init_db creaba `atleta_id` pero /add_autoseguimiento siempre escribió `id_atleta`
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'autoseguimiento'
+          AND column_name IN ('atleta_id', 'id_atleta')
+    """)
+    columnas = {fila[0] for fila in cur.fetchall()}
+    if columnas == {'atleta_id'}:
+        cur.execute("ALTER TABLE autoseguimiento RENAME COLUMN atleta_id TO id_atleta")
+
+
+def _indices_por_atleta():
+    pasos = []
+    for tabla, columna, fechas in TABLAS_POR_ATLETA:
+        if tabla == 'nutricion':
+            continue  # UNIQUE (id_atleta, fecha) ya crea el índice
+        columnas = ', '.join((columna,) + fechas)
+        pasos.append(f"CREATE INDEX IF NOT EXISTS {tabla}_atleta_fecha_idx ON {tabla} ({columnas})")
+    return pasos
+
+
+def _nombre_unico(cur):
+    # /crear_atleta responde 409 con un nombre repetido gracias a este índice.
+    # Si los datos ya tienen nombres repetidos, el CREATE fallaría con un
+    # error de PostgreSQL que sólo muestra uno; se listan todos para que se
+    # puedan renombrar o fusionar antes de volver a migrar.
+    cur.execute("SELECT to_regclass('atletas_nombre_key') IS NOT NULL")
+    if cur.fetchone()[0]:
+        return
+    cur.execute("""
+        SELECT nombre, array_agg(id_atleta ORDER BY id_atleta) FROM atletas
+        GROUP BY nombre HAVING count(*) > 1 ORDER BY nombre
+    """)
+    repetidos = cur.fetchall()
+    if repetidos:
+        lista = '; '.join(f"{nombre!r}: ids {', '.join(map(str, ids))}" for nombre, ids in repetidos)
+        raise RuntimeError(f"Hay {len(repetidos)} nombres de atleta repetidos y atletas.nombre debe ser único. "
+                           f"Renómbrelos o fusiónelos antes de migrar: {lista}")
+    cur.execute("CREATE UNIQUE INDEX atletas_nombre_key ON atletas (nombre)")
+
+
+def _claves_foraneas(cur):
+    # NOT VALID: se comprueban las filas nuevas sin recorrer ni bloquear el histórico
+    for tabla, columna, _ in TABLAS_POR_ATLETA + [('hrv_baseline', 'id_atleta', ())]:
+        nombre = f"{tabla}_{columna}_fkey"
+        cur.execute("SELECT 1 FROM pg_constraint WHERE conname = %s", (nombre,))
+        if cur.fetchone():
+            continue
+        cur.execute(f"""
+            ALTER TABLE {tabla} ADD CONSTRAINT {nombre}
+            FOREIGN KEY ({columna}) REFERENCES atletas (id_atleta) NOT VALID
+        """)
+
+
+MIGRACIONES = [
+    Migracion(1, "esquema inicial", ESQUEMA_INICIAL),
+    Migracion(2, "columnas de hrv y id_atleta en autoseguimiento", [
+        hrv_store.DDL_COLUMNAS,
+        _renombrar_atleta_autoseguimiento,
+        # Sin DEFAULT al añadirla: las sesiones antiguas no tienen fecha y se
+        # quedan en NULL (la carga diaria las ignora) en vez de tomar la del
+        # día de la migración; el DEFAULT es sólo para las filas nuevas
+        "ALTER TABLE entrenamiento ADD COLUMN IF NOT EXISTS fecha DATE",
+        "ALTER TABLE entrenamiento ALTER COLUMN fecha SET DEFAULT CURRENT_DATE",
+    ]),
+    Migracion(3, "línea base de HRV", [
+        hrv_baseline.DDL_BASELINE,
+        hrv_baseline.recalcular_pendientes,
+    ]),
+    Migracion(4, "índices por atleta y fecha", _indices_por_atleta() + [
+        _nombre_unico,
+        "CREATE INDEX IF NOT EXISTS atletas_equipo_idx ON atletas (equipo)",
+        "CREATE INDEX IF NOT EXISTS atletas_disciplina_idx ON atletas (disciplina)",
+    ]),
+    Migracion(5, "claves foráneas a atletas", [_claves_foraneas]),
+    Migracion(6, "carga diaria con EWMA y ACWR", [
+        carga_entrenamiento.DDL_CARGA,
+        carga_entrenamiento.recalcular_pendientes,
+    ]),
+    Migracion(7, "hrv, rpe y autoseguimiento particionadas por mes", [
+        functools.partial(particiones.particionar, tabla=tabla) for tabla in particiones.TABLAS
+    ] + [paso for paso in _indices_por_atleta() if any(f" {t}_" in paso for t in particiones.TABLAS)]),
+    Migracion(8, "resúmenes semanales y mensuales", resumenes.DDL_RESUMENES + [
+        resumenes.recalcular_pendientes,
+    ]),
+    Migracion(9, "búsqueda de atletas sin acentos y por trigramas", busqueda.DDL_BUSQUEDA + [
+        busqueda.indice_trigramas,
+    ]),
+]
+
+
+def version_actual(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            descripcion TEXT,
+            aplicada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    return cur.fetchone()[0]
+
+
+def aplicar(conn, hasta=None):
+    """Aplica las migraciones pendientes y devuelve las versiones aplicadas."""
+    aplicadas = []
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s)", (LOCK_MIGRACIONES,))
+        conn.commit()
+        try:
+            actual = version_actual(cur)
+            conn.commit()
+            for migracion in MIGRACIONES:
+                if migracion.version <= actual or (hasta is not None and migracion.version > hasta):
+                    continue
+                try:
+                    for paso in migracion.pasos:
+                        if callable(paso):
+                            paso(cur)
+                        else:
+                            cur.execute(paso)
+                    cur.execute(
+                        "INSERT INTO schema_migrations (version, descripcion) VALUES (%s, %s)",
+                        (migracion.version, migracion.descripcion)
+                    )
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    logging.exception("Error en la migración %s (%s)", migracion.version, migracion.descripcion)
+                    raise
+                logging.info("Migración %s aplicada: %s", migracion.version, migracion.descripcion)
+                aplicadas.append(migracion.version)
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (LOCK_MIGRACIONES,))
+            conn.commit()
+    return aplicadas
+
+
+# ——— Regresión de planes ———
+# Consultas calientes que deben resolverse con índice. Con enable_seqscan = off
+# el planificador sólo elige un Seq Scan si no hay índice utilizable.
+CONSULTAS_INDEXADAS = [
+    ("historial hrv", "hrv",
+     "SELECT fecha, id, hrv FROM hrv WHERE id_atleta = 1 AND (fecha, id) > ('2024-01-01', 0) "
+     "ORDER BY fecha, id LIMIT 100"),
+    ("historial rpe", "rpe",
+     "SELECT fecha, id, rpe FROM rpe WHERE id_atleta = 1 ORDER BY fecha DESC, id DESC LIMIT 30"),
+    ("atleta por nombre", "atletas", "SELECT id_atleta FROM atletas WHERE nombre = 'x'"),
+    ("autoseguimiento por atleta", "autoseguimiento",
+     "SELECT * FROM autoseguimiento WHERE id_atleta = 1 ORDER BY fecha_registro DESC LIMIT 1"),
+    ("entrenamiento por atleta", "entrenamiento",
+     "SELECT fecha, SUM(duracion) FROM entrenamiento WHERE id_atleta = 1 GROUP BY fecha"),
+    ("medico por atleta", "medico", "SELECT * FROM medico WHERE atleta_id = 1 AND fecha >= '2024-01-01'"),
+    ("estado hrv", "hrv_baseline", "SELECT n FROM hrv_baseline WHERE id_atleta = 1"),
+    ("atletas de un equipo", "atletas", "SELECT id_atleta FROM atletas WHERE equipo = 'x'"),
+    ("carga actual", "carga_diaria",
+     "SELECT fecha, ewma_aguda FROM carga_diaria WHERE id_atleta = 1 ORDER BY fecha DESC LIMIT 1"),
+    ("búsqueda por prefijo", "atletas",
+     "SELECT id_atleta FROM atletas WHERE normalizar_busqueda(nombre) COLLATE \"C\" >= 'ana' "
+     "AND normalizar_busqueda(nombre) COLLATE \"C\" < 'ana' || U&'\\+10FFFF' "
+     "ORDER BY normalizar_busqueda(nombre) COLLATE \"C\", id_atleta LIMIT 20"),
+    ("resumen semanal", "resumen_semana",
+     "SELECT inicio, media FROM resumen_semana WHERE id_atleta = 1 AND serie = 'hrv' ORDER BY inicio"),
+]
+
+
+def _nodos(plan):
+    yield plan
+    for hijo in plan.get('Plans', []):
+        yield from _nodos(hijo)
+
+
+def verificar_planes(conn):
+    """Devuelve la lista de consultas que caen en Seq Scan sobre su tabla."""
+    fallos = []
+    with conn.cursor() as cur:
+        try:
+            cur.execute("SET LOCAL enable_seqscan = off")
+            for descripcion, tabla, sql in CONSULTAS_INDEXADAS:
+                cur.execute("EXPLAIN (FORMAT JSON) " + sql)
+                plan = cur.fetchone()[0][0]['Plan']
+                if any(n.get('Node Type') == 'Seq Scan' and particiones.es_particion(tabla, n.get('Relation Name', ''))
+                       for n in _nodos(plan)):
+                    fallos.append(descripcion)
+        finally:
+            conn.rollback()
+    return fallos
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migraciones de esquema de la base de datos")
+    parser.add_argument('--hasta', type=int, help="aplicar sólo hasta esta versión")
+    parser.add_argument('--explain', action='store_true', help="comprobar que las consultas clave usan índices")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    with conexion() as conn:
+        aplicar(conn, args.hasta)
+        if args.hasta is None or args.hasta >= 7:
+            with conn.cursor() as cur:
+                particiones.mantener(cur)
+            conn.commit()
+        if args.explain:
+            fallos = verificar_planes(conn)
+            for descripcion in fallos:
+                logging.error("Consulta sin índice: %s", descripcion)
+            return 1 if fallos else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
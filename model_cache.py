@@ -0,0 +1,129 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+# ——— Configuración ———
+MODEL_CACHE_DIR = os.getenv('MODEL_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'modelos_cache'))
+MODEL_CACHE_MAX_MB = int(os.getenv('MODEL_CACHE_MAX_MB', '512'))
+MODEL_CACHE_MAX_MEMORIA = int(os.getenv('MODEL_CACHE_MAX_MEMORIA', '32'))  # paquetes en RAM por proceso
+
+
+def huella_datos(datos, version):
+    """Hash estable del contenido de `training_data` más la versión del modelo."""
+    canonico = json.dumps(datos, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(f"{version}:{canonico}".encode('utf-8')).hexdigest()
+
+
+class RegistroModelos:
+    """Registro de modelos entrenados indexado por (atleta, huella de datos).
+
+    Los paquetes se guardan con pickle en disco para compartirlos entre procesos
+    y se mantiene una copia LRU en memoria. Cuando el directorio supera
+    `max_bytes` se eliminan los ficheros usados hace más tiempo.
+    """
+
+    def __init__(self, directorio=MODEL_CACHE_DIR, max_bytes=MODEL_CACHE_MAX_MB * 1024 * 1024,
+                 max_memoria=MODEL_CACHE_MAX_MEMORIA):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.max_memoria = max_memoria
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.directorio, exist_ok=True)
+
+    def _ruta(self, id_atleta, huella):
+        atleta = re.sub(r'[^A-Za-z0-9_-]', '_', str(id_atleta))
+        return os.path.join(self.directorio, atleta, f"{huella}.pkl")
+
+    def _recordar(self, clave, paquete):
+        with self._lock:
+            self._memoria[clave] = paquete
+            self._memoria.move_to_end(clave)
+            while len(self._memoria) > self.max_memoria:
+                self._memoria.popitem(last=False)
+
+    def obtener(self, id_atleta, huella):
+        clave = (str(id_atleta), huella)
+        with self._lock:
+            paquete = self._memoria.get(clave)
+            if paquete is not None:
+                self._memoria.move_to_end(clave)
+                return paquete
+
+        ruta = self._ruta(id_atleta, huella)
+        try:
+            with open(ruta, 'rb') as f:
+                paquete = pickle.load(f)
+            os.utime(ruta)  # el mtime hace de marca LRU en disco
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logging.exception("Modelo en caché ilegible, se descarta: %s", ruta)
+            self._eliminar(ruta)
+            return None
+
+        self._recordar(clave, paquete)
+        return paquete
+
+    def guardar(self, id_atleta, huella, paquete, persistir=True):
+        """Guarda el paquete en memoria y, con `persistir`, en disco (los de un solo uso sólo en memoria)."""
+        self._recordar((str(id_atleta), huella), paquete)
+        if not persistir:
+            return
+        ruta = self._ruta(id_atleta, huella)
+        try:
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(paquete, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, ruta)
+        except Exception:
+            logging.exception("No se pudo persistir el modelo en %s", ruta)
+            return
+        self._purgar()
+
+    def _eliminar(self, ruta):
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+
+    def _purgar(self):
+        ficheros = []
+        total = 0
+        for raiz, _, nombres in os.walk(self.directorio):
+            for nombre in nombres:
+                if not nombre.endswith('.pkl'):
+                    continue
+                ruta = os.path.join(raiz, nombre)
+                try:
+                    st = os.stat(ruta)
+                except OSError:
+                    continue
+                ficheros.append((st.st_mtime, st.st_size, ruta))
+                total += st.st_size
+
+        if total <= self.max_bytes:
+            return
+        for _, tamano, ruta in sorted(ficheros):
+            self._eliminar(ruta)
+            self._eliminar_directorio(os.path.dirname(ruta))
+            total -= tamano
+            if total <= self.max_bytes:
+                break
+
+    def _eliminar_directorio(self, directorio):
+        # El directorio de una clave que se quedó sin modelos; si otro proceso
+        # acaba de escribir en él no está vacío y rmdir falla sin borrar nada
+        if os.path.normpath(directorio) == os.path.normpath(self.directorio):
+            return
+        try:
+            os.rmdir(directorio)
+        except OSError:
+            pass
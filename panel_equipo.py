@@ -0,0 +1,89 @@
+import os
+
+import carga_entrenamiento
+import hrv_baseline
+
+# ——— Configuración ———
+SNAPSHOT_TTL = int(os.getenv('SNAPSHOT_TTL', '15'))  # segundos en caché
+SNAPSHOT_DIAS_MEDICO = int(os.getenv('SNAPSHOT_DIAS_MEDICO', '28'))  # antigüedad de un asunto médico abierto
+
+# Una fila por atleta del equipo con su último estado de cada fuente. Cada
+# LATERAL ... LIMIT 1 es un salto de índice (atleta, fecha DESC), así que el
+# coste crece con el número de atletas, no con su histórico.
+SQL_SNAPSHOT = """
+    SELECT a.id_atleta, a.nombre, a.disciplina,
+           b.n, b.media_ln, b.m2_ln, b.ln_actual, b.fecha_actual,
+           r.fecha, r.rpe, r.notas,
+           s.fecha_registro, s.calidad_sueno, s.horas_sueno, s.fatiga,
+           s.dolor_muscular, s.estres, s.estado_animo,
+           c.fecha, c.ewma_aguda, c.ewma_cronica,
+           m.asuntos
+    FROM atletas a
+    LEFT JOIN hrv_baseline b ON b.id_atleta = a.id_atleta
+    LEFT JOIN LATERAL (
+        SELECT fecha, rpe, notas FROM rpe
+        WHERE id_atleta = a.id_atleta
+        ORDER BY fecha DESC, id DESC LIMIT 1
+    ) r ON true
+    LEFT JOIN LATERAL (
+        SELECT fecha_registro, calidad_sueno, horas_sueno, fatiga, dolor_muscular, estres, estado_animo
+        FROM autoseguimiento
+        WHERE id_atleta = a.id_atleta
+        ORDER BY fecha_registro DESC LIMIT 1
+    ) s ON true
+    LEFT JOIN LATERAL (
+        SELECT fecha, ewma_aguda, ewma_cronica FROM carga_diaria
+        WHERE id_atleta = a.id_atleta
+        ORDER BY fecha DESC LIMIT 1
+    ) c ON true
+    LEFT JOIN LATERAL (
+        SELECT json_agg(json_build_object(
+                   'fecha', fecha, 'diagnostico', diagnostico, 'tratamiento', tratamiento
+               ) ORDER BY fecha DESC) AS asuntos
+        FROM medico
+        WHERE atleta_id = a.id_atleta
+          AND fecha >= CURRENT_DATE - %(dias_medico)s
+          AND NULLIF(TRIM(diagnostico), '') IS NOT NULL
+    ) m ON true
+    WHERE a.equipo = %(equipo)s
+    ORDER BY a.nombre
+"""
+
+
+def _fecha(valor):
+    return valor.isoformat() if valor is not None else None
+
+
+def snapshot(cur, equipo):
+    """Estado de todos los atletas de un equipo con una sola consulta."""
+    cur.execute(SQL_SNAPSHOT, {"equipo": equipo, "dias_medico": SNAPSHOT_DIAS_MEDICO})
+    atletas = []
+    for fila in cur.fetchall():
+        (id_atleta, nombre, disciplina, n, media, m2, ln_actual, fecha_hrv,
+         fecha_rpe, rpe, notas,
+         fecha_auto, calidad, horas, fatiga, dolor, estres, animo,
+         fecha_carga, aguda, cronica, asuntos) = fila
+
+        hrv = hrv_baseline.estado_hrv(n, media, m2, ln_actual) if n is not None else None
+        if hrv is not None:
+            hrv["fecha"] = _fecha(fecha_hrv)
+
+        atletas.append({
+            "id": id_atleta,
+            "nombre": nombre,
+            "disciplina": disciplina or "No especificado",
+            "hrv": hrv,
+            "rpe": {"fecha": _fecha(fecha_rpe), "rpe": rpe, "notas": notas} if fecha_rpe else None,
+            "bienestar": {
+                "fecha": _fecha(fecha_auto),
+                "calidad_sueno": calidad,
+                "horas_sueno": horas,
+                "fatiga": fatiga,
+                "dolor_muscular": dolor,
+                "estres": estres,
+                "estado_animo": animo,
+            } if fecha_auto else None,
+            "carga": carga_entrenamiento.estado_actual((fecha_carga, aguda, cronica)) if fecha_carga else None,
+            "medico": asuntos or [],
+        })
+    return atletas
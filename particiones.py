@@ -0,0 +1,185 @@
+import logging
+import os
+import threading
+from datetime import date
+
+from db import conexion
+
+# ——— Particionado mensual ———
+# hrv, rpe y autoseguimiento están particionadas por rango de mes sobre su
+# columna de fecha (migración 7): un histórico con `desde`/`hasta` sólo lee las
+# particiones de ese rango y los meses antiguos se pueden archivar o borrar
+# enteros. Cada tabla tiene además una partición por defecto que recoge lo que
+# llegue fuera de las particiones creadas (p. ej. una importación de años
+# anteriores); `mantener` crea por adelantado los meses siguientes y saca de la
+# partición por defecto las filas de cualquier mes, creándole su partición.
+# Se ejecuta con las migraciones (start.sh, en cada despliegue) y con
+# `flask --app app mantener-particiones` desde un cron si el despliegue dura más
+# de PARTICIONES_MESES_ADELANTE meses. PARTICIONES_AUTO=1 lo repite además cada
+# PARTICIONES_INTERVALO_S en un hilo del proceso que importa app.py: activarlo
+# sólo en un proceso, no en todos los workers ni en los scripts.
+PARTICIONES_MESES_ADELANTE = int(os.getenv('PARTICIONES_MESES_ADELANTE', '3'))
+PARTICIONES_AUTO = os.getenv('PARTICIONES_AUTO', '0') == '1'
+PARTICIONES_INTERVALO_S = int(os.getenv('PARTICIONES_INTERVALO_S', str(6 * 3600)))
+
+# Tabla particionada -> columna de fecha (clave de partición)
+TABLAS = {
+    'hrv': 'fecha',
+    'rpe': 'fecha',
+    'autoseguimiento': 'fecha_registro',
+}
+
+# Clave del pg_advisory_xact_lock: un solo proceso mantiene las particiones a la vez
+LOCK_PARTICIONES = 7261003
+
+
+def mes(fecha):
+    return date(fecha.year, fecha.month, 1)
+
+
+def mes_siguiente(inicio):
+    return date(inicio.year + inicio.month // 12, inicio.month % 12 + 1, 1)
+
+
+def meses(desde, hasta):
+    """Primer día de cada mes entre las fechas `desde` y `hasta`, ambas incluidas."""
+    actual, fin = mes(desde), mes(hasta)
+    while actual <= fin:
+        yield actual
+        actual = mes_siguiente(actual)
+
+
+def nombre_particion(tabla, inicio):
+    return f"{tabla}_p{inicio:%Y%m}"
+
+
+def es_particion(tabla, relacion):
+    """Si `relacion` es `tabla` o una de sus particiones (para leer planes EXPLAIN)."""
+    return relacion == tabla or relacion == f"{tabla}_default" or (
+        relacion.startswith(f"{tabla}_p") and relacion[len(tabla) + 2:].isdigit())
+
+
+def clave_foranea(cur, particion):
+    # NOT VALID, como en la migración 5: la tabla particionada no admite una
+    # clave foránea sin validar, así que la lleva cada partición
+    cur.execute(f"""
+        ALTER TABLE {particion} ADD CONSTRAINT {particion}_id_atleta_fkey
+        FOREIGN KEY (id_atleta) REFERENCES atletas (id_atleta) NOT VALID
+    """)
+
+
+def crear_particion(cur, tabla, inicio):
+    """Crea la partición del mes `inicio` si no existe; devuelve si la creó.
+
+    Las filas de ese mes que estuvieran en la partición por defecto se mueven a
+    la nueva antes de adjuntarla (ATTACH falla si la por defecto tiene filas del
+    rango). El CHECK evita que ATTACH recorra la partición nueva para validarla.
+    """
+    particion = nombre_particion(tabla, inicio)
+    cur.execute("SELECT to_regclass(%s)", (particion,))
+    if cur.fetchone()[0] is not None:
+        return False
+
+    columna = TABLAS[tabla]
+    rango = (inicio, mes_siguiente(inicio))
+    cur.execute(f"CREATE TABLE {particion} (LIKE {tabla} INCLUDING DEFAULTS)")
+    cur.execute(f"""
+        ALTER TABLE {particion} ADD CONSTRAINT {particion}_rango
+        CHECK ({columna} IS NOT NULL AND {columna} >= %s AND {columna} < %s)
+    """, rango)
+    cur.execute(f"""
+        WITH movidas AS (
+            DELETE FROM {tabla}_default WHERE {columna} >= %s AND {columna} < %s RETURNING *
+        )
+        INSERT INTO {particion} SELECT * FROM movidas
+    """, rango)
+    if cur.rowcount:
+        logging.info("%s filas de %s movidas de la partición por defecto a %s", cur.rowcount, tabla, particion)
+    cur.execute(f"ALTER TABLE {tabla} ATTACH PARTITION {particion} FOR VALUES FROM (%s) TO (%s)", rango)
+    cur.execute(f"ALTER TABLE {particion} DROP CONSTRAINT {particion}_rango")
+    clave_foranea(cur, particion)
+    return True
+
+
+def asegurar_rango(cur, tabla, desde, hasta):
+    """Crea las particiones de los meses entre `desde` y `hasta` que falten."""
+    return [inicio for inicio in meses(desde, hasta) if crear_particion(cur, tabla, inicio)]
+
+
+def particionar(cur, tabla):
+    """Migración: convierte `tabla` en particionada por mes con los mismos datos,
+    la misma secuencia de `id`, clave primaria (id, fecha) y sus particiones
+    (los meses con filas y el actual). Reescribe la tabla bajo un bloqueo
+    exclusivo: el tiempo de la migración crece con el histórico."""
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (tabla,))
+    if cur.fetchone()[0] == 'p':
+        return
+    columna = TABLAS[tabla]
+    nueva = f"{tabla}_particionada"
+    cur.execute(f"LOCK TABLE {tabla} IN ACCESS EXCLUSIVE MODE")
+    # la clave de partición entra en la clave primaria (autoseguimiento la tenía nullable)
+    cur.execute(f"ALTER TABLE {tabla} ALTER COLUMN {columna} SET NOT NULL")
+    cur.execute(f"CREATE TABLE {nueva} (LIKE {tabla} INCLUDING DEFAULTS) PARTITION BY RANGE ({columna})")
+    cur.execute(f"CREATE TABLE {tabla}_default PARTITION OF {nueva} DEFAULT")
+    clave_foranea(cur, f"{tabla}_default")
+
+    cur.execute(f"SELECT DISTINCT date_trunc('month', {columna})::date FROM {tabla}")
+    for inicio in sorted({fila[0] for fila in cur.fetchall()} | {mes(date.today())}):
+        particion = nombre_particion(tabla, inicio)
+        cur.execute(f"CREATE TABLE {particion} PARTITION OF {nueva} FOR VALUES FROM (%s) TO (%s)",
+                    (inicio, mes_siguiente(inicio)))
+        clave_foranea(cur, particion)
+
+    cur.execute(f"INSERT INTO {nueva} SELECT * FROM {tabla}")
+    cur.execute("SELECT pg_get_serial_sequence(%s, 'id')", (tabla,))
+    cur.execute(f"ALTER SEQUENCE {cur.fetchone()[0]} OWNED BY {nueva}.id")
+    cur.execute(f"DROP TABLE {tabla}")
+    cur.execute(f"ALTER TABLE {nueva} RENAME TO {tabla}")
+    cur.execute(f"ALTER TABLE {tabla} ADD PRIMARY KEY (id, {columna})")
+    cur.execute(f"ANALYZE {tabla}")
+
+
+def mantener(cur, hoy=None):
+    """Particiones de los próximos PARTICIONES_MESES_ADELANTE meses y de los meses
+    que tengan filas en la partición por defecto. Devuelve {tabla: [meses creados]};
+    vacío si otro proceso lo está haciendo. No hace commit."""
+    cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (LOCK_PARTICIONES,))
+    if not cur.fetchone()[0]:
+        return {}
+    hoy = hoy or date.today()
+    hasta = mes(hoy)
+    for _ in range(PARTICIONES_MESES_ADELANTE):
+        hasta = mes_siguiente(hasta)
+
+    creadas = {}
+    for tabla, columna in TABLAS.items():
+        cur.execute(f"""
+            SELECT DISTINCT date_trunc('month', {columna})::date FROM {tabla}_default
+            WHERE {columna} IS NOT NULL ORDER BY 1
+        """)
+        pendientes = sorted({fila[0] for fila in cur.fetchall()} | set(meses(hoy, hasta)))
+        nuevas = [inicio for inicio in pendientes if crear_particion(cur, tabla, inicio)]
+        if nuevas:
+            creadas[tabla] = nuevas
+    return creadas
+
+
+def _mantener_periodicamente(evento):
+    while not evento.wait(PARTICIONES_INTERVALO_S):
+        try:
+            with conexion() as conn:
+                with conn.cursor() as cur:
+                    creadas = mantener(cur)
+                conn.commit()
+            for tabla, nuevas in creadas.items():
+                logging.info("Particiones de %s creadas: %s", tabla, ', '.join(f"{m:%Y-%m}" for m in nuevas))
+        except Exception:
+            logging.exception("Error manteniendo las particiones")
+
+
+def programar():
+    """Hilo que llama a `mantener` cada PARTICIONES_INTERVALO_S (la primera vez
+    tras ese intervalo: al desplegar ya lo hacen las migraciones)."""
+    evento = threading.Event()
+    threading.Thread(target=_mantener_periodicamente, args=(evento,), name='particiones', daemon=True).start()
+    return evento
@@ -0,0 +1,425 @@
+import copy
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from prophet import Prophet
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+
+import tendencias
+from db import conexion
+from metricas import ETAPAS
+from model_cache import RegistroModelos, huella_datos
+from prediction_jobs import gestor_trabajos
+from tendencias import TENDENCIA_MOTOR
+
+# Modelos de predicción. Este módulo arrastra pandas, Prophet (cmdstanpy),
+# scikit-learn y XGBoost: segundos de importación y cientos de MB. Sólo lo
+# importan ai_module en la primera petición de predicción y los procesos del
+# pool de predicción, nunca el arranque de la API.
+
+# Incrementar al cambiar features o hiperparámetros: invalida los modelos en caché
+MODEL_VERSION = '1'
+
+registro_modelos = RegistroModelos()
+
+# ——— Features desde la base de datos ———
+# Una fila por atleta y día: carga = duración total × RPE medio del día (ya
+# materializada en carga_diaria), hrv/sueño/fatiga son medias diarias y
+# `lesion` marca los días con diagnóstico médico.
+SQL_HISTORIAL = """
+    WITH c AS (
+        SELECT id_atleta, fecha, carga
+        FROM carga_diaria WHERE id_atleta = ANY(%(ids)s)
+    ), h AS (
+        SELECT id_atleta, fecha, AVG(hrv)::float8 AS hrv
+        FROM hrv WHERE id_atleta = ANY(%(ids)s) GROUP BY id_atleta, fecha
+    ), a AS (
+        SELECT id_atleta, fecha_registro::date AS fecha,
+               AVG(horas_sueno)::float8 AS suenio_horas, ROUND(AVG(fatiga))::int AS fatiga
+        FROM autoseguimiento WHERE id_atleta = ANY(%(ids)s) GROUP BY id_atleta, fecha_registro::date
+    ), m AS (
+        SELECT atleta_id AS id_atleta, fecha, 1 AS lesion
+        FROM medico
+        WHERE atleta_id = ANY(%(ids)s) AND NULLIF(TRIM(diagnostico), '') IS NOT NULL
+        GROUP BY atleta_id, fecha
+    ), dias AS (
+        SELECT id_atleta, fecha FROM c
+        UNION SELECT id_atleta, fecha FROM h
+        UNION SELECT id_atleta, fecha FROM a
+    )
+    SELECT d.id_atleta, d.fecha, COALESCE(c.carga, 0) AS carga,
+           h.hrv, a.suenio_horas, a.fatiga, COALESCE(m.lesion, 0) AS lesion
+    FROM dias d
+    LEFT JOIN c USING (id_atleta, fecha)
+    LEFT JOIN h USING (id_atleta, fecha)
+    LEFT JOIN a USING (id_atleta, fecha)
+    LEFT JOIN m USING (id_atleta, fecha)
+    ORDER BY d.id_atleta, d.fecha
+"""
+
+COLUMNAS_HISTORIAL = ['id_atleta', 'fecha', 'carga', 'hrv', 'suenio_horas', 'fatiga', 'lesion']
+
+
+def cargar_historial(ids):
+    """Construye el DataFrame de entrenamiento de uno o varios atletas con una sola consulta."""
+    with conexion() as conn:
+        with conn.cursor() as cur:
+            cur.execute(SQL_HISTORIAL, {"ids": list(ids)})
+            rows = cur.fetchall()
+
+    df = pd.DataFrame(rows, columns=COLUMNAS_HISTORIAL)
+    df['fecha'] = df['fecha'].astype(str)
+    # HRV y sueño se arrastran desde la última medición; sin fatiga no hay etiqueta
+    df[['hrv', 'suenio_horas']] = df.groupby('id_atleta')[['hrv', 'suenio_horas']].ffill()
+    df = df.dropna(subset=['hrv', 'suenio_horas', 'fatiga'])
+    df['fatiga'] = df['fatiga'].astype(int)
+    return df
+
+
+def historial_atleta(id_atleta):
+    """`training_data` de un atleta en el mismo formato que envía el cliente."""
+    df = cargar_historial([id_atleta])
+    return df.drop(columns=['id_atleta']).to_dict(orient='records')
+
+
+FEATURES_FATIGA = ['carga', 'hrv', 'suenio_horas']
+FEATURES_LESION = ['carga', 'hrv', 'suenio_horas', 'fatiga']
+
+
+def ajustar_tendencia(df, motor=TENDENCIA_MOTOR):
+    """Pronóstico de la carga a 7 días con el motor indicado (ver tendencias.py).
+    El horizonte es fijo, así que se guarda el pronóstico, no el modelo."""
+    if motor != 'prophet':
+        dias, y = tendencias.serie_diaria(pd.to_datetime(df['fecha']).to_numpy(), df['carga'].to_numpy())
+        with ETAPAS.medir(f'{motor}_fit'):
+            futuro, yhat = tendencias.AJUSTES[motor](dias, y)
+        return [{"ds": pd.Timestamp(d), "yhat": float(v)} for d, v in zip(futuro, yhat)]
+
+    trend_df = df[['fecha', 'carga']].rename(columns={'fecha': 'ds', 'carga': 'y'})
+    model = Prophet()
+    with ETAPAS.medir('prophet_fit'):
+        model.fit(trend_df)
+    with ETAPAS.medir('prophet_pronostico'):
+        future = model.make_future_dataframe(periods=7)
+        forecast = model.predict(future)
+    return forecast[['ds', 'yhat']].tail(7).to_dict(orient="records")
+
+
+XGB_PARAMS = dict(learning_rate=0.05, max_depth=4, random_state=42, use_label_encoder=False, eval_metric="logloss")
+XGB_RONDAS = 200
+
+
+def entrenar_clasificadores(df):
+    """Ajusta Random Forest (fatiga) y XGBoost (lesión) desde cero."""
+    # 2️⃣ Fatiga (Random Forest); warm_start permite sumarle árboles después
+    X = df[FEATURES_FATIGA]
+    y = df['fatiga']
+    rf = RandomForestClassifier(n_estimators=50, random_state=42, warm_start=True)
+    with ETAPAS.medir('rf_fit'):
+        rf.fit(X, y)
+
+    # 3️⃣ Lesión (XGBoost)
+    xgb_model = None
+    lesion_acc = None
+    n_eval = 0
+    if 'lesion' in df.columns and df['lesion'].nunique() > 1:
+        Xl = df[FEATURES_LESION]
+        yl = df['lesion']
+        X_train, X_test, y_train, y_test = train_test_split(Xl, yl, test_size=0.2, random_state=42)
+        xgb_model = xgb.XGBClassifier(n_estimators=XGB_RONDAS, **XGB_PARAMS)
+        with ETAPAS.medir('xgb_fit'):
+            xgb_model.fit(X_train, y_train)
+        lesion_acc = accuracy_score(y_test, xgb_model.predict(X_test))
+        n_eval = len(y_test)
+
+    return {"rf": rf, "xgb": xgb_model, "exactitud_xgb": lesion_acc, "n_eval": n_eval,
+            "rondas": XGB_RONDAS if xgb_model is not None else 0}
+
+
+# ——— Entrenamiento incremental ———
+# El estado de cada clave (un atleta, una disciplina o un lote) guarda por
+# atleta cuántas filas vio y un hash de ellas. Si el histórico nuevo conserva
+# ese prefijo, sólo entrenan las filas añadidas (y la última conocida, que
+# cambia si llegan más lecturas del mismo día) con un contexto de las
+# INCREMENTAL_CONTEXTO filas anteriores de su atleta: el bosque suma
+# RF_ARBOLES_NUEVOS árboles (y descarta los más antiguos por encima de
+# RF_MAX_ARBOLES) y XGBoost sigue el boosting desde el booster anterior. Así
+# la actualización diaria cuesta según lo nuevo, no según el histórico. Si el
+# prefijo cambió (correcciones, borrados), aparece una clase nueva o lo nuevo
+# pesa demasiado, se reentrena desde cero.
+INCREMENTAL_CONTEXTO = int(os.getenv('INCREMENTAL_CONTEXTO', '60'))
+INCREMENTAL_MAX_FRACCION = float(os.getenv('INCREMENTAL_MAX_FRACCION', '0.25'))
+RF_ARBOLES_NUEVOS = int(os.getenv('RF_ARBOLES_NUEVOS', '5'))
+RF_MAX_ARBOLES = int(os.getenv('RF_MAX_ARBOLES', '100'))
+XGB_RONDAS_NUEVAS = int(os.getenv('XGB_RONDAS_NUEVAS', '10'))
+XGB_MAX_RONDAS = int(os.getenv('XGB_MAX_RONDAS', '400'))  # por encima se reentrena desde cero
+
+COLUMNAS_MODELO = ['fecha'] + FEATURES_LESION + ['lesion']
+
+
+def _hashes(df):
+    return pd.util.hash_pandas_object(df[[c for c in COLUMNAS_MODELO if c in df.columns]], index=False).to_numpy()
+
+
+def _huella_filas(hashes):
+    return hashlib.sha1(hashes.tobytes()).hexdigest()
+
+
+def _posiciones(df, por_atleta):
+    if por_atleta:
+        return {int(k): v for k, v in df.groupby('id_atleta', sort=False).indices.items()}
+    return {None: np.arange(len(df))}
+
+
+def _resumen(df, por_atleta, hashes):
+    """{atleta: (filas, huella de todas menos la última, hash de la última)}."""
+    return {g: (len(pos), _huella_filas(hashes[pos[:-1]]), int(hashes[pos[-1]]))
+            for g, pos in _posiciones(df, por_atleta).items()}
+
+
+def filas_nuevas(estado, df, por_atleta, hashes):
+    """(nuevas, entrenamiento): posiciones de `df` que el estado no vio y las que
+    entrenan la actualización (nuevas más contexto); None si no es una ampliación."""
+    posiciones = _posiciones(df, por_atleta)
+    if set(estado['grupos']) - set(posiciones):
+        return None
+    nuevas, entrenamiento = [], []
+    for g, pos in posiciones.items():
+        n, huella, ultima = estado['grupos'].get(g, (0, None, None))
+        if n:
+            if len(pos) < n or _huella_filas(hashes[pos[:n - 1]]) != huella:
+                return None
+            n -= int(hashes[pos[n - 1]]) != ultima
+        if n < len(pos):
+            nuevas.append(pos[n:])
+            entrenamiento.append(pos[max(0, n - INCREMENTAL_CONTEXTO):])
+    vacio = np.array([], dtype=int)
+    return (np.concatenate(nuevas) if nuevas else vacio), (np.concatenate(entrenamiento) if entrenamiento else vacio)
+
+
+def _con_anclas(df, posiciones, columna, clases):
+    """Añade la última fila de cada clase ausente en `posiciones`: el bosque y el
+    booster ampliados deben ver las mismas clases que el modelo original."""
+    presentes = set(df[columna].iloc[posiciones])
+    valores = df[columna].to_numpy()
+    extra = []
+    for clase in clases:
+        if clase not in presentes:
+            filas = np.flatnonzero(valores == clase)
+            if not len(filas):
+                return None
+            extra.append(filas[-1])
+    return np.concatenate([posiciones, extra]).astype(int) if extra else posiciones
+
+
+def ampliar_clasificadores(estado, df, nuevas, entrenamiento):
+    """Estado nuevo con los modelos ampliados, o None si hay que reentrenar desde cero."""
+    rf = copy.copy(estado['rf'])  # el original puede estar en uso desde la caché en memoria
+    rf.estimators_ = list(rf.estimators_)
+    pos = _con_anclas(df, entrenamiento, 'fatiga', rf.classes_)
+    if pos is None or not set(df['fatiga'].iloc[pos]) <= set(rf.classes_):
+        return None
+    rf.n_estimators = len(rf.estimators_) + RF_ARBOLES_NUEVOS
+    with ETAPAS.medir('rf_incremental'):
+        rf.fit(df[FEATURES_FATIGA].iloc[pos], df['fatiga'].iloc[pos])
+    if len(rf.estimators_) > RF_MAX_ARBOLES:
+        rf.estimators_ = rf.estimators_[-RF_MAX_ARBOLES:]
+        rf.n_estimators = RF_MAX_ARBOLES
+
+    xgb_model, exactitud, n_eval, rondas = estado['xgb'], estado['exactitud_xgb'], estado['n_eval'], estado['rondas']
+    if xgb_model is None:
+        if 'lesion' in df.columns and df['lesion'].nunique() > 1:
+            return None
+    else:
+        if rondas + XGB_RONDAS_NUEVAS > XGB_MAX_RONDAS:
+            return None
+        # exactitud "prequential": el modelo anterior sobre las filas nuevas antes de verlas
+        aciertos = int((xgb_model.predict(df[FEATURES_LESION].iloc[nuevas]) == df['lesion'].iloc[nuevas]).sum())
+        exactitud = (exactitud * n_eval + aciertos) / (n_eval + len(nuevas))
+        n_eval += len(nuevas)
+        pos = _con_anclas(df, entrenamiento, 'lesion', (0, 1))
+        if pos is None:
+            return None
+        ampliado = xgb.XGBClassifier(n_estimators=XGB_RONDAS_NUEVAS, **XGB_PARAMS)
+        with ETAPAS.medir('xgb_incremental'):
+            ampliado.fit(df[FEATURES_LESION].iloc[pos], df['lesion'].iloc[pos], xgb_model=xgb_model.get_booster())
+        xgb_model = ampliado
+        rondas += XGB_RONDAS_NUEVAS
+
+    return {"rf": rf, "xgb": xgb_model, "exactitud_xgb": exactitud, "n_eval": n_eval, "rondas": rondas}
+
+
+def clasificadores(clave, df, por_atleta=False):
+    """Clasificadores de `clave` al día con `df`: los reutiliza si no hay filas
+    nuevas, los amplía si el histórico sólo creció y si no los reentrena."""
+    huella = f"{MODEL_VERSION}-incremental"  # un único estado por clave, que se va ampliando
+    hashes = _hashes(df)
+    estado = registro_modelos.obtener(clave, huella)
+    if estado is not None:
+        cambios = filas_nuevas(estado, df, por_atleta, hashes)
+        if cambios is None:
+            estado = None
+        elif not len(cambios[0]):
+            return estado
+        elif len(cambios[0]) > INCREMENTAL_MAX_FRACCION * sum(n for n, _, _ in estado['grupos'].values()):
+            estado = None
+        else:
+            estado = ampliar_clasificadores(estado, df, *cambios)
+
+    if estado is None:
+        estado = entrenar_clasificadores(df)
+    estado['grupos'] = _resumen(df, por_atleta, hashes)
+    registro_modelos.guardar(clave, huella, estado, persistir=persistente(clave))
+    return estado
+
+
+def inferir(paquete, df, tendencia):
+    """Aplica un paquete de modelos ya entrenado al último registro del histórico."""
+    last_input = df[FEATURES_FATIGA].iloc[-1:].to_numpy()
+    fatiga_pred = int(paquete['rf'].predict(last_input)[0])
+
+    if paquete['xgb'] is not None:
+        lesion_input = df[FEATURES_LESION].iloc[-1:].to_numpy()
+        lesion_pred = int(paquete['xgb'].predict(lesion_input)[0])
+    else:
+        lesion_pred = 0
+
+    return {
+        "tendencia": tendencia,
+        "riesgo_fatiga": fatiga_pred,
+        "riesgo_lesion": lesion_pred,
+        "exactitud_xgb": paquete['exactitud_xgb']
+    }
+
+
+def tendencia_atleta(id_atleta, trend_data, motor=TENDENCIA_MOTOR):
+    """Pronóstico de un atleta. Los de Prophet se guardan en la caché de modelos;
+    los de NumPy ajustan en milisegundos, menos que leer o escribir un pickle."""
+    if motor != 'prophet':
+        return ajustar_tendencia(pd.DataFrame(trend_data), motor)
+    huella = huella_datos(trend_data, MODEL_VERSION + ':tendencia')
+    tendencia = registro_modelos.obtener(id_atleta, huella)
+    if tendencia is None:
+        tendencia = ajustar_tendencia(pd.DataFrame(trend_data), motor)
+        registro_modelos.guardar(id_atleta, huella, tendencia, persistir=persistente(id_atleta))
+    return tendencia
+
+
+ORIGENES = ('historial', 'cliente')
+CLAVE_FILAS_CLIENTE = 2  # el mínimo para predecir: la clave no cambia mientras la serie crece
+
+
+def clave_modelos(training_data, id_atleta, origen):
+    """Clave del estado incremental de una predicción.
+
+    El histórico de la base (`/predict/<id>`) usa el id del atleta. Lo que
+    envía el cliente nunca comparte ese estado: con id_atleta se separa por
+    las primeras filas, así que la misma serie enviada otra vez y ampliada
+    sigue siendo incremental, y sin id_atleta la clave es la huella de todo
+    `training_data`, de modo que cada petición anónima tiene su propio modelo,
+    sólo en memoria (ver `persistente`), que sólo se reutiliza con los mismos datos.
+    """
+    if origen == 'historial':
+        return id_atleta
+    if id_atleta is None:
+        return f"anonimo:{huella_datos(training_data, MODEL_VERSION)}"
+    return f"cliente:{id_atleta}:{huella_datos(training_data[:CLAVE_FILAS_CLIENTE], MODEL_VERSION)[:16]}"
+
+
+def persistente(clave):
+    """Si los modelos de `clave` se guardan en disco: los de una petición anónima
+    sólo sirven para repetir esos mismos datos y se quedan en la memoria del proceso."""
+    return not str(clave).startswith('anonimo:')
+
+
+def predecir(training_data, id_atleta=None, motor=TENDENCIA_MOTOR, origen='cliente'):
+    """Predicción con los clasificadores del atleta, ampliados con los días nuevos.
+
+    `origen` es 'historial' si `training_data` viene de `historial_atleta` y
+    'cliente' si lo envió la petición (ver `clave_modelos`).
+    """
+    clave_atleta = clave_modelos(training_data, id_atleta, origen)
+    df = pd.DataFrame(training_data)
+
+    paquete = clasificadores(clave_atleta, df)
+    tendencia = tendencia_atleta(clave_atleta, df[['fecha', 'carga']].to_dict(orient='records'), motor)
+
+    with ETAPAS.medir('inferencia'):
+        return inferir(paquete, df, tendencia)
+
+
+def con_historial_suficiente(df):
+    """Filas de los atletas con al menos dos días para entrenar."""
+    conteo = df.groupby('id_atleta').size()
+    return df[df['id_atleta'].isin(conteo[conteo >= 2].index)]
+
+
+def predecir_disciplina(id_atleta, motor=TENDENCIA_MOTOR):
+    """Como `predecir`, con clasificadores compartidos por la disciplina del atleta
+    (los mismos que /predict/batch por disciplina). None si faltan datos."""
+    with conexion() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT o.id_atleta, a.disciplina FROM atletas a
+                JOIN atletas o ON o.disciplina IS NOT DISTINCT FROM a.disciplina
+                WHERE a.id_atleta = %s ORDER BY o.id_atleta
+            """, (id_atleta,))
+            filas = cur.fetchall()
+    if not filas:
+        return None
+
+    df = con_historial_suficiente(cargar_historial([f[0] for f in filas]))
+    propio = df[df['id_atleta'] == id_atleta]
+    if len(propio) < 2:
+        return None
+    paquete = clasificadores(f"disciplina:{filas[0][1]}", df, por_atleta=True)
+    tendencia = tendencia_atleta(id_atleta, propio[['fecha', 'carga']].to_dict(orient='records'), motor)
+    with ETAPAS.medir('inferencia'):
+        return inferir(paquete, propio, tendencia)
+
+
+# ——— Predicción por lotes ———
+
+def predecir_lote(df, motor=TENDENCIA_MOTOR, clave='lote'):
+    """Puntúa a todos los atletas de `df` con un modelo común de fatiga y lesión.
+
+    Los clasificadores se entrenan sobre el histórico conjunto del grupo y se
+    aplican a la última fila de cada atleta en una sola llamada `predict_proba`
+    por modelo; los pronósticos Prophet se reparten en el pool de procesos y
+    los de NumPy se calculan aquí, donde cuestan menos que el viaje al pool.
+    """
+    paquete = clasificadores(clave, df, por_atleta=True)
+
+    grupos = {id_atleta: g for id_atleta, g in df.groupby('id_atleta', sort=True)}
+    ids = list(grupos)
+    series = [g[['fecha', 'carga']].to_dict(orient='records') for g in grupos.values()]
+    if motor == 'prophet':
+        pronosticos = gestor_trabajos.mapear(tendencia_atleta, ids, series, [motor] * len(ids))
+    else:
+        pronosticos = [tendencia_atleta(i, serie, motor) for i, serie in zip(ids, series)]
+
+    ultimas = df.groupby('id_atleta', sort=True).tail(1)
+    rf = paquete['rf']
+    prob_fatiga = rf.predict_proba(ultimas[FEATURES_FATIGA].to_numpy())
+    clases_fatiga = rf.classes_
+    if paquete['xgb'] is not None:
+        prob_lesion = paquete['xgb'].predict_proba(ultimas[FEATURES_LESION].to_numpy())[:, 1]
+    else:
+        prob_lesion = np.zeros(len(ultimas))
+
+    resultados = []
+    for i, id_atleta in enumerate(ids):
+        resultados.append({
+            "id_atleta": int(id_atleta),
+            "tendencia": pronosticos[i],
+            "riesgo_fatiga": int(clases_fatiga[prob_fatiga[i].argmax()]),
+            "prob_fatiga": {str(int(c)): float(p) for c, p in zip(clases_fatiga, prob_fatiga[i])},
+            "riesgo_lesion": int(prob_lesion[i] >= 0.5),
+            "prob_lesion": float(prob_lesion[i]),
+        })
+    return {"atletas": resultados, "exactitud_xgb": paquete['exactitud_xgb']}
@@ -0,0 +1,138 @@
+import functools
+import importlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metricas
+
+# ——— Configuración ———
+PREDICT_WORKERS = int(os.getenv('PREDICT_WORKERS', '2'))
+PREDICT_MAX_PENDIENTES = int(os.getenv('PREDICT_MAX_PENDIENTES', '16'))
+PREDICT_JOB_TTL = int(os.getenv('PREDICT_JOB_TTL', '3600'))  # segundos que se conserva un resultado
+PREDICT_MP_CONTEXT = os.getenv('PREDICT_MP_CONTEXT', 'spawn')
+
+
+def llamar(ruta, *args, **kwargs):
+    """Ejecuta la función 'modulo:funcion'. Enviada al pool, el módulo sólo se
+    importa en el proceso hijo y no en el proceso web."""
+    modulo, funcion = ruta.split(':')
+    return getattr(importlib.import_module(modulo), funcion)(*args, **kwargs)
+
+
+class ColaLlena(Exception):
+    """Se alcanzó el límite de trabajos pendientes."""
+
+
+class GestorTrabajos:
+    """Cola de trabajos de entrenamiento ejecutados en un pool de procesos.
+
+    El pool se crea en el primer envío, fuera de los hilos de gunicorn, con
+    `max_workers` procesos. Como mucho `max_pendientes` trabajos pueden estar en
+    cola o ejecutándose; por encima se rechazan con `ColaLlena`. Los trabajos
+    viven en memoria del proceso web, así que con varios workers de gunicorn el
+    sondeo debe llegar al mismo worker (start.sh usa uno solo).
+    """
+
+    def __init__(self, max_workers=PREDICT_WORKERS, max_pendientes=PREDICT_MAX_PENDIENTES,
+                 ttl=PREDICT_JOB_TTL, mp_context=PREDICT_MP_CONTEXT):
+        self.max_workers = max_workers
+        self.max_pendientes = max_pendientes
+        self.ttl = ttl
+        self.mp_context = mp_context
+        self._executor = None
+        self._trabajos = {}
+        self._lock = threading.RLock()
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context(self.mp_context)
+            )
+        return self._executor
+
+    def _pendientes(self):
+        return sum(1 for t in self._trabajos.values() if not t['future'].done())
+
+    def _purgar(self):
+        # El future pasa a done() antes de que su callback anote `terminado`:
+        # hasta entonces el trabajo no se purga
+        limite = time.time() - self.ttl
+        for job_id in [j for j, t in self._trabajos.items()
+                       if t['future'].done() and t['terminado'] is not None and t['terminado'] < limite]:
+            del self._trabajos[job_id]
+
+    def _al_terminar(self, job_id):
+        def callback(future):
+            with self._lock:
+                trabajo = self._trabajos.get(job_id)
+                if trabajo is not None:
+                    trabajo['terminado'] = time.time()
+            if not future.cancelled() and future.exception() is None:
+                metricas.volcar(future.result()[1])
+        return callback
+
+    def enviar(self, fn, *args, **kwargs):
+        with self._lock:
+            self._purgar()
+            if self._pendientes() >= self.max_pendientes:
+                raise ColaLlena()
+            try:
+                future = self._pool().submit(metricas.ejecutar_capturando, fn, *args, **kwargs)
+            except BrokenProcessPool:
+                logging.exception("Pool de predicción roto, se recrea")
+                self._executor = None
+                future = self._pool().submit(metricas.ejecutar_capturando, fn, *args, **kwargs)
+
+            job_id = uuid.uuid4().hex
+            self._trabajos[job_id] = {"future": future, "creado": time.time(), "terminado": None}
+        future.add_done_callback(self._al_terminar(job_id))
+        return job_id
+
+    def mapear(self, fn, *iterables, timeout=None):
+        """Reparte `fn` sobre el pool y devuelve los resultados en orden.
+
+        No cuenta para el límite de pendientes: el llamante espera el resultado.
+        """
+        with self._lock:
+            pool = self._pool()
+        try:
+            resultados = []
+            for resultado, observaciones in pool.map(functools.partial(metricas.ejecutar_capturando, fn),
+                                                     *iterables, timeout=timeout):
+                metricas.volcar(observaciones)
+                resultados.append(resultado)
+            return resultados
+        except BrokenProcessPool:
+            with self._lock:
+                self._executor = None
+            raise
+
+    def estado(self, job_id):
+        with self._lock:
+            trabajo = self._trabajos.get(job_id)
+        if trabajo is None:
+            return None
+
+        future = trabajo['future']
+        respuesta = {"job_id": job_id}
+        if not future.done():
+            respuesta["estado"] = "ejecutando" if future.running() else "en_cola"
+        elif future.cancelled():
+            respuesta["estado"] = "cancelado"
+        elif future.exception() is not None:
+            respuesta["estado"] = "error"
+            respuesta["error"] = str(future.exception())
+        else:
+            respuesta["estado"] = "completado"
+            respuesta["resultado"] = future.result()[0]
+        return respuesta
+
+
+gestor_trabajos = GestorTrabajos()
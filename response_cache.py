@@ -0,0 +1,137 @@
+import functools
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from flask import make_response, request
+
+# ——— Configuración ———
+CACHE_TTL = int(os.getenv('CACHE_TTL', '60'))  # segundos
+CACHE_MAX_ENTRADAS = int(os.getenv('CACHE_MAX_ENTRADAS', '1024'))
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')  # opcional: caché compartida entre workers (paquete redis)
+
+
+# Las entradas se guardan bajo una clave que incluye la generación de cada una
+# de sus etiquetas; invalidar una etiqueta incrementa su generación y deja
+# huérfanas (hasta que caduquen o las desplace el LRU) todas sus entradas.
+class CacheLocal:
+    """TTL + LRU en memoria del proceso."""
+
+    def __init__(self, max_entradas=CACHE_MAX_ENTRADAS):
+        self.max_entradas = max_entradas
+        self._datos = OrderedDict()
+        self._generaciones = {}
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            expira, valor = entrada
+            if expira < time.monotonic():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave, valor, ttl):
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def generaciones(self, etiquetas):
+        with self._lock:
+            return [self._generaciones.get(e, 0) for e in etiquetas]
+
+    def invalidar(self, etiqueta):
+        with self._lock:
+            self._generaciones[etiqueta] = self._generaciones.get(etiqueta, 0) + 1
+
+
+class CacheRedis:
+    """Misma interfaz sobre Redis, coherente entre workers y procesos."""
+
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+
+    def obtener(self, clave):
+        valor = self._redis.get('resp:' + clave)
+        return pickle.loads(valor) if valor is not None else None
+
+    def guardar(self, clave, valor, ttl):
+        self._redis.set('resp:' + clave, pickle.dumps(valor), ex=ttl)
+
+    def generaciones(self, etiquetas):
+        if not etiquetas:
+            return []
+        return [int(g or 0) for g in self._redis.mget(['gen:' + e for e in etiquetas])]
+
+    def invalidar(self, etiqueta):
+        self._redis.incr('gen:' + etiqueta)
+
+
+def _crear_cache():
+    if CACHE_REDIS_URL:
+        try:
+            return CacheRedis(CACHE_REDIS_URL)
+        except Exception:
+            logging.exception("No se pudo usar Redis para la caché, se usa la local")
+    return CacheLocal()
+
+
+cache = _crear_cache()
+
+
+def invalidar(*etiquetas):
+    for etiqueta in etiquetas:
+        try:
+            cache.invalidar(etiqueta)
+        except Exception:
+            logging.exception("Error invalidando la caché (%s)", etiqueta)
+
+
+def cacheado(clave, etiquetas, ttl=CACHE_TTL):
+    """Cachea las respuestas 200 de una vista y responde 304 con If-None-Match.
+
+    `clave` y `etiquetas` reciben los argumentos de la ruta (y pueden leer
+    `request`) y devuelven la clave de la respuesta y sus etiquetas de
+    invalidación. Un fallo de la caché nunca rompe la petición.
+    """
+    def decorador(vista):
+        @functools.wraps(vista)
+        def envoltura(**kwargs):
+            try:
+                tags = etiquetas(**kwargs)
+                completa = f"{vista.__name__}:{clave(**kwargs)}:{cache.generaciones(tags)}"
+                entrada = cache.obtener(completa)
+            except Exception:
+                logging.exception("Error leyendo la caché de %s", vista.__name__)
+                return vista(**kwargs)
+
+            if entrada is not None:
+                cuerpo, mimetype, etag = entrada
+                respuesta = make_response(cuerpo, 200)
+                respuesta.mimetype = mimetype
+            else:
+                respuesta = make_response(vista(**kwargs))
+                if respuesta.status_code != 200 or respuesta.is_streamed:
+                    return respuesta
+                cuerpo = respuesta.get_data()
+                etag = hashlib.sha1(cuerpo).hexdigest()
+                try:
+                    cache.guardar(completa, (cuerpo, respuesta.mimetype, etag), ttl)
+                except Exception:
+                    logging.exception("Error guardando en la caché de %s", vista.__name__)
+
+            respuesta.set_etag(etag)
+            return respuesta.make_conditional(request)
+        return envoltura
+    return decorador
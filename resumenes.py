@@ -0,0 +1,185 @@
+from datetime import date, datetime
+
+import historial
+
+# ——— Resúmenes semanales y mensuales ———
+# Una fila por atleta, serie y semana (lunes) o mes con el número de valores,
+# la media, el mínimo y el máximo. Cada escritura recalcula sólo los periodos
+# de las fechas que tocó, desde las filas de ese periodo (unas decenas por el
+# índice por atleta y fecha), así que el coste no crece con el histórico y una
+# corrección o un borrado dejan el resumen igual de exacto. Los históricos con
+# `agregado=semana|mes` leen de aquí: dos años son ~100 semanas, no 730 filas.
+AGREGADOS = {'semana': 'week', 'mes': 'month'}
+
+# Tabla -> (columna de fecha, columnas resumidas; cada una es una serie)
+SERIES = {
+    'hrv': ('fecha', ('hrv',)),
+    'rpe': ('fecha', ('rpe',)),
+    'autoseguimiento': ('fecha_registro', ('calidad_sueno', 'horas_sueno', 'fatiga', 'dolor_muscular', 'estres',
+                                           'estado_animo')),
+}
+
+DDL_RESUMENES = [f"""
+    CREATE TABLE IF NOT EXISTS resumen_{agregado} (
+        id_atleta INTEGER NOT NULL REFERENCES atletas (id_atleta),
+        serie TEXT NOT NULL,
+        inicio DATE NOT NULL,
+        n INTEGER NOT NULL,
+        media DOUBLE PRECISION NOT NULL,
+        minimo DOUBLE PRECISION NOT NULL,
+        maximo DOUBLE PRECISION NOT NULL,
+        PRIMARY KEY (id_atleta, serie, inicio)
+    );
+""" for agregado in AGREGADOS]
+
+
+def _valores(tabla):
+    """FROM de los (atleta, periodo, serie, valor) no nulos de `tabla`; `t` es la tabla."""
+    _, columnas = SERIES[tabla]
+    pares = ', '.join(f"('{c}', t.{c}::float8)" for c in columnas)
+    return f"{tabla} t CROSS JOIN LATERAL (VALUES {pares}) v(serie, valor)"
+
+
+def _sql_registrar(tabla, agregado):
+    # Upsert de los periodos con valores y borrado de los que se quedaron sin
+    # ninguno (filas borradas o puestas a NULL)
+    columna, columnas = SERIES[tabla]
+    unidad = AGREGADOS[agregado]
+    return f"""
+        WITH periodos AS (
+            SELECT DISTINCT date_trunc('{unidad}', d)::date AS inicio FROM unnest(%(fechas)s::date[]) d
+        ), calculados AS (
+            INSERT INTO resumen_{agregado} (id_atleta, serie, inicio, n, media, minimo, maximo)
+            SELECT %(id_atleta)s, v.serie, p.inicio, count(*), avg(v.valor), min(v.valor), max(v.valor)
+            FROM periodos p
+            JOIN {_valores(tabla)}
+              ON t.id_atleta = %(id_atleta)s
+             AND t.{columna} >= p.inicio AND t.{columna} < p.inicio + interval '1 {unidad}'
+            WHERE v.valor IS NOT NULL
+            GROUP BY v.serie, p.inicio
+            ON CONFLICT (id_atleta, serie, inicio) DO UPDATE SET
+              n = EXCLUDED.n, media = EXCLUDED.media, minimo = EXCLUDED.minimo, maximo = EXCLUDED.maximo
+            RETURNING serie, inicio
+        )
+        DELETE FROM resumen_{agregado} r USING periodos p
+        WHERE r.id_atleta = %(id_atleta)s AND r.inicio = p.inicio
+          AND r.serie IN ({', '.join(f"'{c}'" for c in columnas)})
+          AND NOT EXISTS (SELECT 1 FROM calculados c WHERE c.serie = r.serie AND c.inicio = r.inicio)
+    """
+
+
+def _sql_recalcular(tabla, agregado):
+    columna, _ = SERIES[tabla]
+    unidad = AGREGADOS[agregado]
+    return f"""
+        INSERT INTO resumen_{agregado} (id_atleta, serie, inicio, n, media, minimo, maximo)
+        SELECT t.id_atleta, v.serie, date_trunc('{unidad}', t.{columna})::date,
+               count(*), avg(v.valor), min(v.valor), max(v.valor)
+        FROM {_valores(tabla)}
+        WHERE v.valor IS NOT NULL AND (%(atletas)s::int[] IS NULL OR t.id_atleta = ANY(%(atletas)s::int[]))
+        GROUP BY 1, 2, 3
+    """
+
+
+SQL_REGISTRAR = {(tabla, agregado): _sql_registrar(tabla, agregado) for tabla in SERIES for agregado in AGREGADOS}
+SQL_RECALCULAR = {(tabla, agregado): _sql_recalcular(tabla, agregado) for tabla in SERIES for agregado in AGREGADOS}
+
+
+def _dias(fechas):
+    return sorted({f.date() if isinstance(f, datetime) else f for f in fechas})
+
+
+# ——— Mantenimiento ———
+def registrar(cur, tabla, id_atleta, fechas):
+    """Recalcula los periodos de `fechas` del atleta en `tabla` (misma transacción)."""
+    dias = _dias(fechas)
+    if not dias:
+        return
+    for agregado in AGREGADOS:
+        cur.execute(SQL_REGISTRAR[tabla, agregado], {"id_atleta": id_atleta, "fechas": dias})
+
+
+def registrar_filas(cur, tabla, filas):
+    """Para las cargas masivas: `filas` son (id_atleta, fecha); fecha None es hoy."""
+    por_atleta = {}
+    for id_atleta, fecha in filas:
+        por_atleta.setdefault(id_atleta, set()).add(fecha or date.today())
+    for id_atleta in sorted(por_atleta):
+        registrar(cur, tabla, id_atleta, por_atleta[id_atleta])
+
+
+def recalcular(cur, tabla, atletas=None):
+    """Reconstruye los resúmenes de `tabla` de `atletas` (todos si es None)."""
+    _, columnas = SERIES[tabla]
+    atletas = sorted(atletas) if atletas is not None else None
+    for agregado in AGREGADOS:
+        cur.execute(f"""
+            DELETE FROM resumen_{agregado}
+            WHERE serie = ANY(%(series)s) AND (%(atletas)s::int[] IS NULL OR id_atleta = ANY(%(atletas)s::int[]))
+        """, {"series": list(columnas), "atletas": atletas})
+        cur.execute(SQL_RECALCULAR[tabla, agregado], {"atletas": atletas})
+
+
+def recalcular_pendientes(cur):
+    """Crea los resúmenes de los atletas que tienen filas pero ningún resumen de esa tabla."""
+    for tabla, (_, columnas) in SERIES.items():
+        cur.execute(f"""
+            SELECT DISTINCT id_atleta FROM {tabla} t
+            WHERE NOT EXISTS (SELECT 1 FROM resumen_mes r WHERE r.id_atleta = t.id_atleta AND r.serie = %s)
+              AND EXISTS (SELECT 1 FROM atletas a WHERE a.id_atleta = t.id_atleta)
+        """, (columnas[0],))
+        atletas = [fila[0] for fila in cur.fetchall()]
+        if atletas:
+            recalcular(cur, tabla, atletas)
+
+
+# ——— Lectura ———
+COLUMNAS_RESUMEN = ['inicio', 'n', 'media', 'minimo', 'maximo']
+
+
+def sql_pagina(agregado, orden):
+    """Periodos de una serie con los filtros de historial.leer_parametros; el cursor es el inicio del periodo."""
+    comparador = '>' if orden == 'asc' else '<'
+    direccion = 'ASC' if orden == 'asc' else 'DESC'
+    return f"""
+        SELECT inicio, n, media, minimo, maximo FROM resumen_{agregado}
+        WHERE id_atleta = %(id_atleta)s AND serie = %(serie)s
+          AND (%(desde)s::date IS NULL OR inicio >= date_trunc('{AGREGADOS[agregado]}', %(desde)s::date)::date)
+          AND (%(hasta)s::date IS NULL OR inicio <= %(hasta)s)
+          AND (%(c_fecha)s::date IS NULL OR inicio {comparador} %(c_fecha)s)
+        ORDER BY inicio {direccion}
+        LIMIT %(limite)s
+    """
+
+
+def _siguiente(filas, params):
+    if params["limite"] is not None and len(filas) == params["limite"]:
+        return historial.codificar_cursor(filas[-1][0], 0)
+    return None
+
+
+def fila_resumen(r):
+    return {"inicio": r[0].isoformat(), "n": r[1], "media": r[2], "minimo": r[3], "maximo": r[4]}
+
+
+def pagina(cur, serie, id_atleta, params):
+    """(filas, cursor_siguiente) de `serie` con params["agregado"]; sin `limite`, todas.
+    Las filas son las COLUMNAS_RESUMEN (ver `fila_resumen`)."""
+    cur.execute(sql_pagina(params["agregado"], params["orden"]), dict(params, id_atleta=id_atleta, serie=serie))
+    filas = cur.fetchall()
+    return filas, _siguiente(filas, params)
+
+
+# ——— Variante async (cursor de psycopg 3, usada por asgi.py) ———
+async def registrar_async(cur, tabla, id_atleta, fechas):
+    dias = _dias(fechas)
+    if not dias:
+        return
+    for agregado in AGREGADOS:
+        await cur.execute(SQL_REGISTRAR[tabla, agregado], {"id_atleta": id_atleta, "fechas": dias})
+
+
+async def pagina_async(cur, serie, id_atleta, params):
+    await cur.execute(sql_pagina(params["agregado"], params["orden"]), dict(params, id_atleta=id_atleta, serie=serie))
+    filas = await cur.fetchall()
+    return filas, _siguiente(filas, params)
@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+from datetime import date
+
+from flask import Response
+from flask.json.provider import DefaultJSONProvider
+
+# ——— Motor de JSON ———
+# Todas las respuestas JSON pasan por aquí: jsonify (el proveedor de la app),
+# RespuestaJSON de asgi.py y los históricos en streaming. JSON_MOTOR=orjson
+# (por defecto) serializa en C con el mismo resultado que el proveedor de
+# Flask: claves ordenadas, fechas en formato HTTP y Decimal/UUID como texto.
+# Si el paquete no está instalado, o con JSON_MOTOR=stdlib, se usa el módulo
+# json de siempre. Diferencias de orjson: NaN e infinito salen como null (el
+# módulo json escribía NaN, que no es JSON válido) y no admite enteros de más
+# de 64 bits.
+MOTORES = ('orjson', 'stdlib')
+JSON_MOTOR = os.getenv('JSON_MOTOR', 'orjson')
+if JSON_MOTOR not in MOTORES:
+    raise RuntimeError(f"JSON_MOTOR debe ser uno de {', '.join(MOTORES)}")
+
+# `?format=columns` en los listados: {"columnas": [...], "filas": [[...], ...]}.
+# Las tuplas del cursor se serializan tal cual, sin un dict por fila, y las
+# fechas van en ISO 8601 como en las filas de los históricos.
+FORMATOS = ('records', 'columns')
+
+
+def _cargar_orjson():
+    if JSON_MOTOR != 'orjson':
+        return None
+    try:
+        import orjson
+    except ImportError:
+        logging.warning("JSON_MOTOR=orjson pero el paquete orjson no está instalado; se usa el módulo json")
+        return None
+    return orjson
+
+
+_orjson = _cargar_orjson()
+if _orjson is not None:
+    # las fechas pasan a `default` para conservar el formato HTTP de Flask
+    _OPCIONES = (_orjson.OPT_SORT_KEYS | _orjson.OPT_NON_STR_KEYS | _orjson.OPT_SERIALIZE_NUMPY
+                 | _orjson.OPT_PASSTHROUGH_DATETIME)
+    _OPCIONES_ISO = _orjson.OPT_NON_STR_KEYS | _orjson.OPT_SERIALIZE_NUMPY
+
+
+def motor():
+    """Motor en uso: 'orjson' o 'stdlib' (si orjson no se pudo importar)."""
+    return 'orjson' if _orjson is not None else 'stdlib'
+
+
+def _iso(o):
+    if isinstance(o, date):
+        return o.isoformat()
+    return DefaultJSONProvider.default(o)
+
+
+def dumps(obj, indent=None):
+    """bytes con el mismo JSON que el proveedor por defecto de Flask (compacto salvo con `indent`)."""
+    if _orjson is not None:
+        opciones = _OPCIONES | (_orjson.OPT_INDENT_2 if indent else 0)
+        return _orjson.dumps(obj, default=DefaultJSONProvider.default, option=opciones)
+    separadores = None if indent else (',', ':')
+    return json.dumps(obj, default=DefaultJSONProvider.default, sort_keys=True, indent=indent,
+                      separators=separadores).encode('utf-8')
+
+
+def dumps_iso(obj):
+    """bytes compactos con las fechas en ISO 8601 y las claves en su orden (formato columns y streaming)."""
+    if _orjson is not None:
+        return _orjson.dumps(obj, default=_iso, option=_OPCIONES_ISO)
+    return json.dumps(obj, default=_iso, separators=(',', ':')).encode('utf-8')
+
+
+def loads(datos):
+    if _orjson is not None:
+        return _orjson.loads(datos)
+    return json.loads(datos)
+
+
+class ProveedorJSON(DefaultJSONProvider):
+    """Proveedor JSON de la app Flask con el motor de JSON_MOTOR.
+
+    `dumps` sólo atiende `indent`: la salida es siempre compacta y con las
+    claves ordenadas, como la de jsonify.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj, kwargs.get('indent')).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = 2 if (self.compact is None and self._app.debug) or self.compact is False else None
+        return self._app.response_class(dumps(obj, indent) + b"\n", mimetype=self.mimetype)
+
+
+def instalar(app):
+    app.json = ProveedorJSON(app)
+    logging.info("Serialización JSON con %s", motor())
+
+
+# ——— Formato columns ———
+def leer_formato(args):
+    """'records' (por defecto) o 'columns'. Lanza ValueError con otro valor."""
+    formato = args.get('format') or 'records'
+    if formato not in FORMATOS:
+        raise ValueError(f"format debe ser uno de {', '.join(FORMATOS)}")
+    return formato
+
+
+def cuerpo_columnas(nombres, filas, **extra):
+    """bytes de {"columnas": nombres, "filas": filas, **extra}; `filas` pueden ser las tuplas del cursor."""
+    return dumps_iso({"columnas": nombres, "filas": filas, **extra}) + b"\n"
+
+
+def respuesta_columnas(nombres, filas, **extra):
+    return Response(cuerpo_columnas(nombres, filas, **extra), mimetype='application/json')
+
+
+def respuesta_iso(obj):
+    """Respuesta Flask con `obj` serializado por `dumps_iso` (p. ej. un resultado con partes en columnas)."""
+    return Response(dumps_iso(obj) + b"\n", mimetype='application/json')
+
+
+def prefijo_columnas(nombres):
+    """Comienzo de un objeto columns transmitido por trozos; se cierra con ']}'."""
+    return b'{"columnas":' + dumps_iso(nombres) + b',"filas":['
+
+
+def en_columnas(registros, nombres):
+    """Lista de dicts (p. ej. el pronóstico de /predict) en forma de columnas."""
+    return {"columnas": nombres, "filas": [[r[n] for n in nombres] for r in registros]}
+
+
+def trozo(filas):
+    """Elementos de `filas` serializados y separados por comas, sin los corchetes."""
+    return dumps_iso(filas)[1:-1]
@@ -1,2 +1,10 @@
 #!/bin/bash
+set -e
+# Migraciones una sola vez por despliegue, antes de levantar los workers
+python migrations.py
+# SERVIDOR=asgi: uvicorn con las rutas de más tráfico en async (asgi.py) y el
+# resto de la app Flask montada debajo. Por defecto, gunicorn con hilos.
+if [ "${SERVIDOR:-wsgi}" = "asgi" ]; then
+  exec uvicorn asgi:app --host 0.0.0.0 --port $PORT --timeout-keep-alive ${ASGI_KEEPALIVE:-75} --no-access-log
+fi
 exec gunicorn --bind 0.0.0.0:$PORT --workers 1 --threads 8 --timeout 120 app:app
@@ -0,0 +1,94 @@
+import os
+from itertools import product
+
+import numpy as np
+
+# ——— Motores de tendencia ———
+# Pronóstico de la carga diaria a HORIZONTE días. 'prophet' (prediccion.py) es
+# el más preciso y cuesta segundos; 'holt' y 'lineal' usan sólo NumPy y ajustan
+# en milisegundos. Se elige por petición (`motor`) o con TENDENCIA_MOTOR.
+MOTORES = ('holt', 'lineal', 'prophet')
+TENDENCIA_MOTOR = os.getenv('TENDENCIA_MOTOR', 'holt')
+if TENDENCIA_MOTOR not in MOTORES:
+    raise RuntimeError(f"TENDENCIA_MOTOR debe ser uno de {', '.join(MOTORES)}")
+
+HORIZONTE = 7
+PERIODO = 7  # estacionalidad semanal
+TENDENCIA_VENTANA_HOLT = int(os.getenv('TENDENCIA_VENTANA_HOLT', '365'))  # días más recientes que se ajustan
+TENDENCIA_VENTANA_LINEAL = int(os.getenv('TENDENCIA_VENTANA_LINEAL', '84'))
+
+# Rejilla de Holt-Winters: alfa (nivel), beta (tendencia), gamma (estación) y
+# phi (amortiguación de la tendencia, para que 7 días no la disparen)
+_REJILLA = np.array(list(product(
+    (0.05, 0.1, 0.2, 0.3, 0.5),
+    (0.01, 0.05, 0.15),
+    (0.05, 0.15, 0.3),
+    (0.8, 0.9, 0.98),
+))).T
+
+
+def serie_diaria(fechas, valores):
+    """Rejilla diaria continua desde la primera fecha: los días sin fila son carga 0,
+    como en carga_diaria. Devuelve (días datetime64[D], valores float)."""
+    dias = np.asarray(fechas, dtype='datetime64[D]')
+    orden = np.argsort(dias, kind='stable')
+    dias, valores = dias[orden], np.asarray(valores, dtype=float)[orden]
+    posicion = (dias - dias[0]).astype(int)
+    serie = np.zeros(posicion[-1] + 1)
+    np.add.at(serie, posicion, np.nan_to_num(valores))
+    return dias[0] + np.arange(len(serie)), serie
+
+
+def _futuro(ultimo, horizonte):
+    return ultimo + np.arange(1, horizonte + 1)
+
+
+def holt_winters(dias, y, horizonte=HORIZONTE):
+    """Holt-Winters aditivo con tendencia amortiguada y estación semanal.
+
+    Los parámetros se eligen por mínimo error cuadrático a un paso sobre
+    `_REJILLA`: todas las combinaciones avanzan a la vez como vectores, así que
+    el coste es un bucle de len(y) pasos de NumPy, no uno por combinación.
+    """
+    y = y[-TENDENCIA_VENTANA_HOLT:]
+    dias = dias[-len(y):]
+    if len(y) < 2 * PERIODO:
+        return _futuro(dias[-1], horizonte), np.full(horizonte, y.mean())
+
+    alfa, beta, gamma, phi = _REJILLA
+    inicial = y[:PERIODO].mean()
+    nivel = np.full(alfa.shape, inicial)
+    tendencia = np.full(alfa.shape, (y[PERIODO:2 * PERIODO].mean() - inicial) / PERIODO)
+    estacion = np.tile(y[:PERIODO] - inicial, (len(alfa), 1))
+    error = np.zeros(alfa.shape)
+    for t in range(len(y)):
+        s = estacion[:, t % PERIODO]
+        previsto = nivel + phi * tendencia + s
+        if t >= PERIODO:
+            error += (y[t] - previsto) ** 2
+        nuevo = alfa * (y[t] - s) + (1 - alfa) * (nivel + phi * tendencia)
+        tendencia = beta * (nuevo - nivel) + (1 - beta) * phi * tendencia
+        estacion[:, t % PERIODO] = gamma * (y[t] - nuevo) + (1 - gamma) * s
+        nivel = nuevo
+
+    k = int(np.argmin(error))
+    pasos = np.arange(1, horizonte + 1)
+    amortiguada = np.cumsum(phi[k] ** pasos)
+    yhat = nivel[k] + amortiguada * tendencia[k] + estacion[k, (len(y) + pasos - 1) % PERIODO]
+    return _futuro(dias[-1], horizonte), np.clip(yhat, 0, None)
+
+
+def lineal_semanal(dias, y, horizonte=HORIZONTE):
+    """Recta más efecto del día de la semana por mínimos cuadrados sobre las últimas semanas."""
+    y = y[-TENDENCIA_VENTANA_LINEAL:]
+    dias = dias[-len(y):]
+    futuro = _futuro(dias[-1], horizonte)
+    todos = np.concatenate([dias, futuro])
+    t = (todos - dias[0]).astype(float)
+    dia_semana = (todos.astype(int) + 3) % 7  # 1970-01-01 fue jueves: 0 = lunes
+    X = np.column_stack([np.ones(len(todos)), t] + [dia_semana == d for d in range(1, 7)]).astype(float)
+    coeficientes = np.linalg.lstsq(X[:len(y)], y, rcond=None)[0]
+    return futuro, np.clip(X[len(y):] @ coeficientes, 0, None)
+
+
+AJUSTES = {'holt': holt_winters, 'lineal': lineal_semanal}